@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""
+Headless interaction benchmark for the Val Gardena app.
+Drives val_gardena_app with Streamlit's AppTest against a fixed GTFS snapshot
+(no network: the background refresh is switched off) through scripted
+sessions that switch villages, pick stations and destinations, change the
+date and time, plan trips with changes, show the reachability heatmap and
+rerun the Parking now tab. Reports cold-start time, per-interaction latency percentiles,
+per-stage timings (stage_timing) and peak memory.
+
+Usage:
+    python benchmark_app.py [--data-dir DIR | --feed GTFS.zip] [--sessions N] [--interactions N]
+                            [--seed N] [--json OUT.json] [--max-p95-ms MS] [--max-cold-s S]
+
+--feed builds a snapshot from a local GTFS zip into a temporary directory
+first. Exits with status 1 when a --max-* threshold is exceeded, so it can
+guard performance in CI.
+"""
+
+import argparse
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+import numpy as np
+
+APP_FILE = Path(__file__).parent / "val_gardena_app.py"
+PERCENTILES = [50, 90, 95, 99]
+
+# Relative weights of the scripted interactions
+ACTIONS = {
+    "village": 2,
+    "station": 3,
+    "destination": 4,
+    "date": 1,
+    "time": 2,
+    "show_all": 1,
+    "plan_trip": 2,
+    "reachability": 2,
+    "parking": 1,
+}
+
+
+def build_snapshot(feed_path, data_dir):
+    """Parse a local GTFS zip into a snapshot in `data_dir` (download_transport, no network)."""
+    env = dict(os.environ, VG_TRANSPORT_DIR=str(data_dir))
+    subprocess.run([sys.executable, str(Path(__file__).parent / "download_transport.py"), str(feed_path)],
+                   env=env, check=True, stdout=subprocess.DEVNULL)
+
+
+def service_dates(manifest):
+    """Dates to pick from: two weeks from today, moved into the snapshot's service range."""
+    start = end = None
+    if manifest and manifest.get("service_start"):
+        start = datetime.strptime(str(manifest["service_start"]), "%Y%m%d").date()
+        end = datetime.strptime(str(manifest["service_end"]), "%Y%m%d").date()
+    first = date.today()
+    if start is not None and not start <= first <= end:
+        first = start
+    days = [first + timedelta(days=d) for d in range(14)]
+    return [d for d in days if end is None or d <= end] or [first]
+
+
+def widget(elements, label):
+    """First widget with `label`, or None."""
+    return next((e for e in elements if e.label == label), None)
+
+
+def required_widget(elements, label):
+    """First widget with `label`; raises RuntimeError naming it if the app no longer shows it."""
+    found = widget(elements, label)
+    if found is None:
+        raise RuntimeError(f"No widget labelled {label!r} on the page; update benchmark_app for the app's layout")
+    return found
+
+
+def interact(at, action, rnd, dates):
+    """Apply one scripted `action` to the app; returns the widget to run, or None if not applicable.
+
+    AppTest renders every tab on each run, so "parking" is a plain rerun of
+    the app (the Parking now tab polls for new readings).
+    """
+    if action == "village":
+        radio = required_widget(at.radio, "From")
+        return radio.set_value(rnd.choice(radio.options))
+    if action == "station":
+        box = widget(at.selectbox, "Station")
+        return box.set_value(rnd.choice(box.options)) if box is not None else None
+    if action == "destination":
+        box = required_widget(at.selectbox, "To")
+        # Half of the lookups are the unfiltered departure board
+        return box.set_value(box.options[0] if rnd.random() < 0.5 else rnd.choice(box.options))
+    if action == "date":
+        return required_widget(at.date_input, "Date").set_value(rnd.choice(dates))
+    if action == "time":
+        return required_widget(at.time_input, "Departures after").set_value(
+            datetime.strptime(f"{rnd.randrange(5, 23)}:{rnd.choice([0, 15, 30, 45])}", "%H:%M").time()
+        )
+    if action == "show_all":
+        box = required_widget(at.checkbox, "Show all stops")
+        return box.set_value(not box.value)
+    if action == "plan_trip":
+        # Only enabled once a destination is picked
+        toggle = required_widget(at.toggle, "Plan a trip (with changes)")
+        return toggle.set_value(not toggle.value) if not toggle.disabled else None
+    if action == "reachability":
+        box = required_widget(at.selectbox, "Reachable from")
+        if box.value != "Off" and rnd.random() < 0.5:
+            slider = required_widget(at.select_slider, "Within (min)")
+            return slider.set_value(int(rnd.choice(slider.options)))
+        return box.set_value(rnd.choice(box.options))
+    if action == "parking":
+        return at
+    raise ValueError(action)
+
+
+def run_sessions(n_sessions, n_interactions, seed, dates, timeout):
+    """Run the scripted sessions; returns (cold start seconds, [(action, seconds)])."""
+    from streamlit.testing.v1 import AppTest
+
+    cold = None
+    samples = []
+    for session in range(n_sessions):
+        rnd = random.Random(seed + session)
+        at = AppTest.from_file(str(APP_FILE), default_timeout=timeout)
+        t0 = time.perf_counter()
+        at.run()
+        elapsed = time.perf_counter() - t0
+        if at.exception:
+            raise RuntimeError(f"App raised on start: {at.exception}")
+        if cold is None:
+            cold = elapsed
+        else:
+            samples.append(("session start", elapsed))
+
+        actions, weights = list(ACTIONS), list(ACTIONS.values())
+        for _ in range(n_interactions):
+            action = rnd.choices(actions, weights)[0]
+            target = interact(at, action, rnd, dates)
+            if target is None:
+                continue
+            t0 = time.perf_counter()
+            target.run()
+            samples.append((action, time.perf_counter() - t0))
+            if at.exception:
+                raise RuntimeError(f"App raised after {action}: {at.exception}")
+    return cold, samples
+
+
+def percentiles_ms(values):
+    values = np.asarray(values) * 1000
+    return {f"p{p}": round(float(np.percentile(values, p)), 1) for p in PERCENTILES} | {
+        "max": round(float(values.max()), 1), "n": len(values)}
+
+
+def stage_summary(log_path):
+    """p50/p95 per app stage over all logged reruns (the cold start excluded)."""
+    stages = {}
+    with open(log_path, encoding="utf-8") as f:
+        runs = [json.loads(line) for line in f][1:]
+    for run in runs:
+        for stage, ms in list(run["stages_ms"].items()) + [("total", run["total_ms"])]:
+            stages.setdefault(stage, []).append(ms / 1000)
+    return {stage: percentiles_ms(values) for stage, values in stages.items()}
+
+
+def print_row(name, stats):
+    """One line of the latency table: n, percentiles and max in ms."""
+    print(f"{name:20}{stats['n']:>6}" + "".join(f"{stats['p' + str(p)]:>9.1f}" for p in PERCENTILES)
+          + f"{stats['max']:>9.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless interaction benchmark for val_gardena_app")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--data-dir", help="transport data directory with a snapshot (default: data/transport)")
+    source.add_argument("--feed", help="local GTFS zip to build a temporary snapshot from")
+    parser.add_argument("--sessions", type=int, default=5)
+    parser.add_argument("--interactions", type=int, default=40, help="interactions per session")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--timeout", type=float, default=120, help="seconds allowed per app run")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--max-p95-ms", type=float, help="fail if the interaction p95 is above this")
+    parser.add_argument("--max-cold-s", type=float, help="fail if the cold start is above this")
+    args = parser.parse_args()
+
+    workdir = tempfile.TemporaryDirectory(prefix="vg-bench-")
+    if args.feed:
+        data_dir = Path(workdir.name) / "transport"
+        print(f"Building snapshot from {args.feed}...")
+        build_snapshot(args.feed, data_dir)
+        os.environ["VG_TRANSPORT_DIR"] = str(data_dir)
+    elif args.data_dir:
+        os.environ["VG_TRANSPORT_DIR"] = str(Path(args.data_dir).resolve())
+    log_path = Path(workdir.name) / "timing.jsonl"
+    os.environ["VG_GTFS_REFRESH"] = "0"
+    os.environ["VG_TIMING_LOG"] = str(log_path)
+
+    # Imported after the environment is set, so the app sees the same data directory
+    from transport_snapshot import DATA_DIR, read_manifest, snapshot_version
+    version = snapshot_version()
+    if version == "csv":
+        print(f"No snapshot in {DATA_DIR}; run download_transport.py or pass --feed")
+        sys.exit(2)
+    dates = service_dates(read_manifest())
+
+    print(f"Benchmarking snapshot {version} ({DATA_DIR}): "
+          f"{args.sessions} sessions x {args.interactions} interactions")
+    cold, samples = run_sessions(args.sessions, args.interactions, args.seed, dates, args.timeout)
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    interactions = [s for action, s in samples if action != "session start"]
+    results = {
+        "snapshot": version,
+        "sessions": args.sessions,
+        "cold_start_s": round(cold, 3),
+        "interactions_ms": percentiles_ms(interactions),
+        "by_action_ms": {
+            action: percentiles_ms([s for a, s in samples if a == action])
+            for action in dict.fromkeys(a for a, _ in samples)
+        },
+        "stages_ms": stage_summary(log_path),
+        "peak_rss_mb": round(peak_mb, 1),
+    }
+
+    print(f"\nCold start: {results['cold_start_s']:.2f}s   Peak RSS: {results['peak_rss_mb']:.0f} MB")
+    print(f"\n{'latency (ms)':20}{'n':>6}" + "".join(f"{'p' + str(p):>9}" for p in PERCENTILES) + f"{'max':>9}")
+    print_row("all interactions", results["interactions_ms"])
+    for action, stats in results["by_action_ms"].items():
+        print_row(f"  {action}", stats)
+    print("app stages")
+    for stage, stats in results["stages_ms"].items():
+        print_row(f"  {stage}", stats)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nSaved results to {args.json}")
+
+    failed = []
+    if args.max_p95_ms is not None and results["interactions_ms"]["p95"] > args.max_p95_ms:
+        failed.append(f"interaction p95 {results['interactions_ms']['p95']:.1f} ms > {args.max_p95_ms} ms")
+    if args.max_cold_s is not None and cold > args.max_cold_s:
+        failed.append(f"cold start {cold:.2f}s > {args.max_cold_s}s")
+    for message in failed:
+        print(f"FAIL: {message}")
+    workdir.cleanup()
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the schedule queries in query_transport_schedules.
+Times find_connections on the Corvara -> Badia example (and any other pair
+given) against the previous per-trip loop, which filtered the frames once
+per common trip and ignored stop_sequence. Reports load and index build
+time, per-query latency percentiles and how many connections each version
+returns (the loop also counts reverse-direction trips).
+
+Usage:
+    python benchmark_queries.py [--from Corvara] [--to Badia] [--after 08:00:00] [--date YYYY-MM-DD]
+                                [--repeat N] [--version VERSION] [--json OUT.json]
+"""
+
+import argparse
+import json
+import time
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+
+from query_transport_schedules import TransportIndex
+from transport_snapshot import parse_gtfs_time
+
+PERCENTILES = [50, 95]
+
+
+def loop_find_connections(index, from_location, to_location, after_time="06:00:00"):
+    """The per-trip loop find_connections replaced, kept as the baseline."""
+    stops_df, stop_times_df = index.stops_df, index.stop_times_df
+    trips_df, routes_df = index.trips_df, index.routes_df
+    from_stops = stops_df[stops_df['location'].str.contains(from_location, case=False, na=False)]
+    to_stops = stops_df[stops_df['location'].str.contains(to_location, case=False, na=False)]
+    if from_stops.empty or to_stops.empty:
+        return None
+    from_stop_times = stop_times_df[
+        (stop_times_df['stop_id'].isin(from_stops['stop_id'])) &
+        (stop_times_df['departure_secs'] >= parse_gtfs_time(after_time))
+    ].copy()
+    to_stop_times = stop_times_df[stop_times_df['stop_id'].isin(to_stops['stop_id'])].copy()
+    common_trips = set(from_stop_times['trip_id']) & set(to_stop_times['trip_id'])
+
+    connections = []
+    for trip_id in common_trips:
+        departure = from_stop_times[from_stop_times['trip_id'] == trip_id].iloc[0]
+        arrival = to_stop_times[to_stop_times['trip_id'] == trip_id].iloc[0]
+        trip_info = trips_df[trips_df['trip_id'] == trip_id].iloc[0]
+        route_info = routes_df[routes_df['route_id'] == trip_info['route_id']].iloc[0]
+        connections.append({
+            'route': route_info['route_short_name'],
+            'route_name': route_info['route_long_name'],
+            'departure': departure['departure_time'],
+            'arrival': arrival['arrival_time'],
+            'departure_secs': departure['departure_secs'],
+            'trip_id': trip_id,
+        })
+    return pd.DataFrame(connections).sort_values('departure_secs', kind='stable')
+
+
+def time_query(fn, repeat):
+    """Run `fn` `repeat` times; returns (last result, percentiles in ms)."""
+    samples = []
+    result = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    stats = {f"p{p}": round(float(np.percentile(samples, p)), 2) for p in PERCENTILES}
+    return result, stats | {"n": repeat}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark query_transport_schedules.find_connections")
+    parser.add_argument("--from", dest="from_location", default="Corvara")
+    parser.add_argument("--to", dest="to_location", default="Badia")
+    parser.add_argument("--after", default="08:00:00", help="departures at or after (HH:MM:SS)")
+    parser.add_argument("--date", help="service date for the calendar-filtered query (default: today)")
+    parser.add_argument("--repeat", type=int, default=50, help="runs per query")
+    parser.add_argument("--version", help="snapshot version (default: current)")
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args()
+    target_date = datetime.strptime(args.date, "%Y-%m-%d").date() if args.date else date.today()
+
+    index = TransportIndex(version=args.version)
+    t0 = time.perf_counter()
+    index.tables
+    load_s = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    index.find_connections(args.from_location, args.to_location, args.after, target_date)
+    build_s = time.perf_counter() - t0
+
+    query = (args.from_location, args.to_location, args.after)
+    loop, loop_ms = time_query(lambda: loop_find_connections(index, *query), args.repeat)
+    joined, join_ms = time_query(lambda: index.find_connections(*query), args.repeat)
+    dated, dated_ms = time_query(lambda: index.find_connections(*query, target_date=target_date), args.repeat)
+
+    def count(df):
+        return 0 if df is None else len(df)
+
+    results = {
+        "query": f"{args.from_location} -> {args.to_location} after {args.after}",
+        "date": target_date.isoformat(),
+        "load_s": round(load_s, 3),
+        "first_query_s": round(build_s, 3),
+        "loop_ms": loop_ms | {"connections": count(loop)},
+        "join_ms": join_ms | {"connections": count(joined)},
+        "join_date_ms": dated_ms | {"connections": count(dated)},
+    }
+
+    print(f"\n{results['query']}   (load {load_s:.2f}s, first query with index build {build_s:.2f}s)")
+    print(f"{'':28}" + "".join(f"{'p' + str(p) + ' ms':>10}" for p in PERCENTILES) + f"{'trips':>8}")
+    for label, key in [("per-trip loop (before)", "loop_ms"), ("join", "join_ms"),
+                       (f"join, running {target_date:%d.%m.%Y}", "join_date_ms")]:
+        stats = results[key]
+        print(f"{label:28}" + "".join(f"{stats['p' + str(p)]:>10.2f}" for p in PERCENTILES)
+              + f"{stats['connections']:>8}")
+    if count(loop) != count(joined):
+        print(f"\nThe loop counts {count(loop) - count(joined)} trips that reach {args.to_location} "
+              f"before {args.from_location} (reverse direction).")
+    print(f"Speedup: {loop_ms['p50'] / max(join_ms['p50'], 1e-9):.1f}x (p50)")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nSaved results to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
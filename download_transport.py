@@ -7,15 +7,32 @@ Source: Open Data Hub GTFS API - STA (Südtirol Transportstrukturen AG)
 import requests
 import zipfile
 import io
-import csv
-from pathlib import Path
+import os
+import sys
 from datetime import datetime
 
+import pandas as pd
+
+from transport_snapshot import (CSV_FILES, DATA_DIR, WEEKDAYS, apply_schema, diff_summary, diff_tables,
+                                gtfs_time_to_seconds, load_snapshot, write_snapshot)
+
 GTFS_API = "https://gtfs.api.opendatahub.com/v1"
 DATASET_ID = "sta-time-tables"
 
-DATA_DIR = Path(__file__).parent / "data" / "transport"
 MIN_LATITUDE = 46.49  # Filter to Dolomites region (include Bolzano)
+STOP_TIMES_CHUNKSIZE = 500_000  # Rows per chunk when scanning the statewide stop_times.txt
+
+# Columns written to each output CSV
+OUTPUT_COLUMNS = {
+    "stops": ["stop_id", "stop_name", "stop_lat", "stop_lon", "location", "region"],
+    "routes": ["route_id", "route_short_name", "route_long_name", "route_type", "agency_name"],
+    "trips": ["trip_id", "route_id", "service_id", "trip_headsign", "direction_id", "shape_id"],
+    "stop_times": ["trip_id", "arrival_time", "departure_time", "stop_id", "stop_sequence", "pickup_type",
+                   "drop_off_type", "arrival_secs", "departure_secs"],
+    "calendar": ["service_id", "monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday",
+                 "start_date", "end_date"],
+    "calendar_dates": ["service_id", "date", "exception_type"],
+}
 
 # GTFS route types
 ROUTE_TYPES = {
@@ -100,39 +117,82 @@ def extract_region(location):
     return REGION_MAP.get(location, "South Tyrol")
 
 
+def _complete_columns(df, columns):
+    """Add columns missing from the file with their default and fix column order."""
+    for col, (dtype, default) in columns.items():
+        if col not in df.columns:
+            df[col] = pd.Series(default, index=df.index, dtype=dtype)
+    return df[list(columns)]
+
+
+def _read_csv_options(columns):
+    """pandas.read_csv options shared by all GTFS tables."""
+    return {
+        "encoding": "utf-8-sig",  # Use utf-8-sig to handle BOM
+        "usecols": lambda c: c in columns,
+        "dtype": {col: dtype for col, (dtype, _default) in columns.items()},
+        # Keep empty cells as empty strings, like csv.DictReader
+        "keep_default_na": False,
+        "na_values": [],
+    }
+
+
+def read_gtfs_table(gtfs_zip, name, columns):
+    """Read a GTFS table from the zip with only the given columns and explicit dtypes.
+
+    `columns` maps column name -> (dtype, default). Columns missing from the
+    file are added with their default so downstream code sees a fixed schema.
+    """
+    with gtfs_zip.open(name) as f:
+        df = pd.read_csv(f, **_read_csv_options(columns))
+    return _complete_columns(df, columns)
+
+
+def iter_gtfs_table(gtfs_zip, name, columns, chunksize):
+    """Like read_gtfs_table, but yield the table in chunks of `chunksize` rows."""
+    with gtfs_zip.open(name) as f:
+        for chunk in pd.read_csv(f, chunksize=chunksize, **_read_csv_options(columns)):
+            yield _complete_columns(chunk, columns)
+
+
+def _parse_float(values):
+    """Parse numeric strings exactly like float(); empty or invalid cells become NaN."""
+    valid = pd.to_numeric(values, errors="coerce").notna()
+    parsed = pd.Series(float("nan"), index=values.index)
+    parsed[valid] = values[valid].astype(float)
+    return parsed
+
+
+def _as_category(df, columns):
+    """Convert id columns to categoricals (sorted categories, so sorting stays lexical)."""
+    for col in columns:
+        df[col] = df[col].astype("category")
+    return df
+
+
 def parse_stops(gtfs_zip):
     """Parse stops.txt and filter to Dolomites region."""
     print("Parsing stops...")
 
-    with gtfs_zip.open("stops.txt") as f:
-        # Use utf-8-sig to handle BOM
-        reader = csv.DictReader(io.TextIOWrapper(f, encoding="utf-8-sig"))
-        stops = {}
-
-        for row in reader:
-            try:
-                lat = float(row.get("stop_lat", 0))
-                lon = float(row.get("stop_lon", 0))
-            except (ValueError, TypeError):
-                continue
-
-            # Filter by latitude
-            if lat < MIN_LATITUDE:
-                continue
-
-            stop_id = row.get("stop_id", "")
-            stop_name = row.get("stop_name", "Unknown")
-            location = extract_location(stop_name)
-            region = extract_region(location)
-
-            stops[stop_id] = {
-                "stop_id": stop_id,
-                "stop_name": stop_name,
-                "stop_lat": lat,
-                "stop_lon": lon,
-                "location": location,
-                "region": region,
-            }
+    stops = read_gtfs_table(gtfs_zip, "stops.txt", {
+        "stop_id": (str, ""),
+        "stop_name": (str, "Unknown"),
+        "stop_lat": (str, ""),
+        "stop_lon": (str, ""),
+    })
+    stops["stop_lat"] = _parse_float(stops["stop_lat"])
+    stops["stop_lon"] = _parse_float(stops["stop_lon"])
+
+    # Drop unparseable coordinates, then filter by latitude
+    stops = stops[stops["stop_lat"].notna() & stops["stop_lon"].notna()]
+    stops = stops[stops["stop_lat"] >= MIN_LATITUDE]
+    stops = stops.drop_duplicates("stop_id", keep="last").reset_index(drop=True)
+
+    # Classify each distinct name once instead of every row
+    location_of = {name: extract_location(name) for name in stops["stop_name"].unique()}
+    stops["location"] = stops["stop_name"].map(location_of)
+    stops["region"] = stops["location"].map(extract_region)
+    stops = _as_category(stops, ["stop_id", "location", "region"])
 
     print(f"Found {len(stops)} stops in Dolomites region")
     return stops
@@ -142,21 +202,17 @@ def parse_routes(gtfs_zip):
     """Parse routes.txt."""
     print("Parsing routes...")
 
-    with gtfs_zip.open("routes.txt") as f:
-        reader = csv.DictReader(io.TextIOWrapper(f, encoding="utf-8-sig"))
-        routes = {}
-
-        for row in reader:
-            route_id = row.get("route_id", "")
-            route_type = int(row.get("route_type", 3))
-
-            routes[route_id] = {
-                "route_id": route_id,
-                "route_short_name": row.get("route_short_name", ""),
-                "route_long_name": row.get("route_long_name", ""),
-                "route_type": ROUTE_TYPES.get(route_type, "Unknown"),
-                "agency_id": row.get("agency_id", ""),
-            }
+    routes = read_gtfs_table(gtfs_zip, "routes.txt", {
+        "route_id": (str, ""),
+        "route_short_name": (str, ""),
+        "route_long_name": (str, ""),
+        "route_type": (str, "3"),
+        "agency_id": (str, ""),
+    })
+    route_type = pd.to_numeric(routes["route_type"], errors="coerce").fillna(3).astype(int)
+    routes["route_type"] = route_type.map(ROUTE_TYPES).fillna("Unknown")
+    routes = routes.drop_duplicates("route_id", keep="last").reset_index(drop=True)
+    routes = _as_category(routes, ["route_id", "route_type", "agency_id"])
 
     print(f"Found {len(routes)} routes")
     return routes
@@ -166,13 +222,11 @@ def parse_agencies(gtfs_zip):
     """Parse agency.txt."""
     print("Parsing agencies...")
 
-    with gtfs_zip.open("agency.txt") as f:
-        reader = csv.DictReader(io.TextIOWrapper(f, encoding="utf-8-sig"))
-        agencies = {}
-
-        for row in reader:
-            agency_id = row.get("agency_id", "")
-            agencies[agency_id] = row.get("agency_name", "Unknown")
+    agency = read_gtfs_table(gtfs_zip, "agency.txt", {
+        "agency_id": (str, ""),
+        "agency_name": (str, "Unknown"),
+    })
+    agencies = dict(zip(agency["agency_id"], agency["agency_name"]))
 
     print(f"Found {len(agencies)} agencies")
     return agencies
@@ -182,287 +236,228 @@ def parse_trips(gtfs_zip):
     """Parse trips.txt to link routes to stops."""
     print("Parsing trips...")
 
-    with gtfs_zip.open("trips.txt") as f:
-        reader = csv.DictReader(io.TextIOWrapper(f, encoding="utf-8-sig"))
-        trips = {}
-        trip_route_map = {}
-
-        for row in reader:
-            trip_id = row.get("trip_id", "")
-            trip_route_map[trip_id] = row.get("route_id", "")
-
-            trips[trip_id] = {
-                "trip_id": trip_id,
-                "route_id": row.get("route_id", ""),
-                "service_id": row.get("service_id", ""),
-                "trip_headsign": row.get("trip_headsign", ""),
-                "direction_id": row.get("direction_id", ""),
-                "shape_id": row.get("shape_id", ""),
-            }
+    trips = read_gtfs_table(gtfs_zip, "trips.txt", {
+        "trip_id": (str, ""),
+        "route_id": (str, ""),
+        "service_id": (str, ""),
+        "trip_headsign": (str, ""),
+        "direction_id": (str, ""),
+        "shape_id": (str, ""),
+    })
+    trips = trips.drop_duplicates("trip_id", keep="last").reset_index(drop=True)
+    trips = _as_category(trips, ["trip_id", "route_id", "service_id", "direction_id", "shape_id"])
 
     print(f"Found {len(trips)} trips")
-    return trips, trip_route_map
-
-
-def parse_stop_times(gtfs_zip, dolomites_stops, dolomites_trips):
-    """Parse stop_times.txt and filter to Dolomites stops only."""
-    print("Parsing stop times (schedules)...")
-
-    dolomites_stop_ids = set(dolomites_stops.keys())
-    dolomites_trip_ids = set(dolomites_trips.keys())
-    stop_times = []
-
-    with gtfs_zip.open("stop_times.txt") as f:
-        reader = csv.DictReader(io.TextIOWrapper(f, encoding="utf-8-sig"))
-
-        for row in reader:
-            trip_id = row.get("trip_id", "")
-            stop_id = row.get("stop_id", "")
-
-            # Only include stop times for Dolomites trips and stops
-            if trip_id in dolomites_trip_ids and stop_id in dolomites_stop_ids:
-                stop_times.append({
-                    "trip_id": trip_id,
-                    "arrival_time": row.get("arrival_time", ""),
-                    "departure_time": row.get("departure_time", ""),
-                    "stop_id": stop_id,
-                    "stop_sequence": row.get("stop_sequence", ""),
-                    "pickup_type": row.get("pickup_type", "0"),
-                    "drop_off_type": row.get("drop_off_type", "0"),
-                })
-
-    print(f"Found {len(stop_times):,} stop times for Dolomites region")
-    return stop_times
+    return trips
 
 
 def parse_calendar(gtfs_zip):
     """Parse calendar.txt for service schedules."""
     print("Parsing service calendar...")
 
-    calendar_entries = []
-
-    with gtfs_zip.open("calendar.txt") as f:
-        reader = csv.DictReader(io.TextIOWrapper(f, encoding="utf-8-sig"))
-
-        skipped = 0
-        for row in reader:
-            if not row.get("start_date", "").strip() or not row.get("end_date", "").strip():
-                skipped += 1
-                continue  # skip corrupt entries with missing dates
-            calendar_entries.append({
-                "service_id": row.get("service_id", ""),
-                "monday": row.get("monday", "0"),
-                "tuesday": row.get("tuesday", "0"),
-                "wednesday": row.get("wednesday", "0"),
-                "thursday": row.get("thursday", "0"),
-                "friday": row.get("friday", "0"),
-                "saturday": row.get("saturday", "0"),
-                "sunday": row.get("sunday", "0"),
-                "start_date": row.get("start_date", ""),
-                "end_date": row.get("end_date", ""),
-            })
-        if skipped:
-            print(f"  Skipped {skipped:,} corrupt calendar rows (missing dates)")
-
-    print(f"Found {len(calendar_entries):,} service calendars")
-    return calendar_entries
+    calendar = read_gtfs_table(gtfs_zip, "calendar.txt", {
+        "service_id": (str, ""),
+        **{day: (str, "0") for day in WEEKDAYS},
+        "start_date": (str, ""),
+        "end_date": (str, ""),
+    })
+
+    # Skip corrupt entries with missing dates
+    valid = (calendar["start_date"].str.strip() != "") & (calendar["end_date"].str.strip() != "")
+    skipped = int((~valid).sum())
+    calendar = calendar[valid].reset_index(drop=True)
+    if skipped:
+        print(f"  Skipped {skipped:,} corrupt calendar rows (missing dates)")
+    calendar = _as_category(calendar, ["service_id"])
+
+    print(f"Found {len(calendar):,} service calendars")
+    return calendar
 
 
 def parse_calendar_dates(gtfs_zip):
     """Parse calendar_dates.txt for service exceptions."""
     print("Parsing service calendar exceptions...")
 
-    calendar_dates = []
-
-    with gtfs_zip.open("calendar_dates.txt") as f:
-        reader = csv.DictReader(io.TextIOWrapper(f, encoding="utf-8-sig"))
+    calendar_dates = read_gtfs_table(gtfs_zip, "calendar_dates.txt", {
+        "service_id": (str, ""),
+        "date": (str, ""),
+        "exception_type": (str, ""),
+    })
 
-        skipped = 0
-        for row in reader:
-            if not row.get("date", "").strip() or not row.get("exception_type", "").strip():
-                skipped += 1
-                continue  # skip corrupt entries with missing date/exception_type
-            calendar_dates.append({
-                "service_id": row.get("service_id", ""),
-                "date": row.get("date", ""),
-                "exception_type": row.get("exception_type", ""),
-            })
-        if skipped:
-            print(f"  Skipped {skipped:,} corrupt calendar exception rows")
+    # Skip corrupt entries with missing date/exception_type
+    valid = (calendar_dates["date"].str.strip() != "") & (calendar_dates["exception_type"].str.strip() != "")
+    skipped = int((~valid).sum())
+    calendar_dates = calendar_dates[valid].reset_index(drop=True)
+    if skipped:
+        print(f"  Skipped {skipped:,} corrupt calendar exception rows")
+    calendar_dates = _as_category(calendar_dates, ["service_id", "exception_type"])
 
     print(f"Found {len(calendar_dates):,} calendar exceptions")
     return calendar_dates
 
 
-def find_routes_serving_stops(gtfs_zip, dolomites_stops, trip_route_map, routes):
-    """Find which routes serve Dolomites stops via stop_times.txt."""
-    print("Finding routes serving Dolomites region...")
-
-    dolomites_stop_ids = set(dolomites_stops.keys())
-    route_ids_serving_dolomites = set()
-
-    with gtfs_zip.open("stop_times.txt") as f:
-        reader = csv.DictReader(io.TextIOWrapper(f, encoding="utf-8-sig"))
-
-        for row in reader:
-            stop_id = row.get("stop_id", "")
-            if stop_id in dolomites_stop_ids:
-                trip_id = row.get("trip_id", "")
-                if trip_id in trip_route_map:
-                    route_ids_serving_dolomites.add(trip_route_map[trip_id])
-
-    # Filter routes
-    dolomites_routes = {
-        rid: routes[rid] for rid in route_ids_serving_dolomites if rid in routes
-    }
+def scan_stop_times(gtfs_zip, dolomites_stops, trips, routes):
+    """Scan stop_times.txt once: find routes serving Dolomites stops and buffer their rows.
+
+    The file is read in chunks and each chunk is filtered to Dolomites stops
+    before it is kept, so peak memory follows the regional subset rather than
+    the statewide table.
+    """
+    print("Scanning stop times (routes and schedules)...")
+
+    dolomites_stop_ids = dolomites_stops["stop_id"].astype(str).unique()
+    chunks = []
+
+    for chunk in iter_gtfs_table(gtfs_zip, "stop_times.txt", {
+        "trip_id": (str, ""),
+        "arrival_time": (str, ""),
+        "departure_time": (str, ""),
+        "stop_id": (str, ""),
+        "stop_sequence": (str, ""),
+        "pickup_type": (str, "0"),
+        "drop_off_type": (str, "0"),
+    }, chunksize=STOP_TIMES_CHUNKSIZE):
+        chunks.append(chunk[chunk["stop_id"].isin(dolomites_stop_ids)])
+
+    candidates = pd.concat(chunks, ignore_index=True)
+    candidates = candidates[candidates["trip_id"].isin(trips["trip_id"].astype(str))].reset_index(drop=True)
+    candidates["stop_sequence"] = (
+        pd.to_numeric(candidates["stop_sequence"], errors="coerce").fillna(0).astype("int32")
+    )
+    # Integer seconds since midnight (hours may exceed 24 for after-midnight trips)
+    candidates["arrival_secs"] = gtfs_time_to_seconds(candidates["arrival_time"])
+    candidates["departure_secs"] = gtfs_time_to_seconds(candidates["departure_time"])
+    candidates = _as_category(candidates, ["trip_id", "stop_id", "pickup_type", "drop_off_type"])
+
+    # Routes of the trips seen at Dolomites stops
+    serving_trips = trips[trips["trip_id"].isin(candidates["trip_id"].cat.categories)]
+    dolomites_routes = routes[routes["route_id"].isin(serving_trips["route_id"].astype(str))]
+    dolomites_routes = dolomites_routes.reset_index(drop=True)
 
     print(f"Found {len(dolomites_routes)} routes serving Dolomites")
-    return dolomites_routes
-
-
-def save_stops_csv(stops, output_file):
-    """Save stops to CSV."""
-    output_file.parent.mkdir(parents=True, exist_ok=True)
-
-    fieldnames = ["stop_id", "stop_name", "stop_lat", "stop_lon", "location", "region"]
-
-    with open(output_file, "w", newline="", encoding="utf-8") as f:
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
-        writer.writeheader()
-
-        # Sort by region, then location, then name
-        sorted_stops = sorted(stops.values(), key=lambda x: (x["region"], x["location"], x["stop_name"]))
-        writer.writerows(sorted_stops)
-
-    print(f"Saved {len(stops)} stops to {output_file}")
-
-
-def save_routes_csv(routes, agencies, output_file):
-    """Save routes to CSV."""
-    output_file.parent.mkdir(parents=True, exist_ok=True)
-
-    fieldnames = ["route_id", "route_short_name", "route_long_name", "route_type", "agency_name"]
-
-    with open(output_file, "w", newline="", encoding="utf-8") as f:
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
-        writer.writeheader()
-
-        for route in sorted(routes.values(), key=lambda x: (x["route_type"], x["route_short_name"])):
-            row = {
-                "route_id": route["route_id"],
-                "route_short_name": route["route_short_name"],
-                "route_long_name": route["route_long_name"],
-                "route_type": route["route_type"],
-                "agency_name": agencies.get(route["agency_id"], "Unknown"),
-            }
-            writer.writerow(row)
-
-    print(f"Saved {len(routes)} routes to {output_file}")
+    return dolomites_routes, candidates
 
 
-def save_trips_csv(trips, output_file):
-    """Save trips to CSV."""
-    output_file.parent.mkdir(parents=True, exist_ok=True)
+def filter_stop_times(candidates, dolomites_trips):
+    """Keep buffered stop times that belong to Dolomites trips."""
+    mask = candidates["trip_id"].isin(dolomites_trips["trip_id"].astype(str))
+    stop_times = candidates[mask].reset_index(drop=True)
+    stop_times["trip_id"] = stop_times["trip_id"].cat.remove_unused_categories()
 
-    fieldnames = ["trip_id", "route_id", "service_id", "trip_headsign", "direction_id", "shape_id"]
-
-    with open(output_file, "w", newline="", encoding="utf-8") as f:
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
-        writer.writeheader()
-
-        sorted_trips = sorted(trips.values(), key=lambda x: (x["route_id"], x["trip_id"]))
-        writer.writerows(sorted_trips)
-
-    print(f"Saved {len(trips):,} trips to {output_file}")
-
-
-def save_stop_times_csv(stop_times, output_file):
-    """Save stop times to CSV."""
-    output_file.parent.mkdir(parents=True, exist_ok=True)
-
-    fieldnames = ["trip_id", "arrival_time", "departure_time", "stop_id", "stop_sequence", "pickup_type", "drop_off_type"]
-
-    with open(output_file, "w", newline="", encoding="utf-8") as f:
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
-        writer.writeheader()
-
-        sorted_times = sorted(stop_times, key=lambda x: (x["trip_id"], int(x.get("stop_sequence", "0") or "0")))
-        writer.writerows(sorted_times)
-
-    print(f"Saved {len(stop_times):,} stop times to {output_file}")
-
-
-def save_calendar_csv(calendar_entries, output_file):
-    """Save service calendar to CSV."""
-    output_file.parent.mkdir(parents=True, exist_ok=True)
-
-    fieldnames = ["service_id", "monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday", "start_date", "end_date"]
-
-    with open(output_file, "w", newline="", encoding="utf-8") as f:
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
-        writer.writeheader()
-        writer.writerows(calendar_entries)
+    print(f"Found {len(stop_times):,} stop times for Dolomites region")
+    return stop_times
 
-    print(f"Saved {len(calendar_entries):,} calendar entries to {output_file}")
 
+def prune_services(calendar, calendar_dates, dolomites_trips):
+    """Keep only calendar rows for service_ids used by the retained Dolomites trips."""
+    print("Pruning service calendars to Dolomites trips...")
+
+    service_ids = dolomites_trips["service_id"].astype(str).unique()
+    pruned_calendar = calendar[calendar["service_id"].isin(service_ids)].reset_index(drop=True)
+    pruned_dates = calendar_dates[calendar_dates["service_id"].isin(service_ids)].reset_index(drop=True)
+    pruned_calendar["service_id"] = pruned_calendar["service_id"].cat.remove_unused_categories()
+    pruned_dates["service_id"] = pruned_dates["service_id"].cat.remove_unused_categories()
+
+    for label, before, after in (
+        ("calendar", calendar, pruned_calendar),
+        ("calendar exceptions", calendar_dates, pruned_dates),
+    ):
+        removed = len(before) - len(after)
+        share = removed / len(before) * 100 if len(before) else 0.0
+        print(f"  {label}: {len(before):,} -> {len(after):,} rows ({share:.1f}% removed)")
+
+    return pruned_calendar, pruned_dates
+
+
+def output_tables(stops, routes, agencies, trips, stop_times, calendar, calendar_dates):
+    """Sort and select the columns of each output table, keyed by table name."""
+    out_routes = routes.sort_values(["route_type", "route_short_name"], kind="stable").copy()
+    out_routes["agency_name"] = out_routes["agency_id"].astype(str).map(agencies).fillna("Unknown")
+
+    tables = {
+        # Stops by region, then location, then name
+        "stops": stops.sort_values(["region", "location", "stop_name"], kind="stable"),
+        "routes": out_routes,
+        "trips": trips.sort_values(["route_id", "trip_id"], kind="stable"),
+        "stop_times": stop_times.sort_values(["trip_id", "stop_sequence"], kind="stable"),
+        "calendar": calendar,
+        "calendar_dates": calendar_dates.sort_values(["date", "service_id"], kind="stable"),
+    }
+    return {name: df[OUTPUT_COLUMNS[name]] for name, df in tables.items()}
 
-def save_calendar_dates_csv(calendar_dates, output_file):
-    """Save calendar exceptions to CSV."""
-    output_file.parent.mkdir(parents=True, exist_ok=True)
 
-    fieldnames = ["service_id", "date", "exception_type"]
+def save_tables_csv(tables, names):
+    """Save the named tables to their CSV files (each replaced atomically)."""
+    DATA_DIR.mkdir(parents=True, exist_ok=True)
+    for name in names:
+        output_file = DATA_DIR / CSV_FILES[name]
+        tmp_file = output_file.with_name(output_file.name + ".tmp")
+        tables[name].to_csv(tmp_file, index=False, encoding="utf-8")
+        os.replace(tmp_file, output_file)
+        print(f"Saved {len(tables[name]):,} {name.replace('_', ' ')} to {output_file}")
 
-    with open(output_file, "w", newline="", encoding="utf-8") as f:
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
-        writer.writeheader()
 
-        sorted_dates = sorted(calendar_dates, key=lambda x: (x["date"], x["service_id"]))
-        writer.writerows(sorted_dates)
+def load_previous_tables():
+    """Typed tables of the previous refresh, or None on the first run."""
+    try:
+        return load_snapshot()
+    except FileNotFoundError:
+        return None
 
-    print(f"Saved {len(calendar_dates):,} calendar exceptions to {output_file}")
 
+def refresh_gtfs_data(feed_path=None, in_use=None):
+    """Download and parse GTFS data, saving CSV files and a binary snapshot.
 
-def refresh_gtfs_data():
-    """Download and parse GTFS data, saving to CSV files. Returns True on success."""
+    `feed_path` reads a local GTFS zip instead of downloading the feed.
+    `in_use` returns snapshot versions that must not be pruned (a running app's).
+    Returns the diff against the previous data (see transport_snapshot.diff_tables).
+    """
     # Download GTFS
-    gtfs_zip = download_gtfs()
+    if feed_path:
+        print(f"Reading GTFS data from {feed_path}")
+        gtfs_zip = zipfile.ZipFile(feed_path)
+    else:
+        gtfs_zip = download_gtfs()
     print()
 
     # Parse basic data
     stops = parse_stops(gtfs_zip)
     routes = parse_routes(gtfs_zip)
     agencies = parse_agencies(gtfs_zip)
-    trips, trip_route_map = parse_trips(gtfs_zip)
+    trips = parse_trips(gtfs_zip)
     print()
 
-    # Find routes and trips serving Dolomites
-    dolomites_routes = find_routes_serving_stops(gtfs_zip, stops, trip_route_map, routes)
+    # Single pass over stop_times.txt: serving routes + candidate rows
+    dolomites_routes, candidate_stop_times = scan_stop_times(gtfs_zip, stops, trips, routes)
 
     # Filter trips to only those serving Dolomites
-    dolomites_trip_ids = {trip_id for trip_id, route_id in trip_route_map.items()
-                          if route_id in dolomites_routes}
-    dolomites_trips = {tid: trips[tid] for tid in dolomites_trip_ids if tid in trips}
+    dolomites_trips = trips[trips["route_id"].isin(dolomites_routes["route_id"].astype(str))]
+    dolomites_trips = dolomites_trips.reset_index(drop=True)
     print(f"Found {len(dolomites_trips):,} trips serving Dolomites")
     print()
 
     # Parse schedule data
-    stop_times = parse_stop_times(gtfs_zip, stops, dolomites_trips)
+    stop_times = filter_stop_times(candidate_stop_times, dolomites_trips)
     calendar = parse_calendar(gtfs_zip)
     calendar_dates = parse_calendar_dates(gtfs_zip)
+    calendar, calendar_dates = prune_services(calendar, calendar_dates, dolomites_trips)
     print()
 
-    # Save to CSV
+    # Diff against the previous snapshot; only changed tables are rewritten
+    tables = output_tables(stops, dolomites_routes, agencies, dolomites_trips, stop_times,
+                           calendar, calendar_dates)
+    typed = {name: apply_schema(name, df) for name, df in tables.items()}
+    diff = diff_tables(load_previous_tables(), typed)
+    print(f"Changes since last refresh: {diff_summary(diff)}")
+
     print("Saving data files...")
-    save_stops_csv(stops, DATA_DIR / "transport_stops.csv")
-    save_routes_csv(dolomites_routes, agencies, DATA_DIR / "transport_routes.csv")
-    save_trips_csv(dolomites_trips, DATA_DIR / "transport_trips.csv")
-    save_stop_times_csv(stop_times, DATA_DIR / "transport_stop_times.csv")
-    save_calendar_csv(calendar, DATA_DIR / "transport_calendar.csv")
-    save_calendar_dates_csv(calendar_dates, DATA_DIR / "transport_calendar_dates.csv")
+    changed = [name for name in tables if diff["tables"][name] or not (DATA_DIR / CSV_FILES[name]).exists()]
+    save_tables_csv(tables, changed)
+    write_snapshot(typed, diff, in_use=in_use)
 
     print(f"\nRefresh complete: {len(stops)} stops, {len(dolomites_routes)} routes, "
           f"{len(stop_times):,} stop times")
-    return True
+    return diff
 
 
 def main():
@@ -472,7 +467,7 @@ def main():
     print("=" * 60)
     print()
 
-    refresh_gtfs_data()
+    refresh_gtfs_data(sys.argv[1] if len(sys.argv) > 1 else None)
 
     print()
     print("=" * 60)
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Walking links between nearby stops.
+Stops are bucketed into a grid of cells as wide as the longest walk, so the
+candidates for each stop are the stops in its own and the 8 surrounding cells
+(one vectorized join per neighbouring cell instead of all stop pairs). Walking
+time is the straight-line distance times a detour factor at walking speed;
+links longer than the threshold are dropped.
+"""
+
+import heapq
+
+import numpy as np
+import pandas as pd
+
+WALK_SPEED_MPS = 1.2     # ~4.3 km/h
+DETOUR_FACTOR = 1.3      # Streets are not straight lines
+MAX_WALK_SECS = 300      # Longest walk offered as a transfer
+EARTH_RADIUS_M = 6371000
+
+
+class FootpathGraph:
+    """Walking links between all pairs of stops within `max_walk_secs` of each other.
+
+    `edges` is a frame with from_stop_id, to_stop_id, distance_m and walk_secs
+    (both directions, sorted by from_stop_id then walk_secs).
+    """
+
+    def __init__(self, stops_df, max_walk_secs=MAX_WALK_SECS):
+        self.max_walk_secs = max_walk_secs
+        max_dist = max_walk_secs * WALK_SPEED_MPS / DETOUR_FACTOR
+
+        stops = stops_df.dropna(subset=['stop_lat', 'stop_lon']).drop_duplicates(subset=['stop_id'])
+        lat = np.radians(stops['stop_lat'].to_numpy(dtype='float64'))
+        lon = np.radians(stops['stop_lon'].to_numpy(dtype='float64'))
+        # Local equirectangular projection, metres (fine over a region this size)
+        x = EARTH_RADIUS_M * lon * np.cos(lat.mean() if len(lat) else 0.0)
+        y = EARTH_RADIUS_M * lat
+        grid = pd.DataFrame({
+            'i': np.arange(len(stops)),
+            'cx': np.floor(x / max_dist).astype('int64'),
+            'cy': np.floor(y / max_dist).astype('int64'),
+        })
+
+        pairs = []
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                shifted = grid.assign(cx=grid['cx'] + dx, cy=grid['cy'] + dy)
+                pairs.append(shifted.merge(grid, on=['cx', 'cy'], suffixes=('', '_to'))[['i', 'i_to']])
+        pairs = pd.concat(pairs, ignore_index=True)
+        a, b = pairs['i'].to_numpy(), pairs['i_to'].to_numpy()
+        a, b = a[a != b], b[a != b]
+
+        distance = np.hypot(x[a] - x[b], y[a] - y[b])
+        keep = distance <= max_dist
+        stop_ids = stops['stop_id'].to_numpy()
+        self.edges = pd.DataFrame({
+            'from_stop_id': stop_ids[a[keep]],
+            'to_stop_id': stop_ids[b[keep]],
+            'distance_m': distance[keep].round(1),
+            'walk_secs': np.ceil(distance[keep] * DETOUR_FACTOR / WALK_SPEED_MPS).astype('int64'),
+        }).sort_values(['from_stop_id', 'walk_secs'], ignore_index=True)
+
+    def __len__(self):
+        return len(self.edges)
+
+    def station_walks(self, stop_station):
+        """Shortest walk between stations: {station: {other station: walk_secs}}.
+
+        `stop_station` maps stop_id -> station name; links within one station
+        and stops outside the mapping are ignored. Each inner dict is ordered
+        by walking time.
+        """
+        edges = self.edges.assign(
+            from_station=self.edges['from_stop_id'].map(stop_station),
+            to_station=self.edges['to_stop_id'].map(stop_station),
+        ).dropna(subset=['from_station', 'to_station'])
+        edges = edges[edges['from_station'] != edges['to_station']]
+        shortest = edges.groupby(['from_station', 'to_station'])['walk_secs'].min().reset_index()
+        shortest = shortest.sort_values(['from_station', 'walk_secs', 'to_station'])
+        return {
+            station: dict(zip(group['to_station'], group['walk_secs'].astype(int)))
+            for station, group in shortest.groupby('from_station', sort=False)
+        }
+
+
+def closed_walks(walks, max_walk_secs=MAX_WALK_SECS):
+    """Transitive closure of station walks: {station: {station reachable on foot: shortest walk_secs}}.
+
+    Connection searches take at most one walk between two buses, so chains
+    of short links (A-B, B-C) must appear as one link (A-C), as long as the
+    whole chain stays within `max_walk_secs`.
+    """
+    closed = {}
+    for source in walks:
+        done = {}
+        heap = [(0, source)]
+        while heap:
+            secs, station = heapq.heappop(heap)
+            if station in done:
+                continue
+            done[station] = secs
+            for other, walk in walks.get(station, {}).items():
+                if other not in done and secs + int(walk) <= max_walk_secs:
+                    heapq.heappush(heap, (secs + int(walk), other))
+        del done[source]
+        closed[source] = dict(sorted(done.items(), key=lambda item: item[1]))
+    return closed
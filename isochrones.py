@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Isochrones: the earliest arrival at every station reachable within a time
+budget from a station, date and departure time.
+One-to-all connection scan over the elementary connections (consecutive stop
+visits of a trip) sorted by departure time, built once per snapshot version
+from the ODIndex arrays. A query only takes the connections running inside
+its time window and scans them in rounds, with numpy operations over all of
+them at once: a round boards every trip that is catchable from the current
+ready times (and stays on it to the end of the window), takes the earliest
+bus arrival per station and relaxes the walking links, and rounds repeat
+until no ready time improves. Each round adds at most one bus leg, so this
+reaches the same labels as a sequential scan in departure order. A batch
+scans them once for many origins, with one row of labels per origin, so all
+main stations cost about as much as one.
+
+The search is for one departure time, not a profile over a range of
+departure times: the map asks "leaving at T, within N minutes", which is
+one point of the profile. The batch dimension goes to origins instead.
+"""
+
+import numpy as np
+import pandas as pd
+
+from footpaths import closed_walks
+from journey_planner import INF, MIN_TRANSFER_SECS
+from schedule_index import ViewCache
+
+
+class ConnectionScan:
+    """Earliest arrivals from one or more origins, over the connections of an ODIndex.
+
+    Isochrone frames are memoized per query in an LRU cache of at most
+    MAX_CACHED_BYTES.
+    """
+
+    MAX_CACHED_BYTES = 8 * 1024 * 1024
+
+    def __init__(self, od_index, walks=None):
+        self.index = od_index.departures
+        self.calendar = od_index.calendar
+        n_trips = len(od_index.trip_ptr) - 1
+
+        # Usable stop visits (a missing time falls back to the other one), as in JourneyPlanner
+        arrival = np.where(od_index.arrival_secs < 0, od_index.departure_secs, od_index.arrival_secs)
+        departure = np.where(od_index.departure_secs < 0, od_index.arrival_secs, od_index.departure_secs)
+        visit_trip = np.repeat(np.arange(n_trips), np.diff(od_index.trip_ptr))
+        visits = np.flatnonzero(departure >= 0)
+
+        # Connections: each usable visit to the next usable visit of the same trip
+        same_trip = visit_trip[visits[:-1]] == visit_trip[visits[1:]]
+        a, b = visits[:-1][same_trip], visits[1:][same_trip]
+        order = np.lexsort((arrival[b], departure[a]))
+        a, b = a[order], b[order]
+        self.dep = departure[a].astype('int64')
+        self.arr = arrival[b].astype('int64')
+        self.from_station = od_index.station[a]
+        self.to_station = od_index.station[b]
+        self.trip = visit_trip[a]
+        self.visit = a  # visits are stored trip by trip in stop order
+
+        # Walking links as arrays, grouped by the station walked to
+        names = self.index.station_names
+        links = [(names.get_loc(name), names.get_loc(other), secs)
+                 for name, others in closed_walks(walks or {}).items() if name in names
+                 for other, secs in others.items() if other in names]
+        links = np.array(sorted(links, key=lambda link: link[1]), dtype='int64').reshape(-1, 3)
+        self.walk_from, self.walk_to, self.walk_secs = links.T
+        self.walk_starts = np.flatnonzero(np.r_[True, self.walk_to[1:] != self.walk_to[:-1]]) if len(links) else links
+        self.results = ViewCache(self.MAX_CACHED_BYTES)
+
+    def earliest_arrivals(self, origin_names, target_date, depart_secs, minutes):
+        """Array (origins x stations) of earliest arrivals within `minutes` of `depart_secs`; INF if not reached.
+
+        Changing buses takes MIN_TRANSFER_SECS at a station; walking links
+        (chains closed up to MAX_WALK_SECS) may be used at the start and
+        after each bus.
+        """
+        names = self.index.station_names
+        origins = names.get_indexer(list(origin_names))
+        n = len(origins)
+        start = np.full((n, len(names)), INF, dtype='int64')
+        end = depart_secs + minutes * 60
+        rows = np.flatnonzero(origins >= 0)
+        start[rows, origins[rows]] = depart_secs
+        for k in rows:
+            walk = self.walk_from == origins[k]
+            start[k, self.walk_to[walk]] = np.minimum(start[k, self.walk_to[walk]], depart_secs + self.walk_secs[walk])
+
+        # Connections running inside the window, trip by trip in stop order
+        active = self.calendar.trip_mask(target_date)
+        lo, hi = np.searchsorted(self.dep, depart_secs, side='left'), np.searchsorted(self.dep, end, side='right')
+        scan = np.arange(lo, hi)
+        scan = scan[active[self.trip[scan]] & (self.arr[scan] <= end)]
+        if not scan.size:
+            return start
+        scan = scan[np.argsort(self.visit[scan], kind='stable')]
+        dep, arr, a = self.dep[scan], self.arr[scan], self.from_station[scan]
+        trip_start = np.flatnonzero(np.r_[True, self.trip[scan][1:] != self.trip[scan][:-1]])
+        trip_sizes = np.diff(np.append(trip_start, len(scan)))
+        by_station = np.argsort(self.to_station[scan], kind='stable')
+        to_sorted = self.to_station[scan][by_station]
+        to_start = np.flatnonzero(np.r_[True, to_sorted[1:] != to_sorted[:-1]])
+        to_station = to_sorted[to_start]
+
+        ready = start
+        while True:
+            # On a trip from the first connection boarded onwards (a cumulative OR per trip)
+            boarded = np.cumsum(ready[:, a] <= dep, axis=1)
+            before = np.c_[np.zeros(n, dtype='int64'), boarded][:, trip_start]
+            on_trip = boarded > np.repeat(before, trip_sizes, axis=1)
+            # Earliest arrival by bus: walks (closed only up to MAX_WALK_SECS) start from these
+            bus = np.full_like(start, INF)
+            bus[:, to_station] = np.minimum.reduceat(np.where(on_trip, arr, INF)[:, by_station], to_start, axis=1)
+            walked, walk_ready = self._walk(bus, end)
+            new_ready = np.minimum(np.minimum(start, walk_ready), np.where(bus < INF, bus + MIN_TRANSFER_SECS, INF))
+            if np.array_equal(new_ready, ready):
+                return np.minimum(np.minimum(start, bus), walked)
+            ready = new_ready
+
+    def _walk(self, bus, end):
+        """Arrivals and ready times at the stations walked to from the bus arrivals `bus`, within `end`."""
+        walked = np.full_like(bus, INF)
+        walk_ready = np.full_like(bus, INF)
+        if not len(self.walk_secs):
+            return walked, walk_ready
+        at = bus[:, self.walk_from]
+        ok = at + self.walk_secs <= end
+        to = self.walk_to[self.walk_starts]
+        walked[:, to] = np.minimum.reduceat(np.where(ok, at + self.walk_secs, INF), self.walk_starts, axis=1)
+        change = np.maximum(self.walk_secs, MIN_TRANSFER_SECS)
+        walk_ready[:, to] = np.minimum.reduceat(np.where(ok, at + change, INF), self.walk_starts, axis=1)
+        return walked, walk_ready
+
+    def isochrones(self, origin_names, target_date, depart_secs, minutes):
+        """Stations reachable within `minutes` from each origin (batch).
+
+        Returns a frame with origin, station, arrival_secs and minutes (travel
+        time, rounded up), sorted by origin then arrival. The frame is shared
+        between callers; treat it as read-only.
+        """
+        key = (tuple(origin_names), target_date, depart_secs, minutes)
+        result = self.results.get(key)
+        if result is None:
+            result = self._isochrones(list(origin_names), target_date, depart_secs, minutes)
+            self.results.put(key, result)
+        return result
+
+    def _isochrones(self, origin_names, target_date, depart_secs, minutes):
+        best = self.earliest_arrivals(origin_names, target_date, depart_secs, minutes)
+        k, station = np.nonzero(best < INF)
+        arrival = best[k, station]
+        result = pd.DataFrame({
+            'origin': np.asarray(origin_names, dtype=object)[k],
+            'station': self.index.station_names[station].to_numpy(dtype=object),
+            'arrival_secs': arrival,
+            'minutes': -((depart_secs - arrival) // 60),
+        })
+        return result.sort_values(['origin', 'arrival_secs', 'station'], ignore_index=True)
+
+    def isochrone(self, origin_name, target_date, depart_secs, minutes):
+        """Stations reachable within `minutes` from `origin_name`: station, arrival_secs, minutes."""
+        result = self.isochrones([origin_name], target_date, depart_secs, minutes)
+        return result.drop(columns='origin')
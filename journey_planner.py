@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+"""
+Multi-leg journey planning between consolidated stations (RAPTOR).
+Built once per snapshot version on top of the ODIndex arrays: trips with the
+same station sequence are grouped into patterns (split further so that no
+trip overtakes another), each pattern holding departure/arrival matrices of
+shape trips x stops. A query runs one round per leg; a round scans the
+patterns serving stations improved in the previous round, boards the earliest
+catchable active trip at each stop and propagates arrivals along the pattern
+with numpy operations on the pattern's matrices, then relaxes the walking
+links (footpaths) out of the stations its buses reached earlier than before.
+"""
+
+from collections import defaultdict
+
+import numpy as np
+import pandas as pd
+
+from footpaths import closed_walks
+
+MAX_TRANSFERS = 3
+MIN_TRANSFER_SECS = 120  # Minimum time to change buses at a station
+INF = np.iinfo('int64').max // 2
+
+
+class JourneyPlanner:
+    """Earliest-arrival journeys with up to MAX_TRANSFERS changes, over an ODIndex."""
+
+    def __init__(self, od_index, walks=None):
+        self.index = od_index.departures
+        self.calendar = od_index.calendar
+        n_trips = len(od_index.trip_ptr) - 1
+
+        # Usable stop visits per trip (a missing time falls back to the other one)
+        arrival = np.where(od_index.arrival_secs < 0, od_index.departure_secs, od_index.arrival_secs)
+        departure = np.where(od_index.departure_secs < 0, od_index.arrival_secs, od_index.departure_secs)
+
+        groups = defaultdict(list)
+        for trip in range(n_trips):
+            visits = np.arange(od_index.trip_ptr[trip], od_index.trip_ptr[trip + 1])
+            visits = visits[departure[visits] >= 0]
+            if len(visits) >= 2:
+                groups[tuple(od_index.station[visits])].append((departure[visits[0]], trip, visits))
+
+        # Patterns: trips with the same stations, in departure order, none overtaking the previous one
+        self.pattern_stations, self.pattern_trips = [], []
+        self.pattern_departures, self.pattern_arrivals = [], []
+        for stations, trips in groups.items():
+            open_patterns = []
+            for _, trip, visits in sorted(trips, key=lambda t: (t[0], t[1])):
+                dep, arr = departure[visits], arrival[visits]
+                for pattern in open_patterns:
+                    if (dep >= pattern[1][-1]).all() and (arr >= pattern[2][-1]).all():
+                        break
+                else:
+                    pattern = ([], [], [])
+                    open_patterns.append(pattern)
+                pattern[0].append(trip)
+                pattern[1].append(dep)
+                pattern[2].append(arr)
+            for trip_list, deps, arrs in open_patterns:
+                self.pattern_stations.append(np.array(stations, dtype='int64'))
+                self.pattern_trips.append(np.array(trip_list, dtype='int64'))
+                self.pattern_departures.append(np.vstack(deps))
+                self.pattern_arrivals.append(np.vstack(arrs))
+
+        # Patterns serving each station (CSR)
+        pairs = np.unique(np.concatenate([
+            np.column_stack([stations, np.full(len(stations), p)])
+            for p, stations in enumerate(self.pattern_stations)
+        ]) if self.pattern_stations else np.empty((0, 2), dtype='int64'), axis=0)
+        self.station_patterns = pairs[:, 1]
+        self.station_pattern_ptr = np.searchsorted(pairs[:, 0], np.arange(len(self.index.station_names) + 1))
+
+        # Walking links between stations: {station: [(other station, walk_secs)]}, chains closed
+        # up to MAX_WALK_SECS (a query takes at most one walk between two buses)
+        names = self.index.station_names
+        self.walks = {
+            names.get_loc(name): [(names.get_loc(other), secs) for other, secs in others.items() if other in names]
+            for name, others in closed_walks(walks or {}).items() if name in names
+        }
+
+    def _walk(self, starts, label, best, change, skip=()):
+        """Relax the walking links out of `starts`, {station: (arrival, wait)}; returns {station reached: (from station, walk_secs)}.
+
+        `change` is the wait still needed at a station before boarding: a
+        walk shorter than the minimum change time after a bus leaves the rest.
+        """
+        walked = {}
+        for s, (at, wait) in starts.items():
+            for t, secs in self.walks.get(s, ()):
+                if t not in skip and at + secs < best[t]:
+                    label[t] = best[t] = at + secs
+                    change[t] = max(0, wait - secs)
+                    walked[t] = (s, secs)
+        return walked
+
+    def _patterns_at(self, stations):
+        parts = [self.station_patterns[self.station_pattern_ptr[s]:self.station_pattern_ptr[s + 1]]
+                 for s in stations]
+        return np.unique(np.concatenate(parts)) if parts else np.array([], dtype='int64')
+
+    def earliest_arrival(self, origin_names, dest_names, target_date, depart_secs, max_transfers=MAX_TRANSFERS):
+        """Journeys from any origin to any destination station leaving at or after `depart_secs`.
+
+        Returns one journey per number of legs that arrives earlier than all
+        journeys with fewer legs (fewest legs first). Each journey is a dict
+        with arrival_secs, transfers and legs, a frame with route_short_name,
+        destination, from, to, departure_secs, arrival_secs and trip_id.
+        """
+        names = self.index.station_names
+        origins = names.get_indexer(list(origin_names))
+        dests = names.get_indexer(list(dest_names))
+        origins, dests = origins[origins >= 0], dests[dests >= 0]
+        if not len(origins) or not len(dests):
+            return []
+        active = self.calendar.trip_mask(target_date)
+
+        label = np.full(len(names), INF, dtype='int64')
+        label[origins] = depart_secs
+        best = label.copy()
+        change = np.zeros(len(names), dtype='int64')
+        # No walking straight to the destination: that is not a bus journey
+        walked = self._walk({o: (depart_secs, 0) for o in origins}, label, best, change, skip=set(dests))
+        marked = np.union1d(origins, np.array(list(walked), dtype='int64'))
+        parents, walk_parents, bus_parents = [{}], [walked], [{}]
+        # Earliest arrival by bus, walks excluded: walks are only closed up to
+        # MAX_WALK_SECS, so they must start from a bus arrival, not a walk
+        bus_best = np.full(len(names), INF, dtype='int64')
+        journeys = []
+        for leg in range(1, max_transfers + 2):
+            ready = label + change
+            label = label.copy()
+            parent, bus_parent = {}, {}
+            improved = set()
+            bound = best[dests].min()
+            for p in self._patterns_at(marked):
+                rows = np.flatnonzero(active[self.pattern_trips[p]])
+                if not rows.size:
+                    continue
+                stations = self.pattern_stations[p]
+                m = len(stations)
+                dep = self.pattern_departures[p][rows]
+
+                # First catchable trip at each stop, then the best trip boarded before each stop
+                # (the earliest stop it can be boarded at, so a trip catchable at the origin
+                # is not boarded after a walk along its own route)
+                catchable = dep >= ready[stations]
+                board_row = np.where(catchable.any(axis=0), catchable.argmax(axis=0), len(rows))
+                key = np.minimum.accumulate(board_row * m + np.arange(m))
+                key = np.r_[len(rows) * m, key[:-1]]
+                row, board_pos = key // m, key % m
+                alight = np.flatnonzero(row < len(rows))
+                if not alight.size:
+                    continue
+                arrival = self.pattern_arrivals[p][rows[row[alight]], alight]
+                better = arrival < np.minimum(bus_best[stations[alight]], bound)
+                for j, arr in zip(alight[better], arrival[better]):
+                    station = stations[j]
+                    bus_best[station] = arr
+                    bus_parent[station] = (p, rows[row[j]], board_pos[j], j)
+                    if arr < best[station]:
+                        label[station] = best[station] = arr
+                        parent[station] = bus_parent[station]
+                        improved.add(station)
+                bound = best[dests].min()
+
+            parents.append(parent)
+            bus_parents.append(bus_parent)
+            change = change.copy()
+            change[list(improved)] = MIN_TRANSFER_SECS
+            walked = self._walk({s: (bus_best[s], MIN_TRANSFER_SECS) for s in sorted(bus_parent)},
+                                label, best, change)
+            walk_parents.append(walked)
+            improved.update(walked)
+            reached = [d for d in dests if d in parent or d in walked]
+            if reached:
+                dest = min(reached, key=lambda d: label[d])
+                if not journeys or label[dest] < journeys[-1]['arrival_secs']:
+                    journeys.append({
+                        'arrival_secs': int(label[dest]),
+                        'transfers': leg - 1,
+                        'legs': self._legs(parents, walk_parents, bus_parents, leg, dest),
+                    })
+            if not improved:
+                break
+            marked = np.array(sorted(improved), dtype='int64')
+        return journeys
+
+    def _legs(self, parents, walk_parents, bus_parents, leg, station):
+        """Follow the round parents back from `station` reached in round `leg`.
+
+        Walks are legs with route_short_name 'Walk' and no trip_id; a walk to
+        the first bus is timed to end at its departure. A walk always starts
+        where a bus (or the journey) arrived, never at the end of another walk.
+        """
+        index = self.index
+        legs = []
+        after_walk = False
+        while True:
+            if after_walk:
+                # The walk started from the bus that arrived there this round
+                if leg == 0:
+                    break
+                entry = bus_parents[leg][station]
+            else:
+                while leg > 0 and station not in parents[leg] and station not in walk_parents[leg]:
+                    leg -= 1
+                if station in walk_parents[leg]:
+                    origin, secs = walk_parents[leg][station]
+                    legs.append({
+                        'route_short_name': 'Walk',
+                        'destination': '',
+                        'from': index.station_names[origin],
+                        'to': index.station_names[station],
+                        'walk_secs': secs,
+                        'trip_id': None,
+                    })
+                    station = origin
+                    after_walk = True
+                    continue
+                if leg == 0:
+                    break
+                entry = parents[leg][station]
+            after_walk = False
+            p, row, i, j = entry
+            trip = self.pattern_trips[p][row]
+            stations = self.pattern_stations[p]
+            legs.append({
+                'route_short_name': index.route_names[index.trip_route[trip]],
+                'destination': index.destinations[index.trip_destination[trip]],
+                'from': index.station_names[stations[i]],
+                'to': index.station_names[stations[j]],
+                'departure_secs': int(self.pattern_departures[p][row, i]),
+                'arrival_secs': int(self.pattern_arrivals[p][row, j]),
+                'trip_id': index.trip_ids[trip],
+            })
+            station = stations[i]
+            leg -= 1
+
+        legs = legs[::-1]
+        for k, l in enumerate(legs):
+            if l['route_short_name'] == 'Walk' and l['trip_id'] is None:
+                secs = l.pop('walk_secs')
+                if k == 0:
+                    l['arrival_secs'] = legs[1]['departure_secs']
+                    l['departure_secs'] = l['arrival_secs'] - secs
+                else:
+                    l['departure_secs'] = legs[k - 1]['arrival_secs']
+                    l['arrival_secs'] = l['departure_secs'] + secs
+        columns = ['route_short_name', 'destination', 'from', 'to', 'departure_secs', 'arrival_secs', 'trip_id']
+        return pd.DataFrame(legs, columns=columns)
+
+    def plan(self, origin_names, dest_names, target_date, after_secs, count=5, max_transfers=MAX_TRANSFERS):
+        """The next `count` journeys leaving after `after_secs`.
+
+        Repeats the earliest-arrival query just after the first departure of
+        the previous answer; a journey arriving at the same time as the
+        previous one but leaving later replaces it.
+        """
+        options = []
+        depart = after_secs
+        for _ in range(count * 10):
+            journeys = self.earliest_arrival(origin_names, dest_names, target_date, depart, max_transfers)
+            if not journeys:
+                break
+            journey = min(journeys, key=lambda j: (j['arrival_secs'], j['transfers']))
+            if options and journey['arrival_secs'] == options[-1]['arrival_secs']:
+                if journey['transfers'] <= options[-1]['transfers']:
+                    options[-1] = journey
+            elif len(options) < count:
+                options.append(journey)
+            else:
+                break
+            depart = int(journey['legs']['departure_secs'].iloc[0]) + 1
+        return options
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Latest-value index over the parking history written by scraper_dolomites.py.
+Keeps the latest reading per station plus a short trend window, built from
+the tail of parking_data_dolomites.csv (rows are sorted by timestamp), and
+refreshed by reading only the bytes appended since the previous poll. The
+scraper rewrites the whole file on each save; as long as the previously read
+part is unchanged only the new rows are parsed, otherwise (e.g. after
+download_historical.py merged older data) the tail is read again.
+"""
+
+import csv
+import io
+import os
+import threading
+from collections import deque
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+TREND_HOURS = 3
+TAIL_BLOCK = 64 * 1024
+CHECK_BYTES = 256  # Bytes before the read offset compared on each poll to detect a rewrite
+
+
+def _to_int(value):
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+class ParkingIndex:
+    """Latest reading and recent history per parking station, updated incrementally."""
+
+    def __init__(self, csv_path, trend_hours=TREND_HOURS):
+        self.csv_path = csv_path
+        self.window = timedelta(hours=trend_hours)
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.latest = {}
+        self.history = {}
+        self.offset = 0
+        self.rows_read = 0
+        self._check = b''
+        self._fields = None
+
+    def poll(self):
+        """Read rows appended since the last poll; returns the number of new rows."""
+        with self._lock:
+            try:
+                with open(self.csv_path, 'rb') as f:
+                    size = os.fstat(f.fileno()).st_size
+                    if self._fields is None or not self._unchanged(f, size):
+                        return self._load_tail(f, size)
+                    f.seek(self.offset)
+                    return self._read_lines(f.read(size - self.offset))
+            except FileNotFoundError:
+                self._reset()
+                return 0
+
+    def _unchanged(self, f, size):
+        """True if the bytes just before the read offset are still the ones read last time."""
+        if size < self.offset:
+            return False
+        f.seek(self.offset - len(self._check))
+        return f.read(len(self._check)) == self._check
+
+    def _load_tail(self, f, size):
+        """(Re)build the index from the header and the rows within the trend window of the last row."""
+        self._reset()
+
+        # Header: first line that is not a '#' comment
+        f.seek(0)
+        header_end = 0
+        for line in iter(f.readline, b''):
+            header_end += len(line)
+            if not line.startswith(b'#'):
+                self._fields = next(csv.reader([line.decode('utf-8')]))
+                break
+        else:
+            return 0
+
+        # Read blocks backwards until the first complete line is older than the window
+        pos, data = size, b''
+        while pos > header_end:
+            block_start = max(header_end, pos - TAIL_BLOCK)
+            f.seek(block_start)
+            data = f.read(pos - block_start) + data
+            pos = block_start
+            lines = data.split(b'\n')
+            full = lines[:-1] if pos == header_end else lines[1:-1]
+            if len(full) >= 2 and self._older_than_window(full[0], full[-1]):
+                break
+        start = pos if pos == header_end else pos + data.index(b'\n') + 1
+        self.offset = start
+        return self._read_lines(data[start - pos:])
+
+    def _older_than_window(self, first_line, last_line):
+        try:
+            first = datetime.fromisoformat(first_line.split(b',', 1)[0].decode('utf-8'))
+            last = datetime.fromisoformat(last_line.split(b',', 1)[0].decode('utf-8'))
+        except ValueError:
+            return False
+        return first < last - self.window
+
+    def _read_lines(self, data):
+        """Parse the complete lines of `data` (starting at the read offset) into the index."""
+        end = data.rfind(b'\n') + 1
+        if end == 0:
+            return 0
+        reader = csv.DictReader(io.StringIO(data[:end].decode('utf-8')), fieldnames=self._fields)
+        count = 0
+        for row in reader:
+            name = row.get('name')
+            try:
+                timestamp = datetime.fromisoformat(row['timestamp'])
+            except (TypeError, ValueError):
+                continue
+            reading = {
+                'timestamp': timestamp,
+                'name': name,
+                'location': row.get('location', ''),
+                'available': _to_int(row.get('available')),
+                'capacity': _to_int(row.get('capacity')),
+            }
+            previous = self.latest.get(name)
+            if previous is None or timestamp >= previous['timestamp']:
+                self.latest[name] = reading
+            history = self.history.setdefault(name, deque())
+            history.append((timestamp, reading['available']))
+            while history and history[0][0] < timestamp - self.window:
+                history.popleft()
+            count += 1
+
+        # Remember where we stopped and what the file looked like just before it
+        checked = data[max(0, end - CHECK_BYTES):end]
+        self._check = (self._check + checked)[-CHECK_BYTES:] if end < CHECK_BYTES else checked
+        self.offset += end
+        self.rows_read += count
+        return count
+
+    def snapshot(self, locations=None):
+        """Frame with the latest reading per station (optionally only `locations`) and its trend.
+
+        `trend` is the change in free spaces over the last hour, `history` the
+        free spaces over the trend window (oldest first).
+        """
+        with self._lock:
+            readings = [dict(r) for r in self.latest.values()
+                        if locations is None or r['location'] in locations]
+            histories = {r['name']: list(self.history.get(r['name'], ())) for r in readings}
+        for r in readings:
+            points = [(t, v) for t, v in histories[r['name']] if v is not None]
+            hour_ago = [v for t, v in points if t <= r['timestamp'] - timedelta(hours=1)]
+            r['trend'] = (r['available'] - hour_ago[-1]
+                          if hour_ago and r['available'] is not None else None)
+            r['history'] = [v for _, v in points]
+        columns = ['name', 'location', 'available', 'capacity', 'trend', 'history', 'timestamp']
+        return pd.DataFrame(readings, columns=columns)
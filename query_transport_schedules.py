@@ -1,139 +1,306 @@
 #!/usr/bin/env python3
 """
 Query public transport schedules for the Dolomites region.
-Provides examples of how to work with the schedule data.
+Provides examples of how to work with the schedule data. Queries go through a
+TransportIndex, which loads the snapshot on first use; the module-level
+functions share one over the current snapshot.
 """
 
+import threading
+from datetime import date
+from functools import cached_property
+
+import numpy as np
 import pandas as pd
-from datetime import datetime, timedelta
-from pathlib import Path
 
-DATA_DIR = Path(__file__).parent / "data" / "transport"
+from schedule_index import ServiceCalendar
+from transport_snapshot import DATA_DIR, SNAPSHOT_DIR, load_snapshot, parse_gtfs_time
+
+TABLES = ['stops', 'routes', 'trips', 'stop_times', 'calendar', 'calendar_dates']
+
+
+class TransportIndex:
+    """Schedule queries over the transport tables, loaded on first use.
+
+    Tables come from snapshot `version` (the current one by default, the CSVs
+    without a snapshot), or from `tables` if given. Rows are looked up
+    through hash indexes (key -> row positions) on stop_id, trip_id and
+    route_id, built on first use, instead of scanning whole frames.
+    """
+
+    def __init__(self, version=None, tables=None, snapshot_dir=SNAPSHOT_DIR, data_dir=DATA_DIR):
+        self.version = version
+        self.snapshot_dir = snapshot_dir
+        self.data_dir = data_dir
+        self._tables = tables
+        self._lock = threading.Lock()
+
+    @property
+    def tables(self):
+        with self._lock:
+            if self._tables is None:
+                print("Loading transport data...")
+                self._tables = load_snapshot(TABLES, version=self.version,
+                                             snapshot_dir=self.snapshot_dir, data_dir=self.data_dir)
+                print(f"Loaded {len(self._tables['stops']):,} stops, {len(self._tables['routes']):,} routes, "
+                      f"{len(self._tables['trips']):,} trips, {len(self._tables['stop_times']):,} stop times")
+            return self._tables
+
+    @property
+    def stops_df(self):
+        return self.tables['stops']
+
+    @property
+    def routes_df(self):
+        return self.tables['routes']
+
+    @property
+    def trips_df(self):
+        return self.tables['trips']
+
+    @property
+    def stop_times_df(self):
+        return self.tables['stop_times']
+
+    @property
+    def calendar_df(self):
+        return self.tables['calendar']
+
+    @property
+    def calendar_dates_df(self):
+        return self.tables['calendar_dates']
+
+    @cached_property
+    def service_calendar(self):
+        """ServiceCalendar over trips_df: trip_mask(date) is aligned with its rows."""
+        return ServiceCalendar(self.calendar_df, self.calendar_dates_df, self.trips_df)
+
+    # -- Hash indexes: key -> row positions ---------------------------------
+    @staticmethod
+    def _positions(column):
+        """{value: row positions} over the non-null values of `column`."""
+        return pd.Series(np.arange(len(column))).groupby(column.to_numpy(), sort=False).indices
+
+    @cached_property
+    def stops_by_id(self):
+        return self._positions(self.stops_df['stop_id'])
+
+    @cached_property
+    def stops_by_name(self):
+        return self._positions(self.stops_df['stop_name'])
+
+    @cached_property
+    def stops_by_location(self):
+        return self._positions(self.stops_df['location'])
+
+    @cached_property
+    def stop_times_by_stop(self):
+        return self._positions(self.stop_times_df['stop_id'])
+
+    @cached_property
+    def stop_times_by_trip(self):
+        return self._positions(self.stop_times_df['trip_id'])
+
+    @cached_property
+    def trips_by_id(self):
+        return pd.Index(self.trips_df['trip_id'].to_numpy())
+
+    @cached_property
+    def trips_by_route(self):
+        return self._positions(self.trips_df['route_id'])
+
+    @cached_property
+    def routes_by_id(self):
+        return pd.Index(self.routes_df['route_id'].to_numpy())
+
+    @cached_property
+    def stop_time_trip_rows(self):
+        """trips_df row of each stop_times row (-1 if the trip is unknown)."""
+        return self.trips_by_id.get_indexer(self.stop_times_df['trip_id'])
+
+    @cached_property
+    def trip_route_rows(self):
+        """routes_df row of each trips row (-1 if the route is unknown)."""
+        return self.routes_by_id.get_indexer(self.trips_df['route_id'])
+
+    @cached_property
+    def routes_by_name(self):
+        return self._positions(self.routes_df['route_short_name'])
+
+    @staticmethod
+    def _lookup(index, keys):
+        """Sorted row positions of all `keys` in a position index."""
+        parts = [index[k] for k in keys if k in index]
+        return np.unique(np.concatenate(parts)) if parts else np.array([], dtype='int64')
+
+    @cached_property
+    def stop_names(self):
+        """Distinct stop names, searched by find_stops_by_name."""
+        return pd.Series(list(self.stops_by_name), dtype=self.stops_df['stop_name'].dtype)
+
+    @cached_property
+    def stop_locations(self):
+        """Distinct stop locations, searched by get_location_routes."""
+        return pd.Series(list(self.stops_by_location), dtype=self.stops_df['location'].dtype)
+
+    @staticmethod
+    def _matching(keys, query):
+        """`keys` containing `query` (case-insensitive), as str.contains."""
+        return keys[keys.str.contains(query, case=False, na=False)]
+
+    # -- Queries -------------------------------------------------------------
+    def find_stops_by_name(self, stop_name_query):
+        """Find stops matching a name query."""
+        rows = self._lookup(self.stops_by_name, self._matching(self.stop_names, stop_name_query))
+        return self.stops_df.iloc[rows]
+
+    def get_stop_schedule(self, stop_id, limit=20):
+        """Get upcoming departures from a specific stop."""
+        rows = self.stop_times_by_stop.get(stop_id, np.array([], dtype='int64'))
+
+        # Trip and route of each stop time (rows without a known trip/route dropped)
+        trip_rows = self.stop_time_trip_rows[rows]
+        route_rows = np.where(trip_rows >= 0, self.trip_route_rows[trip_rows], -1)
+        found = route_rows >= 0
+        rows, trip_rows, route_rows = rows[found], trip_rows[found], route_rows[found]
+
+        # Sort by departure time, then only build the first `limit` rows
+        order = np.argsort(self.stop_times_df['departure_secs'].to_numpy()[rows], kind='stable')[:limit]
+        trips = self.trips_df.iloc[trip_rows[order]]
+        routes = self.routes_df.iloc[route_rows[order]]
+        stop_schedule = self.stop_times_df.iloc[rows[order]].set_axis(order)
+        return stop_schedule.assign(
+            route_id=trips['route_id'].to_numpy(),
+            trip_headsign=trips['trip_headsign'].to_numpy(),
+            route_short_name=routes['route_short_name'].to_numpy(),
+            route_long_name=routes['route_long_name'].to_numpy(),
+            route_type=routes['route_type'].to_numpy(),
+        )
+
+    def get_route_stops(self, route_short_name):
+        """Get all stops served by a route."""
+        rows = self.routes_by_name.get(route_short_name)
+        if rows is None:
+            return None, None
+        route = self.routes_df.iloc[rows]
+        route_id = route.iloc[0]['route_id']
+
+        # Trips of the route, their stop times and their stops
+        route_trips = self.trips_df['trip_id'].iloc[self.trips_by_route.get(route_id, [])].unique()
+        stop_ids = self.stop_times_df['stop_id'].iloc[self._lookup(self.stop_times_by_trip, route_trips)].unique()
+        route_stops = self.stops_df.iloc[self._lookup(self.stops_by_id, stop_ids)]
+        return route, route_stops
+
+    def get_location_routes(self, location_name):
+        """Get all routes serving a specific location."""
+        location_rows = self._lookup(self.stops_by_location, self._matching(self.stop_locations, location_name))
+        if not len(location_rows):
+            return None
+
+        # Stop times at these stops -> trips -> routes
+        stop_ids = self.stops_df['stop_id'].iloc[location_rows].unique()
+        trip_rows = np.unique(self.stop_time_trip_rows[self._lookup(self.stop_times_by_stop, stop_ids)])
+        route_rows = np.unique(self.trip_route_rows[trip_rows[trip_rows >= 0]])
+        return self.routes_df.iloc[route_rows[route_rows >= 0]]
+
+    def find_connections(self, from_location, to_location, after_time="06:00:00", target_date=None,
+                         service_calendar=None):
+        """Find direct connections between two locations.
+
+        A trip connects the locations if it calls at an origin stop and later
+        (higher stop_sequence) at a destination stop; it boards at its first
+        origin stop departing at or after `after_time` and alights at the
+        first destination stop after that. With `target_date`, only trips
+        running on that date are kept, per `service_calendar` (by default the
+        feed's calendar and calendar_dates; any object with a trip_mask(date)
+        aligned with trips_df).
+        """
+        from_rows = self._lookup(self.stops_by_location, self._matching(self.stop_locations, from_location))
+        to_rows = self._lookup(self.stops_by_location, self._matching(self.stop_locations, to_location))
+        if not len(from_rows) or not len(to_rows):
+            return None
+
+        # Stop times at the origin (after `after_time`, on the date) and at the destination,
+        # keyed by trips_df row
+        stop_times_df = self.stop_times_df
+        stop_ids = self.stops_df['stop_id']
+        dep_rows = self._lookup(self.stop_times_by_stop, stop_ids.iloc[from_rows].unique())
+        arr_rows = self._lookup(self.stop_times_by_stop, stop_ids.iloc[to_rows].unique())
+        dep_trips = self.stop_time_trip_rows[dep_rows]
+        keep = (dep_trips >= 0) & (stop_times_df['departure_secs'].to_numpy()[dep_rows] >= parse_gtfs_time(after_time))
+        if target_date is not None:
+            active = (service_calendar or self.service_calendar).trip_mask(target_date)
+            keep &= active[dep_trips]
+        sequence = stop_times_df['stop_sequence'].to_numpy()
+        departures = pd.DataFrame({'trip': dep_trips[keep], 'seq_from': sequence[dep_rows[keep]],
+                                   'dep_row': dep_rows[keep]})
+        arrivals = pd.DataFrame({'trip': self.stop_time_trip_rows[arr_rows], 'seq_to': sequence[arr_rows],
+                                 'arr_row': arr_rows})
+
+        # One join on the trip; the destination must come after the origin on the trip.
+        # Per trip: the first origin visit with a later destination visit, and the first one after it
+        pairs = departures.merge(arrivals, on='trip')
+        pairs = pairs[pairs['seq_from'] < pairs['seq_to']]
+        pairs = pairs.iloc[np.lexsort((pairs['seq_to'], pairs['seq_from'], pairs['trip']))]
+        pairs = pairs[~pairs['trip'].duplicated()]
+
+        # Route of each trip, vectorized
+        route_rows = self.trip_route_rows[pairs['trip'].to_numpy()]
+        pairs, route_rows = pairs[route_rows >= 0], route_rows[route_rows >= 0]
+        routes = self.routes_df.iloc[route_rows]
+        departures = stop_times_df.iloc[pairs['dep_row'].to_numpy()]
+        arrivals = stop_times_df.iloc[pairs['arr_row'].to_numpy()]
+
+        connections = pd.DataFrame({
+            'route': routes['route_short_name'].to_numpy(),
+            'route_name': routes['route_long_name'].to_numpy(),
+            'departure': departures['departure_time'].to_numpy(),
+            'arrival': arrivals['arrival_time'].to_numpy(),
+            'departure_secs': departures['departure_secs'].to_numpy(),
+            'arrival_secs': arrivals['arrival_secs'].to_numpy(),
+            'trip_id': departures['trip_id'].to_numpy(),
+        })
+        # By departure time, ties in trips_df order
+        return connections.iloc[np.lexsort((pairs['trip'], connections['departure_secs']))].reset_index(drop=True)
+
+
+# Shared index over the current snapshot, loaded by the first query that needs it
+_default_index = None
+_default_lock = threading.Lock()
 
-# Load data files
-print("Loading transport data...")
-stops_df = pd.read_csv(DATA_DIR / "transport_stops.csv", encoding='utf-8')
-routes_df = pd.read_csv(DATA_DIR / "transport_routes.csv", encoding='utf-8')
-trips_df = pd.read_csv(DATA_DIR / "transport_trips.csv", encoding='utf-8')
-stop_times_df = pd.read_csv(DATA_DIR / "transport_stop_times.csv", encoding='utf-8')
-calendar_df = pd.read_csv(DATA_DIR / "transport_calendar.csv", encoding='utf-8')
 
-print(f"Loaded {len(stops_df):,} stops, {len(routes_df):,} routes, {len(trips_df):,} trips, {len(stop_times_df):,} stop times")
-print()
+def default_index():
+    """The TransportIndex behind the module-level query functions."""
+    global _default_index
+    with _default_lock:
+        if _default_index is None:
+            _default_index = TransportIndex()
+        return _default_index
 
 
 def find_stops_by_name(stop_name_query):
     """Find stops matching a name query."""
-    matches = stops_df[stops_df['stop_name'].str.contains(stop_name_query, case=False, na=False)]
-    return matches
+    return default_index().find_stops_by_name(stop_name_query)
 
 
 def get_stop_schedule(stop_id, limit=20):
     """Get upcoming departures from a specific stop."""
-    # Get stop times for this stop
-    stop_schedule = stop_times_df[stop_times_df['stop_id'] == stop_id].copy()
-
-    # Join with trips to get route info
-    stop_schedule = stop_schedule.merge(trips_df[['trip_id', 'route_id', 'trip_headsign']], on='trip_id')
-
-    # Join with routes to get route names
-    stop_schedule = stop_schedule.merge(routes_df[['route_id', 'route_short_name', 'route_long_name', 'route_type']], on='route_id')
-
-    # Sort by departure time
-    stop_schedule = stop_schedule.sort_values('departure_time')
-
-    return stop_schedule.head(limit)
+    return default_index().get_stop_schedule(stop_id, limit)
 
 
 def get_route_stops(route_short_name):
     """Get all stops served by a route."""
-    # Find the route
-    route = routes_df[routes_df['route_short_name'] == route_short_name]
-
-    if route.empty:
-        return None, None
-
-    route_id = route.iloc[0]['route_id']
-
-    # Find trips for this route
-    route_trips = trips_df[trips_df['route_id'] == route_id]['trip_id'].unique()
-
-    # Get stop times for these trips
-    route_stop_times = stop_times_df[stop_times_df['trip_id'].isin(route_trips)]
-
-    # Get unique stops
-    unique_stop_ids = route_stop_times['stop_id'].unique()
-    route_stops = stops_df[stops_df['stop_id'].isin(unique_stop_ids)]
-
-    return route, route_stops
+    return default_index().get_route_stops(route_short_name)
 
 
 def get_location_routes(location_name):
     """Get all routes serving a specific location."""
-    # Find stops in this location
-    location_stops = stops_df[stops_df['location'].str.contains(location_name, case=False, na=False)]
-
-    if location_stops.empty:
-        return None
-
-    # Get stop times for these stops
-    location_stop_times = stop_times_df[stop_times_df['stop_id'].isin(location_stops['stop_id'])]
-
-    # Get trips
-    trip_ids = location_stop_times['trip_id'].unique()
-    location_trips = trips_df[trips_df['trip_id'].isin(trip_ids)]
-
-    # Get routes
-    route_ids = location_trips['route_id'].unique()
-    location_routes = routes_df[routes_df['route_id'].isin(route_ids)]
-
-    return location_routes
-
-
-def find_connections(from_location, to_location, after_time="06:00:00"):
-    """Find connections between two locations."""
-    # Find stops in origin location
-    from_stops = stops_df[stops_df['location'].str.contains(from_location, case=False, na=False)]
-
-    # Find stops in destination location
-    to_stops = stops_df[stops_df['location'].str.contains(to_location, case=False, na=False)]
-
-    if from_stops.empty or to_stops.empty:
-        return None
-
-    # Get departures from origin
-    from_stop_times = stop_times_df[
-        (stop_times_df['stop_id'].isin(from_stops['stop_id'])) &
-        (stop_times_df['departure_time'] >= after_time)
-    ].copy()
-
-    # Get arrivals to destination
-    to_stop_times = stop_times_df[
-        stop_times_df['stop_id'].isin(to_stops['stop_id'])
-    ].copy()
-
-    # Find common trips (direct connections)
-    common_trips = set(from_stop_times['trip_id']) & set(to_stop_times['trip_id'])
-
-    connections = []
-    for trip_id in common_trips:
-        departure = from_stop_times[from_stop_times['trip_id'] == trip_id].iloc[0]
-        arrival = to_stop_times[to_stop_times['trip_id'] == trip_id].iloc[0]
-
-        # Get trip info
-        trip_info = trips_df[trips_df['trip_id'] == trip_id].iloc[0]
-        route_info = routes_df[routes_df['route_id'] == trip_info['route_id']].iloc[0]
-
-        connections.append({
-            'route': route_info['route_short_name'],
-            'route_name': route_info['route_long_name'],
-            'departure': departure['departure_time'],
-            'arrival': arrival['arrival_time'],
-            'trip_id': trip_id,
-        })
+    return default_index().get_location_routes(location_name)
 
-    return pd.DataFrame(connections).sort_values('departure')
 
+def find_connections(from_location, to_location, after_time="06:00:00", target_date=None):
+    """Find direct connections between two locations (optionally only on `target_date`)."""
+    return default_index().find_connections(from_location, to_location, after_time, target_date)
 
 # ============================================
 # Example Queries
@@ -187,6 +354,8 @@ if __name__ == "__main__":
         print(f"Found {len(connections)} direct connections after 08:00:")
         for idx, conn in connections.head(5).iterrows():
             print(f"  {conn['departure']:8s} to {conn['arrival']:8s} - Route {conn['route']:6s} ({conn['route_name']})")
+        running = find_connections("Corvara", "Badia", after_time="08:00:00", target_date=date.today())
+        print(f"  ... {len(running)} of them run today ({date.today():%d.%m.%Y})")
     else:
         print("No direct connections found")
     print()
@@ -213,5 +382,5 @@ if __name__ == "__main__":
     print("  - get_stop_schedule(stop_id)")
     print("  - get_route_stops(route_short_name)")
     print("  - get_location_routes(location_name)")
-    print("  - find_connections(from_location, to_location, after_time)")
+    print("  - find_connections(from_location, to_location, after_time, target_date)")
     print("=" * 70)
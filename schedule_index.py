@@ -0,0 +1,387 @@
+#!/usr/bin/env python3
+"""
+Precomputed schedule indexes for the Val Gardena app.
+Built once per snapshot version from the frames returned by
+val_gardena_app.load_data, so widget changes in the Schedules tab only slice
+integer arrays instead of filtering and merging the stop_times frame.
+"""
+
+import threading
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from transport_snapshot import WEEKDAYS
+
+
+def nbytes(obj, seen=None):
+    """Approximate memory held by `obj`: arrays, frames, containers of them and index objects.
+
+    Objects whose id is in `seen` are skipped and new ones added, so shared
+    frames are counted once across calls. If `seen` is a dict, it also maps
+    each new object's id to the bytes it holds itself (0 for containers).
+    ViewCache contents are not included; they report their own size.
+    """
+    if seen is None:
+        seen = set()
+    if id(obj) in seen or isinstance(obj, ViewCache):
+        return 0
+    if isinstance(seen, dict):
+        seen[id(obj)] = 0
+    else:
+        seen.add(id(obj))
+    if isinstance(obj, dict):
+        return sum(nbytes(v, seen) for v in obj.values())
+    if isinstance(obj, (list, tuple)):
+        return sum(nbytes(v, seen) for v in obj)
+    if isinstance(obj, np.ndarray):
+        size = obj.nbytes
+    elif isinstance(obj, pd.DataFrame):
+        size = int(obj.memory_usage(index=True, deep=True).sum())
+    elif isinstance(obj, (pd.Series, pd.Index)):
+        size = int(obj.memory_usage(deep=True))
+    elif isinstance(obj, str):
+        size = len(obj)
+    elif hasattr(obj, '__dict__'):
+        return nbytes(vars(obj), seen)
+    else:
+        size = 0
+    if isinstance(seen, dict):
+        seen[id(obj)] = size
+    return size
+
+
+class ViewCache:
+    """Least-recently-used cache of derived views with a memory budget.
+
+    Values are arrays or frames; their size is taken once on insert, and the
+    least recently used entries are evicted until the cache fits `max_bytes`.
+    Shared between sessions, so access is serialized with a lock.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key, value):
+        size = nbytes(value)
+        with self._lock:
+            if key in self._entries:
+                self.nbytes -= self._entries.pop(key)[1]
+            self._entries[key] = (value, size)
+            self.nbytes += size
+            while self.nbytes > self.max_bytes and len(self._entries) > 1:
+                self.nbytes -= self._entries.popitem(last=False)[1][1]
+
+
+class DepartureIndex:
+    """Departures per consolidated station, sorted by time.
+
+    For each station the index holds contiguous arrays (CSR layout, offsets in
+    `station_ptr`) of departure seconds, trip index, route code and
+    destination code, sorted by departure time. A query for departures after
+    T is a binary search in the station's slice plus a boolean trip mask for
+    the services running that day (ServiceCalendar.trip_mask, built from the
+    same trips frame).
+    """
+
+    def __init__(self, stations, stop_times_df, trips_df, routes_df, trip_destinations):
+        # Trip-level arrays (trip index = row of trips_df)
+        self.trip_ids = trips_df['trip_id'].astype(str).to_numpy()
+
+        route_ids = routes_df['route_id'].astype(str)
+        short_names = pd.Series(routes_df['route_short_name'].to_numpy(), index=route_ids)
+        trip_route_name = trips_df['route_id'].astype(str).map(short_names[~route_ids.duplicated().to_numpy()])
+        trip_route_name = trip_route_name.reset_index(drop=True)
+        self.route_names = pd.Index(trip_route_name.dropna().unique())
+        self.trip_route = self.route_names.get_indexer(trip_route_name)
+
+        dest_trip_ids = trip_destinations['trip_id'].astype(str)
+        destinations = pd.Series(trip_destinations['destination'].to_numpy(), index=dest_trip_ids)
+        trip_dest = pd.Series(self.trip_ids).map(destinations[~dest_trip_ids.duplicated().to_numpy()])
+        trip_dest = trip_dest.fillna('Route ' + trip_route_name)
+        self.destinations = pd.Index(trip_dest.dropna().unique())
+        self.trip_destination = self.destinations.get_indexer(trip_dest)
+
+        self.station_names = pd.Index(stations['stop_name'])
+        self.stop_station = pd.Series(
+            {stop_id: i for i, stop_ids in enumerate(stations['stop_ids']) for stop_id in stop_ids}, dtype='int64'
+        )
+
+        # Row-level arrays, grouped by station and sorted by time
+        rows, row_trip, row_station = self.encode_rows(stop_times_df)
+        row_dep = stop_times_df['departure_secs'].to_numpy()[rows]
+        order = np.lexsort((rows, row_dep, row_station))
+
+        self.row = rows[order]  # position in stop_times, breaks ties like the old merges
+        self.departure_secs = row_dep[order]
+        self.trip = row_trip[order]
+        self.route = self.trip_route[self.trip]
+        self.destination = self.trip_destination[self.trip]
+        self.station_ptr = np.searchsorted(row_station[order], np.arange(len(stations) + 1))
+
+    def encode_rows(self, stop_times_df):
+        """Positions, trip indexes and station indexes of the usable stop_times rows.
+
+        Rows at unknown stops or of trips without a route are dropped, like
+        the inner merges the schedule code used to do.
+        """
+        row_station = stop_times_df['stop_id'].astype(str).map(self.stop_station).fillna(-1).to_numpy(dtype='int64')
+        row_trip = pd.Index(self.trip_ids).get_indexer(stop_times_df['trip_id'].astype(str))
+        valid = (row_station >= 0) & (row_trip >= 0)
+        valid[valid] = self.trip_route[row_trip[valid]] >= 0
+        rows = np.flatnonzero(valid)
+        return rows, row_trip[rows], row_station[rows]
+
+    def departures(self, station_names, trip_mask, after_secs=None):
+        """Departures from any of `station_names` for trips in `trip_mask`.
+
+        Returns a frame with departure_secs, route_short_name, destination and
+        trip_id, in stop_times order.
+        """
+        positions = self.station_names.get_indexer(list(station_names))
+        slices = []
+        for pos in positions[positions >= 0]:
+            lo, hi = self.station_ptr[pos], self.station_ptr[pos + 1]
+            if after_secs is not None:
+                lo += np.searchsorted(self.departure_secs[lo:hi], after_secs, side='left')
+            slices.append(np.arange(lo, hi))
+        sel = np.concatenate(slices) if slices else np.array([], dtype='int64')
+        sel = sel[trip_mask[self.trip[sel]]]
+        sel = sel[np.argsort(self.row[sel], kind='stable')]
+
+        return pd.DataFrame({
+            'departure_secs': self.departure_secs[sel],
+            'route_short_name': self.route_names[self.route[sel]].to_numpy(dtype=object),
+            'destination': self.destinations[self.destination[sel]].to_numpy(dtype=object),
+            'trip_id': self.trip_ids[self.trip[sel]],
+        })
+
+
+class ServiceCalendar:
+    """Service x day bitmap over the feed's validity window.
+
+    Row i is the service of trip i in `trips_df`; column d is day d of the
+    window. Weekly calendar rules are expanded once and calendar_dates
+    exceptions applied on top (removals win over additions), so the trips
+    running on a date are a single column of the bitmap. Dates outside the
+    window have no service. Trip masks are kept per date in an LRU cache of
+    at most MAX_CACHED_BYTES.
+    """
+
+    MAX_CACHED_BYTES = 4 * 1024 * 1024
+
+    def __init__(self, calendar_df, calendar_dates_df, trips_df):
+        self.service_ids = pd.Index(pd.concat([
+            calendar_df['service_id'].astype(str), calendar_dates_df['service_id'].astype(str),
+            trips_df['service_id'].astype(str),
+        ]).unique())
+
+        bounds = pd.concat([calendar_df['start_date'], calendar_df['end_date'], calendar_dates_df['date']])
+        bounds = bounds[bounds > 0]
+        if bounds.empty:
+            self.first_day, n_days = date.today(), 0
+        else:
+            self.first_day = _parse_date(bounds.min())
+            n_days = (_parse_date(bounds.max()) - self.first_day).days + 1
+        days = [self.first_day + timedelta(days=d) for d in range(n_days)]
+        day_ints = np.array([int(d.strftime('%Y%m%d')) for d in days], dtype='int64')
+        day_weekdays = np.array([d.weekday() for d in days], dtype='int64')
+
+        # Weekly rules: weekday flag and date range, one row per calendar entry
+        flags = calendar_df[WEEKDAYS].to_numpy() == 1
+        starts = calendar_df['start_date'].to_numpy()[:, None]
+        ends = calendar_df['end_date'].to_numpy()[:, None]
+        weekly = flags[:, day_weekdays] & (day_ints >= starts) & (day_ints <= ends)
+
+        bitmap = np.zeros((len(self.service_ids), n_days), dtype=bool)
+        np.logical_or.at(bitmap, self.service_ids.get_indexer(calendar_df['service_id'].astype(str)), weekly)
+
+        # Exceptions: 1 = service added on that date, 2 = removed
+        exc_rows = self.service_ids.get_indexer(calendar_dates_df['service_id'].astype(str))
+        exc_days = np.searchsorted(day_ints, calendar_dates_df['date'].to_numpy())
+        exc_type = calendar_dates_df['exception_type'].to_numpy()
+        in_window = exc_days < n_days
+        in_window[in_window] = day_ints[exc_days[in_window]] == calendar_dates_df['date'].to_numpy()[in_window]
+        for exception_type, value in ((1, True), (2, False)):
+            sel = in_window & (exc_type == exception_type)
+            bitmap[exc_rows[sel], exc_days[sel]] = value
+
+        self.bitmap = bitmap
+        self.trip_service = self.service_ids.get_indexer(trips_df['service_id'].astype(str))
+        self.trip_masks = ViewCache(self.MAX_CACHED_BYTES)
+
+    def _day(self, target_date):
+        """Column of `target_date` in the bitmap, or None outside the window."""
+        day = (target_date - self.first_day).days
+        return day if 0 <= day < self.bitmap.shape[1] else None
+
+    def active_service_ids(self, target_date):
+        """Set of service_ids running on `target_date`."""
+        day = self._day(target_date)
+        if day is None:
+            return set()
+        return set(self.service_ids[self.bitmap[:, day]])
+
+    def trip_mask(self, target_date):
+        """Boolean array over trips: True for trips running on `target_date` (cached per date)."""
+        mask = self.trip_masks.get(target_date)
+        if mask is None:
+            day = self._day(target_date)
+            if day is None:
+                mask = np.zeros(len(self.trip_service), dtype=bool)
+            else:
+                mask = self.bitmap[:, day][self.trip_service]
+            self.trip_masks.put(target_date, mask)
+        return mask
+
+
+class ODIndex:
+    """Origin-destination lookups over a trip x station position table.
+
+    Stop visits are stored per trip in stop_sequence order (CSR layout, offsets
+    in `trip_ptr`), together with a sorted trip list per station. Trips from
+    A to B are the intersection of the two stations' trip lists, restricted to
+    the day's trips; per trip, the connection boards at the first visit to A
+    and alights at the first visit to B after it. Results are memoized per
+    (origins, destinations, date) in an LRU cache of at most MAX_CACHED_BYTES.
+    """
+
+    MAX_CACHED_BYTES = 32 * 1024 * 1024
+
+    def __init__(self, departure_index, stop_times_df, service_calendar):
+        self.departures = departure_index
+        self.calendar = service_calendar
+        n_trips = len(departure_index.trip_ids)
+        n_stations = len(departure_index.station_names)
+
+        rows, row_trip, row_station = departure_index.encode_rows(stop_times_df)
+        row_seq = stop_times_df['stop_sequence'].to_numpy()[rows]
+        order = np.lexsort((row_seq, row_trip))
+        self.station = row_station[order]
+        self.stop_sequence = row_seq[order]
+        self.arrival_secs = stop_times_df['arrival_secs'].to_numpy()[rows][order]
+        self.departure_secs = stop_times_df['departure_secs'].to_numpy()[rows][order]
+        self.trip_ptr = np.searchsorted(row_trip[order], np.arange(n_trips + 1))
+
+        # Sorted, unique trips per station
+        visits = np.unique(row_station.astype('int64') * n_trips + row_trip)
+        self.station_trips = visits % n_trips
+        self.station_trip_ptr = np.searchsorted(visits // n_trips, np.arange(n_stations + 1))
+
+        # Trip order used to break departure-time ties (trip_id order, as before)
+        self.trip_rank = np.argsort(np.argsort(departure_index.trip_ids, kind='stable'))
+        self.results = ViewCache(self.MAX_CACHED_BYTES)
+
+    def _trips_at(self, stations):
+        """Sorted unique trips visiting any of `stations`."""
+        parts = [self.station_trips[self.station_trip_ptr[s]:self.station_trip_ptr[s + 1]] for s in stations]
+        return np.unique(np.concatenate(parts)) if parts else np.array([], dtype='int64')
+
+    def connections(self, origin_names, dest_names, target_date):
+        """Trips from any origin station to any destination station on `target_date`.
+
+        Returns a frame with departure_secs (at the origin), route_short_name,
+        destination, arrival_secs (at the destination) and trip_id, sorted by
+        departure time. The frame is shared between callers; do not modify it.
+        """
+        key = (tuple(origin_names), tuple(dest_names), target_date)
+        result = self.results.get(key)
+        if result is None:
+            result = self._connections(origin_names, dest_names, target_date)
+            self.results.put(key, result)
+        return result
+
+    def _connections(self, origin_names, dest_names, target_date):
+        index = self.departures
+        origins = index.station_names.get_indexer(list(origin_names))
+        dests = index.station_names.get_indexer(list(dest_names))
+        origins, dests = origins[origins >= 0], dests[dests >= 0]
+
+        trips = np.intersect1d(self._trips_at(origins), self._trips_at(dests), assume_unique=True)
+        trips = trips[self.calendar.trip_mask(target_date)[trips]]
+        board = alight = trips
+        if trips.size:
+            # Stop visits of the candidate trips, each trip a run in sequence order
+            starts = self.trip_ptr[trips]
+            sizes = self.trip_ptr[trips + 1] - starts
+            run_start = np.cumsum(sizes) - sizes
+            visits = np.repeat(starts - run_start, sizes) + np.arange(sizes.sum())
+            local = np.arange(len(visits))
+            none = len(visits)
+
+            # Board at the first origin visit, alight at the first destination visit after it
+            first_origin = np.minimum.reduceat(np.where(np.isin(self.station[visits], origins), local, none), run_start)
+            board_seq = np.where(first_origin < none, self.stop_sequence[visits[np.minimum(first_origin, none - 1)]],
+                                 np.iinfo('int64').max)
+            alights = np.isin(self.station[visits], dests) & (self.stop_sequence[visits] > np.repeat(board_seq, sizes))
+            first_dest = np.minimum.reduceat(np.where(alights, local, none), run_start)
+
+            ok = first_dest < none
+            trips, board, alight = trips[ok], visits[first_origin[ok]], visits[first_dest[ok]]
+            order = np.lexsort((self.trip_rank[trips], self.departure_secs[board]))
+            trips, board, alight = trips[order], board[order], alight[order]
+
+        return pd.DataFrame({
+            'departure_secs': self.departure_secs[board],
+            'route_short_name': index.route_names[index.trip_route[trips]].to_numpy(dtype=object),
+            'destination': index.destinations[index.trip_destination[trips]].to_numpy(dtype=object),
+            'arrival_secs': self.arrival_secs[alight],
+            'trip_id': index.trip_ids[trips],
+        })
+
+
+def _parse_date(value):
+    """YYYYMMDD int -> date."""
+    return datetime.strptime(str(int(value)), '%Y%m%d').date()
+
+
+def proximity_dedup(routes, minutes, window=2):
+    """Boolean keep-mask for "same route within `window` minutes = same bus".
+
+    Rows are taken in the given order. A row is dropped when it has the same
+    route as the last kept row and departs less than `window` minutes after
+    it. Dropping only happens within runs of consecutive rows with the same
+    route, and `minutes` must be non-decreasing within each run (true for rows
+    sorted by route then time, or by time alone). Within a run, each kept row
+    anchors the next one: the first row at least `window` minutes later.
+    """
+    routes = np.asarray(routes, dtype=object)
+    minutes = np.asarray(minutes, dtype='int64')
+    n = len(minutes)
+    keep = np.zeros(n, dtype=bool)
+    if n == 0:
+        return keep
+
+    run_start = np.flatnonzero(np.r_[True, routes[1:] != routes[:-1]])
+    run_end = np.append(run_start[1:], n)
+    run_id = np.repeat(np.arange(len(run_start)), run_end - run_start)
+
+    # (run, minutes) is sorted, so the next anchor of every row is one binary search
+    span = int(minutes.max() - minutes.min()) + window + 1
+    key = run_id * span + (minutes - minutes.min())
+    next_anchor = np.searchsorted(key, key + window, side='left')
+
+    # Follow the anchors of all runs at once, one kept row per run per step
+    anchors = run_start
+    while anchors.size:
+        keep[anchors] = True
+        ends = run_end[run_id[anchors]]
+        anchors = next_anchor[anchors]
+        anchors = anchors[anchors < ends]
+    return keep
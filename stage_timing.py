@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Per-stage latency tracking for the Val Gardena app.
+Each rerun of main() is split into named stages (data load, schedule lookup,
+SVG rendering, table rendering, ...) by calling a lap timer after each one.
+Durations are kept in a rolling window per stage for p50/p95, and every rerun
+can be appended as one line to a JSONL log.
+"""
+
+import json
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+WINDOW = 200
+
+
+class RunTimer:
+    """Lap timer for one rerun: each call charges the time since the previous lap to `stage`."""
+
+    def __init__(self, timings):
+        self.timings = timings
+        self.start = self.last = time.perf_counter()
+        self.stages = {}
+
+    def __call__(self, stage):
+        now = time.perf_counter()
+        self.stages[stage] = self.stages.get(stage, 0.0) + now - self.last
+        self.last = now
+
+    def finish(self, **fields):
+        """Record the run; `fields` (e.g. snapshot version) are added to its log line."""
+        self.timings.record(self.stages, time.perf_counter() - self.start, fields)
+
+
+class StageTimings:
+    """Rolling per-stage durations over the last `window` reruns, shared by all sessions."""
+
+    def __init__(self, window=WINDOW, log_path=None):
+        self.window = window
+        self.log_path = log_path
+        self.samples = {}
+        self._lock = threading.Lock()
+
+    def start_run(self):
+        return RunTimer(self)
+
+    def record(self, stages, total, fields=None):
+        """Add one rerun's stage durations (seconds) and append it to the log, if any."""
+        with self._lock:
+            for stage, seconds in list(stages.items()) + [('total', total)]:
+                self.samples.setdefault(stage, deque(maxlen=self.window)).append(seconds * 1000)
+            if self.log_path:
+                line = {
+                    'time': datetime.now().isoformat(timespec='seconds'),
+                    **(fields or {}),
+                    'total_ms': round(total * 1000, 1),
+                    'stages_ms': {stage: round(seconds * 1000, 1) for stage, seconds in stages.items()},
+                }
+                try:
+                    with open(self.log_path, 'a') as f:
+                        f.write(json.dumps(line) + '\n')
+                except OSError as e:
+                    print(f"Could not write timing log {self.log_path}: {e}")
+
+    def summary(self):
+        """Frame with one row per stage: reruns seen, p50 and p95 in milliseconds."""
+        with self._lock:
+            samples = {stage: np.array(values) for stage, values in self.samples.items()}
+        rows = [
+            {'Stage': stage, 'Runs': len(values),
+             'p50 ms': round(float(np.percentile(values, 50)), 1),
+             'p95 ms': round(float(np.percentile(values, 95)), 1)}
+            for stage, values in samples.items()
+        ]
+        return pd.DataFrame(rows, columns=['Stage', 'Runs', 'p50 ms', 'p95 ms'])
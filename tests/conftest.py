@@ -0,0 +1,11 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+# The modules live at the repository root
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# App tests write their snapshots to a scratch data directory, never to data/transport
+os.environ["VG_TRANSPORT_DIR"] = tempfile.mkdtemp(prefix="vg-tests-")
+os.environ["VG_GTFS_REFRESH"] = "0"
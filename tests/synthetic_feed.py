@@ -0,0 +1,108 @@
+"""Random GTFS feeds with the snapshot dtypes, for comparing the indexes with straightforward reference code."""
+
+import numpy as np
+import pandas as pd
+
+from transport_snapshot import SCHEMA, apply_schema
+
+WEEKDAYS = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+STOP_NAMES = ['Ortisei, Stazione', 'Ortisei, Sarteur', 'S. Cristina, Centro', 'Selva, Ciampinei',
+              'Selva, Centro', 'Bolzano, Stazione', 'Ponte Gardena, Stazione']
+LOCATIONS = ['St. Ulrich', 'St. Ulrich', 'St. Christina', 'Wolkenstein', 'Wolkenstein', 'Bolzano', 'Ponte Gardena']
+HEADSIGNS = ['Selva', 'Ortisei', 'Bolzano', None, ' ']
+
+
+def _table(name, frame):
+    for column in SCHEMA[name]:
+        if column not in frame:
+            frame[column] = None
+    return apply_schema(name, frame[list(SCHEMA[name])])
+
+
+def _clock(secs):
+    return [f'{s // 3600:02d}:{s // 60 % 60:02d}:{s % 60:02d}' for s in secs]
+
+
+def random_feed(seed, n_trips=60):
+    """Tables in the shape of a snapshot: stations with several stops, repeated visits, ties in time and place.
+
+    Stop rows are shuffled, stop_sequence has gaps, some trips are circular,
+    two routes have no headsign at all and calendar_dates both adds and
+    removes service days.
+    """
+    rng = np.random.default_rng(seed)
+    n_stops = 12
+    name_of = rng.integers(0, len(STOP_NAMES), n_stops)
+    stops = _table('stops', pd.DataFrame({
+        'stop_id': [f's{i}' for i in range(n_stops)],
+        'stop_name': [STOP_NAMES[n] for n in name_of],
+        # A coarse grid, so distances tie
+        'stop_lat': 46.5 + rng.integers(0, 4, n_stops) * 0.02,
+        'stop_lon': 11.5 + rng.integers(0, 4, n_stops) * 0.05,
+        'location': [LOCATIONS[n] for n in name_of],
+        'region': ['Val Gardena' if LOCATIONS[n] in ('St. Ulrich', 'St. Christina', 'Wolkenstein') else 'Other'
+                   for n in name_of],
+    }))
+
+    routes = _table('routes', pd.DataFrame({
+        'route_id': [f'r{i}' for i in range(7)],
+        'route_short_name': ['350', '352', '170', '350', '471', '172', '352'],
+        'route_long_name': [f'Route {i}' for i in range(7)],
+    }))
+
+    route_of = rng.integers(0, 7, n_trips)
+    trips = _table('trips', pd.DataFrame({
+        'trip_id': [f't{i:02d}' for i in range(n_trips)],
+        'route_id': [f'r{i}' for i in route_of],
+        'service_id': [f'v{i}' for i in rng.integers(0, 5, n_trips)],
+        # No trip of r5 and r6 has a headsign
+        'trip_headsign': [HEADSIGNS[i] if r < 5 else None
+                          for i, r in zip(rng.integers(0, len(HEADSIGNS), n_trips), route_of)],
+    }))
+
+    rows = []
+    for trip in trips['trip_id'].astype(str):
+        n_visits = int(rng.integers(1, 8))
+        visits = rng.integers(0, n_stops, n_visits)
+        if n_visits > 2 and rng.random() < 0.3:
+            visits[-1] = visits[0]
+        sequence = np.cumsum(rng.integers(1, 3, n_visits))
+        # Minute steps from 06:00, so departures tie across trips; a stop is
+        # reached no earlier than the previous one is left
+        dwell = rng.integers(0, 2, n_visits) * 60
+        ride = rng.integers(0, 4, n_visits) * 60
+        arrival = 6 * 3600 + int(rng.integers(0, 60)) * 60 + np.cumsum(ride + np.r_[0, dwell[:-1]])
+        departure = arrival + dwell
+        for stop, seq, arr, dep in zip(visits, sequence, arrival, departure):
+            rows.append((trip, f's{stop}', seq, arr, dep))
+    stop_times = pd.DataFrame(rows, columns=['trip_id', 'stop_id', 'stop_sequence', 'arrival_secs', 'departure_secs'])
+    stop_times = stop_times.sample(frac=1, random_state=seed).reset_index(drop=True)
+    stop_times['arrival_time'] = _clock(stop_times['arrival_secs'])
+    stop_times['departure_time'] = _clock(stop_times['departure_secs'])
+    stop_times = _table('stop_times', stop_times)
+
+    # v4 only runs on the days calendar_dates adds
+    calendar = _table('calendar', pd.DataFrame({
+        'service_id': [f'v{i}' for i in range(4)],
+        **{day: rng.integers(0, 2, 4) for day in WEEKDAYS},
+        'start_date': [20260101, 20260301, 20260101, 20260601],
+        'end_date': [20261231, 20260630, 20260531, 20261231],
+    }))
+    days = pd.date_range('2026-05-25', '2026-06-14').strftime('%Y%m%d').astype(int)
+    calendar_dates = _table('calendar_dates', pd.DataFrame({
+        'service_id': [f'v{i}' for i in rng.integers(0, 5, 20)],
+        'date': rng.choice(days, 20),
+        'exception_type': rng.integers(1, 3, 20),
+    }).drop_duplicates(['service_id', 'date']))
+
+    return {'stops': stops, 'routes': routes, 'trips': trips, 'stop_times': stop_times,
+            'calendar': calendar, 'calendar_dates': calendar_dates}
+
+
+def feed_stations(stops):
+    """Consolidated stations of `stops`: one per stop name, with its stop_ids."""
+    names = stops['stop_name'].unique()
+    return pd.DataFrame({
+        'stop_name': names,
+        'stop_ids': [stops.loc[stops['stop_name'] == name, 'stop_id'].astype(str).tolist() for name in names],
+    })
@@ -0,0 +1,76 @@
+from datetime import date
+
+import pandas as pd
+
+import val_gardena_app as app
+from transport_snapshot import SCHEMA, apply_schema, diff_tables, write_snapshot
+
+DAY = date(2026, 6, 1)
+
+
+def _table(name, **columns):
+    frame = pd.DataFrame(columns)
+    for column in SCHEMA[name]:
+        if column not in frame:
+            frame[column] = None
+    return apply_schema(name, frame[list(SCHEMA[name])])
+
+
+def _feed():
+    """Three trips between two Ortisei stops (t2's service never runs), and a stop no trip serves."""
+    stops = _table('stops', stop_id=['a', 'b', 'c'],
+                   stop_name=['Ortisei, Stazione', 'Ortisei, Sarteur', 'Bolzano, Stazione'],
+                   stop_lat=[46.575, 46.585, 46.496], stop_lon=[11.67, 11.68, 11.358],
+                   location=['St. Ulrich', 'St. Ulrich', 'Bolzano'], region=['Val Gardena', 'Val Gardena', 'Bolzano'])
+    routes = _table('routes', route_id=['r1'], route_short_name=['1'], route_long_name=['Ortisei'])
+    trips = _table('trips', trip_id=['t1', 't2', 't3'], route_id=['r1'] * 3,
+                   service_id=['daily', 'never', 'daily'], trip_headsign=['Sarteur'] * 3)
+    stop_times = _table('stop_times', trip_id=['t1', 't1', 't2', 't2', 't3', 't3'],
+                        stop_id=['a', 'b'] * 3, stop_sequence=[1, 2] * 3,
+                        arrival_time=['08:00:00', '08:05:00', '09:00:00', '09:05:00', '10:00:00', '10:05:00'],
+                        departure_time=['08:00:00', '08:05:00', '09:00:00', '09:05:00', '10:00:00', '10:05:00'],
+                        arrival_secs=[28800, 29100, 32400, 32700, 36000, 36300],
+                        departure_secs=[28800, 29100, 32400, 32700, 36000, 36300],
+                        pickup_type=0, drop_off_type=0)
+    calendar = _table('calendar', service_id=['daily', 'never'],
+                      **{day: [1, 0] for day in ['monday', 'tuesday', 'wednesday', 'thursday', 'friday',
+                                                 'saturday', 'sunday']},
+                      start_date=[20260101, 20260101], end_date=[20261231, 20261231])
+    calendar_dates = _table('calendar_dates', service_id=[], date=[], exception_type=[])
+    return {'stops': stops, 'routes': routes, 'trips': trips, 'stop_times': stop_times,
+            'calendar': calendar, 'calendar_dates': calendar_dates}
+
+
+def test_service_calendar_follows_the_trip_list_after_a_stop_times_refresh():
+    old = _feed()
+    base = write_snapshot(old)['version']
+    app.touch_cache(base)
+    assert app.load_service_calendar(base).trip_mask(DAY).tolist() == [True, False, True]
+
+    # Only stop_times changes: t1 no longer calls in Val Gardena, so the app's trip list shrinks
+    new = dict(old, stop_times=old['stop_times'][old['stop_times']['trip_id'] != 't1'].reset_index(drop=True))
+    version = write_snapshot(new, diff_tables(old, new))['version']
+    app.touch_cache(version)
+    index = app.load_departure_index(version)
+    mask = app.load_service_calendar(version).trip_mask(DAY)
+    assert dict(zip(index.trip_ids, mask.tolist())) == {'t2': False, 't3': True}
+
+
+def test_objects_shared_with_the_base_version_count_once():
+    old = _feed()
+    base = write_snapshot(old)['version']
+    app.touch_cache(base)
+    app.load_departure_index(base)
+
+    # Only calendar_dates changes: the tables and the departure index are shared
+    calendar_dates = _table('calendar_dates', service_id=['never'], date=[20260601], exception_type=[1])
+    new = dict(old, calendar_dates=calendar_dates)
+    version = write_snapshot(new, diff_tables(old, new))['version']
+    app.touch_cache(version)
+    app.load_data(version)
+    assert app.load_departure_index(version) is app.load_departure_index(base)
+
+    versions = app._cache_usage()['versions']
+    alone = {v: app.cache_nbytes({v: versions[v]}) for v in (base, version)}
+    both = app.cache_nbytes({v: versions[v] for v in (base, version)})
+    assert max(alone.values()) < both < alone[base] + alone[version]
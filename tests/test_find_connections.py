@@ -0,0 +1,82 @@
+from datetime import date
+
+import pandas as pd
+import pytest
+
+from query_transport_schedules import TransportIndex, parse_gtfs_time
+from synthetic_feed import random_feed
+
+COLUMNS = ['route', 'route_name', 'departure', 'arrival', 'departure_secs', 'arrival_secs', 'trip_id']
+
+
+def _running_services(feed, target_date):
+    """Services running on `target_date`, by the GTFS calendar rules, row by row."""
+    day = int(target_date.strftime('%Y%m%d'))
+    weekday = target_date.strftime('%A').lower()
+    running = {str(row['service_id']) for row in feed['calendar'].to_dict('records')
+               if row[weekday] == 1 and row['start_date'] <= day <= row['end_date']}
+    for row in feed['calendar_dates'].to_dict('records'):
+        if row['date'] == day and row['exception_type'] == 1:
+            running.add(str(row['service_id']))
+    for row in feed['calendar_dates'].to_dict('records'):
+        if row['date'] == day and row['exception_type'] == 2:
+            running.discard(str(row['service_id']))
+    return running
+
+
+def _reference_connections(feed, from_location, to_location, after_time, target_date):
+    """The old per-trip loop, with the stop_sequence check and the date filter."""
+    stops = feed['stops']
+    from_ids = set(stops[stops['location'].str.contains(from_location, case=False, na=False)]['stop_id'].astype(str))
+    to_ids = set(stops[stops['location'].str.contains(to_location, case=False, na=False)]['stop_id'].astype(str))
+    after_secs = parse_gtfs_time(after_time)
+    running = _running_services(feed, target_date) if target_date is not None else None
+    routes = {route['route_id']: route for route in feed['routes'].to_dict('records')}
+    visits = {}
+    for visit in feed['stop_times'].sort_values('stop_sequence').astype({'stop_id': str}).to_dict('records'):
+        visits.setdefault(visit['trip_id'], []).append(visit)
+
+    connections = []
+    for trip in feed['trips'].to_dict('records'):
+        if running is not None and str(trip['service_id']) not in running:
+            continue
+        found = None
+        for departure in visits.get(trip['trip_id'], []):
+            if departure['stop_id'] not in from_ids or departure['departure_secs'] < after_secs:
+                continue
+            for arrival in visits[trip['trip_id']]:
+                if arrival['stop_id'] in to_ids and arrival['stop_sequence'] > departure['stop_sequence']:
+                    found = departure, arrival
+                    break
+            if found:
+                break
+        if found:
+            departure, arrival = found
+            route = routes[trip['route_id']]
+            connections.append([route['route_short_name'], route['route_long_name'], departure['departure_time'],
+                                arrival['arrival_time'], departure['departure_secs'], arrival['arrival_secs'],
+                                trip['trip_id']])
+    return pd.DataFrame(connections, columns=COLUMNS).sort_values('departure_secs', kind='stable')
+
+
+def _plain(frame):
+    frame = frame[COLUMNS].reset_index(drop=True)
+    return frame.astype({'departure': str, 'arrival': str, 'trip_id': str,
+                         'departure_secs': 'int64', 'arrival_secs': 'int64'})
+
+
+@pytest.mark.parametrize('seed', range(2))
+def test_join_matches_the_trip_loop(seed):
+    feed = random_feed(seed)
+    index = TransportIndex(tables=feed)
+    locations = ['St. Ulrich', 'Wolkenstein', 'Bolzano', 'St.']
+    for from_location in locations:
+        for to_location in locations:
+            for after_time in ('06:00:00', '06:40:00'):
+                for target_date in (None, date(2026, 6, 1), date(2026, 6, 6)):
+                    result = index.find_connections(from_location, to_location, after_time, target_date)
+                    expected = _reference_connections(feed, from_location, to_location, after_time, target_date)
+                    if result is None:
+                        assert expected.empty
+                        continue
+                    pd.testing.assert_frame_equal(_plain(result), _plain(expected), check_dtype=False)
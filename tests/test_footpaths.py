@@ -0,0 +1,35 @@
+import pandas as pd
+
+from footpaths import MAX_WALK_SECS, FootpathGraph, closed_walks
+
+
+def _line_of_stops(n, spacing_deg=0.0018):
+    """`n` stops on a north-south line, ~200 m apart."""
+    return pd.DataFrame({
+        'stop_id': [f's{i}' for i in range(n)],
+        'stop_name': [f'Stop {i}' for i in range(n)],
+        'stop_lat': [46.5 + i * spacing_deg for i in range(n)],
+        'stop_lon': [11.7] * n,
+    })
+
+
+def test_links_only_nearby_stops():
+    graph = FootpathGraph(_line_of_stops(4))
+    assert len(graph) == 6  # neighbours only, both directions
+    assert (graph.edges['walk_secs'] <= MAX_WALK_SECS).all()
+
+
+def test_closed_walks_stay_within_cap():
+    stops = _line_of_stops(6)
+    walks = FootpathGraph(stops).station_walks(dict(zip(stops['stop_id'], stops['stop_name'])))
+    closed = closed_walks(walks)
+    assert all(secs <= MAX_WALK_SECS for links in closed.values() for secs in links.values())
+    # Chains of two ~217 s links are over the cap, so nothing beyond the neighbours
+    assert set(closed['Stop 2']) == {'Stop 1', 'Stop 3'}
+
+
+def test_closed_walks_joins_short_chains():
+    walks = {'A': {'B': 100}, 'B': {'A': 100, 'C': 120}, 'C': {'B': 120}}
+    closed = closed_walks(walks)
+    assert closed['A'] == {'B': 100, 'C': 220}
+    assert closed_walks(walks, max_walk_secs=200)['A'] == {'B': 100}
@@ -0,0 +1,70 @@
+from datetime import date
+
+import numpy as np
+import pytest
+
+from footpaths import closed_walks
+from isochrones import ConnectionScan
+from journey_planner import INF, MIN_TRANSFER_SECS
+from schedule_index import DepartureIndex, ODIndex, ServiceCalendar
+from synthetic_feed import feed_stations, random_feed
+from val_gardena_app import compute_trip_destinations
+
+
+def _reference_arrivals(scan, walks, origin, target_date, depart_secs, minutes):
+    """Sequential connection scan in departure order, one connection at a time."""
+    names = scan.index.station_names
+    walks = {names.get_loc(a): [(names.get_loc(b), secs) for b, secs in others.items()]
+             for a, others in closed_walks(walks).items()}
+    best = np.full(len(names), INF, dtype='int64')
+    ready, bus_best = best.copy(), best.copy()
+    end = depart_secs + minutes * 60
+    o = names.get_loc(origin)
+    best[o] = ready[o] = depart_secs
+    for station, secs in walks.get(o, ()):
+        best[station] = ready[station] = depart_secs + secs
+    active = scan.calendar.trip_mask(target_date)
+    on_trip = set()
+    for c in range(len(scan.dep)):
+        trip, a, b, dep, arr = scan.trip[c], scan.from_station[c], scan.to_station[c], scan.dep[c], scan.arr[c]
+        if dep < depart_secs or arr > end or not active[trip]:
+            continue
+        if trip not in on_trip and ready[a] > dep:
+            continue
+        on_trip.add(trip)
+        if arr >= bus_best[b]:
+            continue
+        bus_best[b] = arr
+        best[b] = min(best[b], arr)
+        ready[b] = min(ready[b], arr + MIN_TRANSFER_SECS)
+        for station, secs in walks.get(b, ()):
+            if arr + secs <= end:
+                best[station] = min(best[station], arr + secs)
+                ready[station] = min(ready[station], arr + max(secs, MIN_TRANSFER_SECS))
+    return best
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_rounds_match_the_sequential_scan(seed):
+    feed = random_feed(seed, n_trips=150)
+    stations = feed_stations(feed['stops'])
+    destinations = compute_trip_destinations(feed['stop_times'], feed['stops'], feed['trips'])
+    index = DepartureIndex(stations, feed['stop_times'], feed['trips'], feed['routes'], destinations)
+    calendar = ServiceCalendar(feed['calendar'], feed['calendar_dates'], feed['trips'])
+    names = list(stations['stop_name'])
+    # Random symmetric walking links, some shorter than the minimum change time
+    rng = np.random.default_rng(seed)
+    walks = {}
+    for i, a in enumerate(names):
+        for b in names[i + 1:]:
+            if rng.random() < 0.3:
+                secs = int(rng.integers(30, 300))
+                walks.setdefault(a, {})[b] = walks.setdefault(b, {})[a] = secs
+    scan = ConnectionScan(ODIndex(index, feed['stop_times'], calendar), walks)
+
+    for target_date in (date(2026, 6, 1), date(2026, 6, 6)):
+        for depart_secs, minutes in ((6 * 3600, 30), (6 * 3600 + 900, 60), (5 * 3600, 240)):
+            batch = scan.earliest_arrivals(names, target_date, depart_secs, minutes)
+            for k, origin in enumerate(names):
+                expected = _reference_arrivals(scan, walks, origin, target_date, depart_secs, minutes)
+                assert np.array_equal(batch[k], expected), (origin, target_date, depart_secs, minutes)
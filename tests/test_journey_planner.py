@@ -0,0 +1,54 @@
+from datetime import date
+
+import pandas as pd
+
+from journey_planner import JourneyPlanner
+from schedule_index import DepartureIndex, ODIndex, ServiceCalendar
+
+DAY = date(2026, 6, 1)
+
+
+def _planner(walks):
+    """One trip A -> B -> D at 08:00, 08:02 and 08:10, running every day."""
+    stations = pd.DataFrame({
+        'stop_name': ['A', 'B', 'C', 'D'],
+        'stop_ids': [['a'], ['b'], ['c'], ['d']],
+    })
+    routes = pd.DataFrame({'route_id': ['r1'], 'route_short_name': ['1']})
+    trips = pd.DataFrame({'trip_id': ['t1'], 'route_id': ['r1'], 'service_id': ['s1']})
+    stop_times = pd.DataFrame({
+        'trip_id': ['t1'] * 3,
+        'stop_id': ['a', 'b', 'd'],
+        'stop_sequence': [1, 2, 3],
+        'arrival_secs': [28800, 28920, 29400],
+        'departure_secs': [28800, 28920, 29400],
+    })
+    calendar = pd.DataFrame({
+        'service_id': ['s1'],
+        **{day: [1] for day in ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']},
+        'start_date': [20260101],
+        'end_date': [20261231],
+    })
+    calendar_dates = pd.DataFrame({'service_id': [], 'date': [], 'exception_type': []})
+    destinations = pd.DataFrame({'trip_id': ['t1'], 'destination': ['D']})
+    departures = DepartureIndex(stations, stop_times, trips, routes, destinations)
+    od_index = ODIndex(departures, stop_times, ServiceCalendar(calendar, calendar_dates, trips))
+    return JourneyPlanner(od_index, walks)
+
+
+def test_boards_at_origin_instead_of_walking_along_the_route():
+    planner = _planner({'A': {'B': 9}, 'B': {'A': 9}})
+    journeys = planner.earliest_arrival(['A'], ['D'], DAY, 28500)
+    legs = journeys[0]['legs']
+    assert journeys[0]['arrival_secs'] == 29400
+    assert legs['trip_id'].tolist() == ['t1']
+    assert legs['from'].tolist() == ['A']
+
+
+def test_walks_to_a_trip_that_does_not_serve_the_origin():
+    planner = _planner({'C': {'B': 60}, 'B': {'C': 60}})
+    journeys = planner.earliest_arrival(['C'], ['D'], DAY, 28500)
+    legs = journeys[0]['legs']
+    assert legs['route_short_name'].tolist() == ['Walk', '1']
+    assert legs['from'].tolist() == ['C', 'B']
+    assert legs['arrival_secs'].tolist() == [28920, 29400]
@@ -0,0 +1,54 @@
+from datetime import date
+
+import pandas as pd
+import pytest
+
+from schedule_index import DepartureIndex, ODIndex, ServiceCalendar
+from synthetic_feed import feed_stations, random_feed
+from val_gardena_app import compute_trip_destinations
+
+
+def _reference_connections(feed, stations, destinations, trip_mask, origin_names, dest_names):
+    """The stop_times merge the From -> To schedule ran before ODIndex."""
+    stop_ids = lambda names: sum(stations[stations['stop_name'].isin(names)]['stop_ids'].tolist(), [])
+    active = feed['stop_times'][feed['stop_times']['trip_id'].isin(feed['trips']['trip_id'][trip_mask])]
+    origin_st = active[active['stop_id'].isin(stop_ids(origin_names))][
+        ['trip_id', 'stop_id', 'stop_sequence', 'departure_secs']
+    ]
+    dest_st = active[active['stop_id'].isin(stop_ids(dest_names))][['trip_id', 'stop_sequence', 'arrival_secs']]
+    merged = origin_st.merge(dest_st, on='trip_id', suffixes=('_orig', '_dest'))
+    valid = merged[merged['stop_sequence_dest'] > merged['stop_sequence_orig']]
+    valid = valid.sort_values(['trip_id', 'stop_sequence_orig', 'stop_sequence_dest'])
+    per_trip = valid.drop_duplicates('trip_id', keep='first')
+    per_trip = per_trip.merge(
+        feed['trips'][['trip_id', 'route_id']], on='trip_id'
+    ).merge(
+        feed['routes'][['route_id', 'route_short_name']], on='route_id'
+    ).merge(
+        destinations[['trip_id', 'destination']], on='trip_id', how='left'
+    )
+    return per_trip.sort_values('departure_secs', kind='stable')
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_connections_match_the_stop_times_merge(seed):
+    feed = random_feed(seed, n_trips=150)
+    stations = feed_stations(feed['stops'])
+    destinations = compute_trip_destinations(feed['stop_times'], feed['stops'], feed['trips'])
+    index = DepartureIndex(stations, feed['stop_times'], feed['trips'], feed['routes'], destinations)
+    calendar = ServiceCalendar(feed['calendar'], feed['calendar_dates'], feed['trips'])
+    od_index = ODIndex(index, feed['stop_times'], calendar)
+
+    names = list(stations['stop_name'])
+    # Every station pair, and a village (several stations) to every station
+    pairs = [([a], [b]) for a in names for b in names] + [(names[:2], [b]) for b in names]
+    for day in (date(2026, 6, 1), date(2026, 6, 6)):
+        mask = calendar.trip_mask(day)
+        for origin_names, dest_names in pairs:
+            result = od_index.connections(origin_names, dest_names, day)
+            expected = _reference_connections(feed, stations, destinations, mask, origin_names, dest_names)
+            columns = ['departure_secs', 'route_short_name', 'destination', 'arrival_secs', 'trip_id']
+            expected = expected[columns].astype({'trip_id': str, 'departure_secs': 'int64', 'arrival_secs': 'int64'})
+            result = result.astype({'departure_secs': 'int64', 'arrival_secs': 'int64'})
+            pd.testing.assert_frame_equal(result.reset_index(drop=True), expected.reset_index(drop=True),
+                                          check_dtype=False)
@@ -0,0 +1,114 @@
+import csv
+import io
+from datetime import datetime, timedelta
+
+import pandas as pd
+import pytest
+
+import parking_index
+from parking_index import ParkingIndex
+
+FIELDS = ["timestamp", "name", "available", "capacity", "location", "region",
+          "source", "latitude", "longitude", "data_timestamp", "status"]
+STATIONS = [('Parking Ortisei', 'Ortisei'), ('Parking Selva', 'Selva'), ('Parking Plan de Gralba', 'Selva')]
+START = datetime(2026, 6, 1, 6, 0)
+
+
+def _rows(first, count):
+    """`count` readings per station every 5 minutes from reading number `first`."""
+    return [{
+        'timestamp': (START + timedelta(minutes=5 * i)).isoformat(),
+        'name': name, 'location': location, 'capacity': 200,
+        'available': (i * 7 + n * 31) % 200 if (i + n) % 11 else '',
+    } for i in range(first, first + count) for n, (name, location) in enumerate(STATIONS)]
+
+
+def _csv(rows):
+    """File contents the way scraper_dolomites.save_to_csv writes them."""
+    out = io.StringIO(newline='')
+    out.write('# Parking availability, Dolomites\n')
+    writer = csv.DictWriter(out, fieldnames=FIELDS, extrasaction='ignore')
+    writer.writeheader()
+    writer.writerows(rows)
+    return out.getvalue().encode('utf-8')
+
+
+def _assert_matches_full_read(index, path):
+    """The incrementally updated index answers like one built from scratch."""
+    fresh = ParkingIndex(path)
+    fresh.poll()
+    for locations in (None, ['Selva']):
+        expected = fresh.snapshot(locations).sort_values('name').reset_index(drop=True)
+        pd.testing.assert_frame_equal(index.snapshot(locations).sort_values('name').reset_index(drop=True), expected)
+
+
+@pytest.fixture(autouse=True)
+def small_blocks(monkeypatch):
+    # Several tail blocks per read, even for small files
+    monkeypatch.setattr(parking_index, 'TAIL_BLOCK', 1024)
+
+
+def test_appended_rows_are_read_incrementally(tmp_path):
+    path = tmp_path / 'parking.csv'
+    rows = _rows(0, 60)
+    path.write_bytes(_csv(rows))
+    index = ParkingIndex(path)
+    index.poll()
+    _assert_matches_full_read(index, path)
+
+    for count in (1, 2, 20):
+        rows += _rows(len(rows) // len(STATIONS), count)
+        path.write_bytes(_csv(rows))
+        offset = index.offset
+        new_rows = index.poll()
+        assert new_rows == len(path.read_bytes()[offset:].splitlines())
+        _assert_matches_full_read(index, path)
+    assert index.poll() == 0
+
+
+def test_partial_last_line_waits_for_the_rest(tmp_path):
+    path = tmp_path / 'parking.csv'
+    rows = _rows(0, 40)
+    path.write_bytes(_csv(rows))
+    index = ParkingIndex(path)
+    index.poll()
+
+    complete = _csv(rows + _rows(40, 1))
+    cut = len(complete) - 25
+    path.write_bytes(complete[:cut])
+    assert index.poll() == len(STATIONS) - 1
+    _assert_matches_full_read(index, path)
+
+    path.write_bytes(complete)
+    assert index.poll() == 1
+    _assert_matches_full_read(index, path)
+
+
+def test_truncated_or_rewritten_file_is_read_again(tmp_path):
+    path = tmp_path / 'parking.csv'
+    rows = _rows(0, 60)
+    path.write_bytes(_csv(rows))
+    index = ParkingIndex(path)
+    index.poll()
+
+    # Truncated: shorter than what was read
+    path.write_bytes(_csv(rows[:len(rows) // 2]))
+    index.poll()
+    _assert_matches_full_read(index, path)
+
+    # Rewritten: older readings merged in front, the recent rows changed, the file longer
+    older = [dict(r, timestamp=(datetime.fromisoformat(r['timestamp']) - timedelta(days=1)).isoformat())
+             for r in rows]
+    changed = [dict(r, available=5) for r in rows]
+    path.write_bytes(_csv(older + changed))
+    index.poll()
+    _assert_matches_full_read(index, path)
+    assert index.snapshot()['available'].tolist() == [5] * len(STATIONS)
+
+    # Removed, then written again
+    path.unlink()
+    assert index.poll() == 0
+    assert index.snapshot().empty
+    path.write_bytes(_csv(rows))
+    index.poll()
+    _assert_matches_full_read(index, path)
@@ -0,0 +1,36 @@
+from datetime import date, timedelta
+
+import numpy as np
+import pytest
+
+from schedule_index import ServiceCalendar
+from synthetic_feed import random_feed
+
+
+def _reference_active_service_ids(calendar_df, calendar_dates_df, target_date):
+    """The per-query calendar filter ServiceCalendar replaced."""
+    day_name = target_date.strftime('%A').lower()
+    date_int = int(target_date.strftime('%Y%m%d'))
+    active = set(calendar_df[
+        (calendar_df[day_name] == 1) &
+        (calendar_df['start_date'] <= date_int) &
+        (calendar_df['end_date'] >= date_int)
+    ]['service_id'])
+    exceptions = calendar_dates_df[calendar_dates_df['date'] == date_int]
+    added = set(exceptions[exceptions['exception_type'] == 1]['service_id'])
+    removed = set(exceptions[exceptions['exception_type'] == 2]['service_id'])
+    return (active | added) - removed
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_trip_mask_matches_the_calendar_filter(seed):
+    feed = random_feed(seed)
+    calendar = ServiceCalendar(feed['calendar'], feed['calendar_dates'], feed['trips'])
+    # Every exception day, and days before and after the feed's validity window
+    days = {date(2025, 12, 25) + timedelta(days=offset) for offset in range(0, 380, 7)}
+    days |= {date(d // 10000, d // 100 % 100, d % 100) for d in feed['calendar_dates']['date']}
+    for day in sorted(days):
+        active = _reference_active_service_ids(feed['calendar'], feed['calendar_dates'], day)
+        expected = feed['trips']['service_id'].isin(active).to_numpy()
+        assert np.array_equal(calendar.trip_mask(day), expected), day
+        assert set(calendar.active_service_ids(day)) == {str(s) for s in active}, day
@@ -0,0 +1,64 @@
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from schedule_index import DepartureIndex, ServiceCalendar, proximity_dedup
+from synthetic_feed import feed_stations, random_feed
+from val_gardena_app import compute_trip_destinations, get_station_schedule
+
+
+def _reference_dedup(routes, minutes):
+    """The row loop proximity_dedup replaced."""
+    keep = []
+    prev_route, prev_min = None, -999
+    for route, mins in zip(routes, minutes):
+        if route != prev_route or mins - prev_min >= 2:
+            keep.append(True)
+            prev_route, prev_min = route, mins
+        else:
+            keep.append(False)
+    return np.array(keep, dtype=bool)
+
+
+def _reference_schedule(departure_index, station_names, trip_mask, after_secs):
+    """get_station_schedule with the value_counts main destination and the row loop."""
+    schedule = departure_index.departures(station_names, trip_mask, after_secs=after_secs)
+    route_main_dest = schedule.groupby('route_short_name')['destination'].agg(lambda x: x.value_counts().index[0])
+    schedule['_is_main'] = schedule['destination'] == schedule['route_short_name'].map(route_main_dest)
+    schedule['_minutes'] = schedule['departure_secs'] // 60
+    schedule = schedule.sort_values(['route_short_name', '_minutes', '_is_main'], ascending=[True, True, False])
+    schedule = schedule[_reference_dedup(schedule['route_short_name'], schedule['_minutes'])]
+    schedule = schedule.sort_values('departure_secs', kind='stable')
+    return schedule[['departure_secs', 'route_short_name', 'destination', 'trip_id']]
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_proximity_dedup_matches_the_row_loop(seed):
+    rng = np.random.default_rng(seed)
+    frame = pd.DataFrame({
+        'route': rng.choice(['350', '352', '170'], 200),
+        'minutes': rng.integers(360, 420, 200),
+    })
+    for order in (['route', 'minutes'], ['minutes']):
+        rows = frame.sort_values(order, kind='stable')
+        expected = _reference_dedup(rows['route'], rows['minutes'])
+        assert (proximity_dedup(rows['route'], rows['minutes']) == expected).all()
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_station_schedule_matches_the_old_dedup(seed):
+    feed = random_feed(seed, n_trips=150)
+    stations = feed_stations(feed['stops'])
+    destinations = compute_trip_destinations(feed['stop_times'], feed['stops'], feed['trips'])
+    index = DepartureIndex(stations, feed['stop_times'], feed['trips'], feed['routes'], destinations)
+    calendar = ServiceCalendar(feed['calendar'], feed['calendar_dates'], feed['trips'])
+
+    for offset in (0, 5):
+        mask = calendar.trip_mask(date(2026, 6, 1) + timedelta(days=offset))
+        for names in [[name] for name in stations['stop_name']] + [list(stations['stop_name'])]:
+            for after_secs in (None, 6 * 3600 + 1800):
+                result = get_station_schedule(index, names, mask, after_secs)
+                expected = _reference_schedule(index, names, mask, after_secs)
+                pd.testing.assert_frame_equal(result.reset_index(drop=True), expected.reset_index(drop=True))
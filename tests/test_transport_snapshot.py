@@ -0,0 +1,34 @@
+import pandas as pd
+
+from transport_snapshot import (KEEP_VERSIONS, SCHEMA, apply_schema, current_snapshot_dir, list_versions,
+                                load_snapshot, snapshot_version, write_snapshot)
+
+
+def _tables(n_stops):
+    """Minimal typed tables; the stops table changes with `n_stops`."""
+    tables = {name: apply_schema(name, pd.DataFrame(columns=list(columns))) for name, columns in SCHEMA.items()}
+    tables['stops'] = apply_schema('stops', pd.DataFrame({
+        'stop_id': [f's{i}' for i in range(n_stops)],
+        'stop_name': [f'Stop {i}' for i in range(n_stops)],
+        'stop_lat': 46.5, 'stop_lon': 11.7, 'location': 'St. Ulrich', 'region': 'Val Gardena',
+    }))
+    return tables
+
+
+def test_refreshes_in_the_same_second_get_their_own_versions(tmp_path):
+    first = write_snapshot(_tables(1), snapshot_dir=tmp_path)
+    second = write_snapshot(_tables(2), snapshot_dir=tmp_path)
+    assert first['version'] != second['version']
+    assert second['version'] > first['version']
+    assert snapshot_version(tmp_path) == second['version']
+    assert len(load_snapshot(['stops'], version=first['version'], snapshot_dir=tmp_path)['stops']) == 1
+    assert current_snapshot_dir(tmp_path).name == second['version']
+
+
+def test_pruning_keeps_versions_in_use(tmp_path):
+    first = write_snapshot(_tables(1), snapshot_dir=tmp_path)
+    for n in range(2, KEEP_VERSIONS + 3):
+        write_snapshot(_tables(n), snapshot_dir=tmp_path, in_use=lambda: [first['version']])
+    versions = [m['version'] for m in list_versions(tmp_path)]
+    assert first['version'] in versions
+    assert len(versions) == KEEP_VERSIONS + 1
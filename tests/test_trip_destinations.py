@@ -0,0 +1,49 @@
+import pytest
+
+from synthetic_feed import random_feed
+from val_gardena_app import compute_trip_destinations
+
+
+def _reference_destinations(stop_times_df, stops_df, trips_df):
+    """compute_trip_destinations before it was vectorized: one pandas apply per trip."""
+    st_with_names = stop_times_df.merge(
+        stops_df[['stop_id', 'stop_name', 'stop_lat', 'stop_lon']], on='stop_id', how='left'
+    )
+
+    def _geo_fallback(group):
+        ordered = group.sort_values('stop_sequence')
+        first = ordered.iloc[0]
+        last = ordered.iloc[-1]
+        if first['stop_name'] == last['stop_name'] and len(ordered) > 2:
+            dist_sq = (ordered['stop_lat'] - first['stop_lat']) ** 2 + (ordered['stop_lon'] - first['stop_lon']) ** 2
+            return ordered.loc[dist_sq.idxmax(), 'stop_name']
+        return last['stop_name']
+
+    geo = st_with_names.groupby('trip_id', observed=True).apply(
+        _geo_fallback, include_groups=False
+    ).reset_index(name='geo_dest')
+    trip_dest = trips_df[['trip_id', 'route_id', 'trip_headsign']].merge(geo, on='trip_id', how='left')
+
+    has_hs = trip_dest[trip_dest['trip_headsign'].notna() & (trip_dest['trip_headsign'].str.strip() != '')]
+    route_headsign = has_hs.groupby('route_id', observed=True)['trip_headsign'].agg(
+        lambda x: x.value_counts().index[0]
+    ).reset_index(name='sibling_dest')
+    trip_dest = trip_dest.merge(route_headsign, on='route_id', how='left')
+
+    blank = trip_dest['trip_headsign'].isna() | (trip_dest['trip_headsign'].str.strip() == '')
+    trip_dest['destination'] = trip_dest['trip_headsign']
+    use_sibling = blank & trip_dest['sibling_dest'].notna()
+    trip_dest.loc[use_sibling, 'destination'] = trip_dest.loc[use_sibling, 'sibling_dest']
+    still_blank = blank & ~use_sibling
+    trip_dest.loc[still_blank, 'destination'] = trip_dest.loc[still_blank, 'geo_dest']
+    return trip_dest[['trip_id', 'destination']]
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_matches_the_per_trip_apply(seed):
+    feed = random_feed(seed)
+    args = feed['stop_times'], feed['stops'], feed['trips']
+    result = compute_trip_destinations(*args)
+    expected = _reference_destinations(*args)
+    assert result['trip_id'].astype(str).tolist() == expected['trip_id'].astype(str).tolist()
+    assert result['destination'].tolist() == expected['destination'].tolist()
@@ -0,0 +1,472 @@
+#!/usr/bin/env python3
+"""
+Typed binary snapshot of the Dolomites transport tables.
+Written by download_transport.refresh_gtfs_data next to the CSV files and loaded
+by val_gardena_app and query_transport_schedules instead of re-parsing the CSVs.
+
+The snapshot is one Parquet file per table (categorical ids, integer dates and
+integer stop times) plus a manifest.json describing the version and row counts.
+Every version is written to its own directory under snapshot/versions/ and then
+published by atomically replacing snapshot/CURRENT, so readers always see a
+complete snapshot while a refresh is running. Version names are unique, so a
+published version is never overwritten. Older versions are retained while
+they cover future service dates the current feed does not (version_for_date
+picks the snapshot for a given day), or while a running app still uses them.
+Each refresh is diffed against the previous snapshot (diff_tables): unchanged
+tables are not rewritten, and the diff is saved as diff.json so consumers can
+tell which trips, stops, routes and services changed.
+"""
+
+import hashlib
+import json
+import os
+import re
+import shutil
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# VG_TRANSPORT_DIR points all readers and writers at another data directory (e.g. a fixed benchmark snapshot)
+DATA_DIR = Path(os.environ.get("VG_TRANSPORT_DIR") or Path(__file__).parent / "data" / "transport")
+SNAPSHOT_DIR = DATA_DIR / "snapshot"
+MANIFEST_FILE = "manifest.json"
+DIFF_FILE = "diff.json"
+CURRENT_FILE = "CURRENT"  # Name of the published version, under SNAPSHOT_DIR
+VERSIONS_SUBDIR = "versions"
+KEEP_VERSIONS = 3  # Newest published versions always kept, including the current one
+MAX_VERSIONS = 6  # Upper bound, including older versions kept for dates the current feed lacks
+SNAPSHOT_FORMAT = 1
+
+# Seconds value used for missing arrival/departure times
+MISSING_TIME = -1
+# GTFS "H:MM:SS" time; hours may exceed 24
+GTFS_TIME_PATTERN = r"^\s*(\d+):(\d{2}):(\d{2})\s*$"
+_GTFS_TIME = re.compile(GTFS_TIME_PATTERN)
+
+WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+
+# Column dtypes per table; "str" columns keep NaN for empty cells, like pd.read_csv.
+# The "HH:MM:SS" strings are kept (as categoricals) for display only; filter and
+# sort on the integer *_secs columns.
+SCHEMA = {
+    "stops": {
+        "stop_id": "category", "stop_name": "str", "stop_lat": "float64", "stop_lon": "float64",
+        "location": "category", "region": "category",
+    },
+    "routes": {
+        "route_id": "category", "route_short_name": "str", "route_long_name": "str",
+        "route_type": "category", "agency_name": "category",
+    },
+    "trips": {
+        "trip_id": "category", "route_id": "category", "service_id": "category",
+        "trip_headsign": "str", "direction_id": "category", "shape_id": "category",
+    },
+    "stop_times": {
+        "trip_id": "category", "arrival_time": "category", "departure_time": "category",
+        "stop_id": "category", "stop_sequence": "int32", "pickup_type": "int8", "drop_off_type": "int8",
+        "arrival_secs": "int32", "departure_secs": "int32",
+    },
+    "calendar": {
+        "service_id": "category", **{day: "int8" for day in WEEKDAYS},
+        "start_date": "int32", "end_date": "int32",
+    },
+    "calendar_dates": {
+        "service_id": "category", "date": "int32", "exception_type": "int8",
+    },
+}
+
+# CSV file backing each table (the snapshot falls back to these)
+CSV_FILES = {name: f"transport_{name}.csv" for name in SCHEMA}
+
+
+def gtfs_time_to_seconds(times):
+    """Convert GTFS "H:MM:SS" strings to seconds since midnight of the service day.
+
+    Hours past 24 are kept as-is (25:10:00 -> 90600), as GTFS uses them for
+    trips running after midnight. Empty or malformed values become MISSING_TIME.
+    Each distinct string is parsed once, so this stays cheap on large tables.
+    """
+    cat = pd.Series(times).astype("category")
+    parts = cat.cat.categories.astype(str).str.extract(GTFS_TIME_PATTERN).astype(float)
+    secs = (parts[0] * 3600 + parts[1] * 60 + parts[2]).fillna(MISSING_TIME).to_numpy(dtype="int32")
+    codes = cat.cat.codes.to_numpy()
+    out = np.where(codes >= 0, secs[np.maximum(codes, 0)], MISSING_TIME).astype("int32")
+    return pd.Series(out, index=cat.index)
+
+
+def parse_gtfs_time(value):
+    """Scalar version of gtfs_time_to_seconds ("08:00:00" -> 28800)."""
+    match = _GTFS_TIME.match(value) if isinstance(value, str) else None
+    if match is None:
+        return MISSING_TIME
+    hours, minutes, seconds = map(int, match.groups())
+    return hours * 3600 + minutes * 60 + seconds
+
+
+def apply_schema(name, df):
+    """Return `df` restricted to the table's columns with snapshot dtypes."""
+    schema = SCHEMA[name]
+    df = df.copy()
+    if name == "stop_times":
+        # CSVs written before the *_secs columns existed
+        for secs_col, time_col in (("arrival_secs", "arrival_time"), ("departure_secs", "departure_time")):
+            if secs_col not in df.columns:
+                df[secs_col] = gtfs_time_to_seconds(df[time_col])
+
+    typed = {}
+    for col, dtype in schema.items():
+        values = df[col]
+        if dtype == "str":
+            values = values.astype(object)
+            values = values.where(values.notna() & (values != ""), np.nan)
+        elif dtype == "category":
+            values = values.astype(str).astype("category")
+        elif dtype.startswith("int"):
+            values = pd.to_numeric(values, errors="coerce").fillna(0).astype(dtype)
+        else:
+            values = values.astype(dtype)
+        typed[col] = values
+    return pd.DataFrame(typed)
+
+
+def table_hash(df):
+    """Content hash of a table (row order and values), used in the manifest."""
+    row_hashes = pd.util.hash_pandas_object(df, index=False).to_numpy()
+    return hashlib.sha1(row_hashes.tobytes()).hexdigest()[:16]
+
+
+def _key_signatures(df, key):
+    """Content signature per `key` value: wrapping sum of its row hashes.
+
+    The sum does not depend on row order, so only real content changes show up.
+    """
+    row_hashes = pd.util.hash_pandas_object(df, index=False)
+    return row_hashes.groupby(df[key].astype(str).to_numpy()).sum()
+
+
+def _combine_signatures(*signatures):
+    """Add per-key signatures of several tables (keys missing from one count as 0)."""
+    keys = signatures[0].index
+    for sig in signatures[1:]:
+        keys = keys.union(sig.index)
+    total = np.zeros(len(keys), dtype="uint64")
+    with np.errstate(over="ignore"):
+        for sig in signatures:
+            total += sig.reindex(keys, fill_value=0).to_numpy(dtype="uint64")
+    return pd.Series(total, index=keys)
+
+
+def _diff_keys(old, new):
+    """Added/removed/changed keys between two signature Series."""
+    common = new.index.intersection(old.index)
+    changed = common[new[common].to_numpy() != old[common].to_numpy()]
+    return {
+        "added": sorted(new.index.difference(old.index)),
+        "removed": sorted(old.index.difference(new.index)),
+        "changed": sorted(changed),
+    }
+
+
+def _entity_signatures(tables):
+    """Signatures per stop, route, trip (incl. its stop times) and service (incl. exceptions)."""
+    return {
+        "stops": _key_signatures(tables["stops"], "stop_id"),
+        "routes": _key_signatures(tables["routes"], "route_id"),
+        "trips": _combine_signatures(_key_signatures(tables["trips"], "trip_id"),
+                                     _key_signatures(tables["stop_times"], "trip_id")),
+        "services": _combine_signatures(_key_signatures(tables["calendar"], "service_id"),
+                                        _key_signatures(tables["calendar_dates"], "service_id")),
+    }
+
+
+def diff_tables(old_tables, new_tables):
+    """Diff two sets of typed tables (as returned by load_snapshot).
+
+    Returns a JSON-serialisable dict: "tables" maps each table name to whether
+    its content changed, and "stops", "routes", "trips" and "services" each
+    hold sorted "added", "removed" and "changed" id lists. A trip counts as
+    changed when its row or any of its stop times changed; a service when its
+    calendar row or any of its exceptions changed. With no previous tables
+    (`old_tables` None) everything is added.
+    """
+    if old_tables is None:
+        old_tables = {name: df.iloc[0:0] for name, df in new_tables.items()}
+
+    diff = {"tables": {name: table_hash(df) != table_hash(old_tables[name]) for name, df in new_tables.items()}}
+    old_signatures = _entity_signatures(old_tables)
+    for entity, signatures in _entity_signatures(new_tables).items():
+        diff[entity] = _diff_keys(old_signatures[entity], signatures)
+    return diff
+
+
+def diff_summary(diff):
+    """One-line description of a diff, e.g. "trips +12 -3 ~40, services ~2"."""
+    parts = []
+    for entity in ("trips", "stops", "routes", "services"):
+        counts = [f"{sign}{len(diff[entity][kind])}"
+                  for sign, kind in (("+", "added"), ("-", "removed"), ("~", "changed"))
+                  if diff[entity][kind]]
+        if counts:
+            parts.append(f"{entity} {' '.join(counts)}")
+    return ", ".join(parts) if parts else "no changes"
+
+
+def _write_json(path, data, **kwargs):
+    """Write JSON through a temporary file, so readers never see a partial file."""
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, **kwargs)
+    os.replace(tmp_path, path)
+
+
+def _link_or_copy(src, dst):
+    """Hard-link an unchanged table file into a new version (copy if linking fails)."""
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def current_snapshot_dir(snapshot_dir=SNAPSHOT_DIR):
+    """Directory of the published snapshot version, or None if there is none.
+
+    Snapshots written before versioning (manifest directly in `snapshot_dir`)
+    are still recognised.
+    """
+    snapshot_dir = Path(snapshot_dir)
+    current = snapshot_dir / CURRENT_FILE
+    if current.exists():
+        return snapshot_dir / VERSIONS_SUBDIR / current.read_text(encoding="utf-8").strip()
+    if (snapshot_dir / MANIFEST_FILE).exists():
+        return snapshot_dir
+    return None
+
+
+def _version_dir(version, snapshot_dir=SNAPSHOT_DIR):
+    """Directory of a given snapshot version (the current one when `version` is None)."""
+    if version is None:
+        return current_snapshot_dir(snapshot_dir)
+    return Path(snapshot_dir) / VERSIONS_SUBDIR / version
+
+
+def service_range(tables):
+    """First and last service date (YYYYMMDD ints) covered by the calendar tables."""
+    calendar = tables["calendar"]
+    calendar_dates = tables["calendar_dates"]
+    starts = pd.concat([calendar.loc[calendar["start_date"] > 0, "start_date"],
+                        calendar_dates.loc[calendar_dates["exception_type"] == 1, "date"]])
+    ends = pd.concat([calendar["end_date"], calendar_dates.loc[calendar_dates["exception_type"] == 1, "date"]])
+    if starts.empty or ends.empty:
+        return None, None
+    return int(starts.min()), int(ends.max())
+
+
+def list_versions(snapshot_dir=SNAPSHOT_DIR):
+    """Manifests of all published snapshot versions, newest first."""
+    versions_dir = Path(snapshot_dir) / VERSIONS_SUBDIR
+    if not versions_dir.exists():
+        return []
+    manifests = []
+    for path in sorted(versions_dir.iterdir(), reverse=True):
+        if path.is_dir() and not path.name.startswith("."):
+            manifest = read_manifest(snapshot_dir, path.name)
+            if manifest is not None:
+                manifests.append(manifest)
+    return manifests
+
+
+def _covers(manifest, date_int):
+    """True if a manifest's service range includes `date_int` (unknown ranges cover all)."""
+    start, end = manifest.get("service_start"), manifest.get("service_end")
+    if start is None or end is None:
+        return True
+    return start <= date_int <= end
+
+
+def version_for_date(target_date, snapshot_dir=SNAPSHOT_DIR):
+    """Snapshot version to use for `target_date`: the newest one covering that day.
+
+    Falls back to the current version (or "csv" without a snapshot) when no
+    retained version covers the date.
+    """
+    date_int = int(target_date.strftime("%Y%m%d"))
+    current = snapshot_version(snapshot_dir)
+    for manifest in list_versions(snapshot_dir):
+        if manifest["version"] <= current and _covers(manifest, date_int):
+            return manifest["version"]
+    return current
+
+
+def _prune_versions(current, snapshot_dir, in_use=None):
+    """Keep the newest KEEP_VERSIONS, plus older versions still needed for future dates.
+
+    An older version is still needed when it covers days from today on that
+    no newer kept version covers; at most MAX_VERSIONS are kept in total.
+    The current version and the versions returned by `in_use()` (e.g. those
+    a running app has cached or is loading) are never removed.
+    """
+    today = int(datetime.now().strftime("%Y%m%d"))
+    protected = {current} | set(in_use() if in_use else ())
+    kept = []
+    for manifest in list_versions(snapshot_dir):
+        start, end = manifest.get("service_start"), manifest.get("service_end")
+        needed = (start is not None and end is not None and end >= today
+                  and not any(_covers(m, max(start, today)) and _covers(m, end) for m in kept))
+        if manifest["version"] in protected or (
+            len(kept) < MAX_VERSIONS and (len(kept) < KEEP_VERSIONS or needed)
+        ):
+            kept.append(manifest)
+        else:
+            shutil.rmtree(Path(snapshot_dir) / VERSIONS_SUBDIR / manifest["version"], ignore_errors=True)
+
+
+def _publish(version, snapshot_dir, in_use=None):
+    """Point CURRENT at `version` and drop versions that are no longer needed."""
+    tmp_path = snapshot_dir / (CURRENT_FILE + ".tmp")
+    tmp_path.write_text(version, encoding="utf-8")
+    os.replace(tmp_path, snapshot_dir / CURRENT_FILE)
+    _prune_versions(version, snapshot_dir, in_use)
+
+
+def _new_version(created, snapshot_dir):
+    """Reserve a version name for a snapshot created at `created`; returns (version, staging dir).
+
+    The name is the creation time to the second, with a counter suffix after
+    the last version of that second, so names sort in creation order and a
+    refresh never reuses the directory of a published version. The staging
+    directory is created here, which reserves the name against concurrent
+    writers.
+    """
+    versions_dir = Path(snapshot_dir) / VERSIONS_SUBDIR
+    versions_dir.mkdir(parents=True, exist_ok=True)
+    stamp = created.strftime("%Y%m%dT%H%M%S")
+    names = [path.name.lstrip(".").removesuffix(".tmp") for path in versions_dir.iterdir()]
+    counters = [0 if name == stamp else int(name[len(stamp) + 1:])
+                for name in names if name == stamp or re.fullmatch(re.escape(stamp) + r"-\d+", name)]
+    n = max(counters) + 1 if counters else 0
+    while True:
+        version = stamp if n == 0 else f"{stamp}-{n:02d}"
+        staging_dir = versions_dir / f".{version}.tmp"
+        try:
+            staging_dir.mkdir()
+        except FileExistsError:
+            n += 1
+            continue
+        return version, staging_dir
+
+
+def write_snapshot(tables, diff=None, snapshot_dir=SNAPSHOT_DIR, in_use=None):
+    """Write typed Parquet tables as a new snapshot version. Returns the manifest dict.
+
+    `tables` are typed frames (apply_schema). The version is staged in a hidden
+    directory and published only once complete; tables whose hash matches the
+    previous version are hard-linked instead of rewritten. When no table
+    changed, no version is created and only the current manifest is touched
+    (its mtime is the refresh time). `diff` (from diff_tables) is saved as
+    diff.json in the new version. `in_use` returns the versions that pruning
+    must keep (see _prune_versions).
+    """
+    snapshot_dir = Path(snapshot_dir)
+    previous_dir = current_snapshot_dir(snapshot_dir)
+    previous = read_manifest(snapshot_dir) or {"tables": {}}
+
+    created = datetime.now()
+    manifest = {
+        "format": SNAPSHOT_FORMAT,
+        "version": None,
+        "created": created.isoformat(timespec="seconds"),
+        "tables": {},
+    }
+    manifest["service_start"], manifest["service_end"] = service_range(tables)
+    changed = []
+    for name, typed in tables.items():
+        entry = {"file": f"{name}.parquet", "rows": len(typed), "hash": table_hash(typed)}
+        if previous["tables"].get(name) != entry or not (previous_dir / entry["file"]).exists():
+            changed.append(name)
+        manifest["tables"][name] = entry
+
+    if not changed and previous_dir is not None:
+        previous["checked"] = manifest["created"]
+        _write_json(previous_dir / MANIFEST_FILE, previous, indent=2)
+        print(f"Snapshot {previous['version']} is up to date ({previous_dir})")
+        return previous
+
+    manifest["version"], staging_dir = _new_version(created, snapshot_dir)
+    for name, typed in tables.items():
+        file_name = manifest["tables"][name]["file"]
+        if name in changed:
+            typed.to_parquet(staging_dir / file_name, index=False)
+        else:
+            _link_or_copy(previous_dir / file_name, staging_dir / file_name)
+
+    if diff is not None:
+        _write_json(staging_dir / DIFF_FILE,
+                    {"version": manifest["version"], "base_version": previous.get("version"), **diff})
+    _write_json(staging_dir / MANIFEST_FILE, manifest, indent=2)
+
+    version_dir = _version_dir(manifest["version"], snapshot_dir)
+    os.rename(staging_dir, version_dir)
+    _publish(manifest["version"], snapshot_dir, in_use)
+
+    print(f"Saved snapshot {manifest['version']} to {version_dir} "
+          f"({len(changed)} of {len(tables)} tables rewritten)")
+    return manifest
+
+
+def read_manifest(snapshot_dir=SNAPSHOT_DIR, version=None):
+    """Return a snapshot manifest (the current one by default), or None if there is none."""
+    version_dir = _version_dir(version, snapshot_dir)
+    if version_dir is None or not (version_dir / MANIFEST_FILE).exists():
+        return None
+    with open(version_dir / MANIFEST_FILE, encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("format") != SNAPSHOT_FORMAT:
+        return None
+    return manifest
+
+
+def manifest_path(snapshot_dir=SNAPSHOT_DIR):
+    """Path of the current manifest (its mtime is the last refresh), or None."""
+    version_dir = current_snapshot_dir(snapshot_dir)
+    if version_dir is None or not (version_dir / MANIFEST_FILE).exists():
+        return None
+    return version_dir / MANIFEST_FILE
+
+
+def load_snapshot(tables=None, version=None, snapshot_dir=SNAPSHOT_DIR, data_dir=DATA_DIR):
+    """Load transport tables as typed DataFrames, keyed by table name.
+
+    Reads the given snapshot `version` (the current one by default); without
+    a snapshot, falls back to the CSV files in `data_dir` and applies the same
+    dtypes.
+    """
+    names = list(tables) if tables else list(SCHEMA)
+    manifest = read_manifest(snapshot_dir, version)
+    version_dir = _version_dir(version, snapshot_dir)
+
+    loaded = {}
+    for name in names:
+        if manifest is not None and name in manifest["tables"]:
+            loaded[name] = pd.read_parquet(version_dir / manifest["tables"][name]["file"])
+        else:
+            csv_df = pd.read_csv(Path(data_dir) / CSV_FILES[name], encoding="utf-8", dtype=str,
+                                 keep_default_na=False, na_values=[])
+            loaded[name] = apply_schema(name, csv_df)
+    return loaded
+
+
+def snapshot_version(snapshot_dir=SNAPSHOT_DIR):
+    """Version string of the current snapshot ("csv" when only CSVs exist)."""
+    manifest = read_manifest(snapshot_dir)
+    return manifest["version"] if manifest else "csv"
+
+
+def read_diff(snapshot_dir=SNAPSHOT_DIR, version=None):
+    """Return the diff saved with a snapshot version (the current one by default), or None."""
+    version_dir = _version_dir(version, snapshot_dir)
+    if version_dir is None or not (version_dir / DIFF_FILE).exists():
+        return None
+    with open(version_dir / DIFF_FILE, encoding="utf-8") as f:
+        return json.load(f)
@@ -6,15 +6,28 @@ A simple, tourist-friendly web app to explore bus schedules and stops in Val Gar
 
 import streamlit as st
 import streamlit.components.v1 as components
+import numpy as np
 import pandas as pd
 from pathlib import Path
 from datetime import datetime, date, time
 import time as _time
 import os
+import threading
 import math
+from collections import OrderedDict
 import folium
+from folium.plugins import HeatMap
 from streamlit_folium import st_folium
 
+from footpaths import FootpathGraph
+from isochrones import ConnectionScan
+from journey_planner import JourneyPlanner
+from parking_index import ParkingIndex
+from schedule_index import DepartureIndex, ODIndex, ServiceCalendar, ViewCache, nbytes, proximity_dedup
+from stage_timing import StageTimings
+from transport_snapshot import (CSV_FILES, DATA_DIR, SCHEMA, diff_summary, load_snapshot, manifest_path, read_diff,
+                                snapshot_version, version_for_date)
+
 # Page config
 st.set_page_config(
     page_title="Val Gardena Bus Schedules",
@@ -39,8 +52,28 @@ st.markdown("""<style>
     .stTable th:nth-child(6), .stTable td:nth-child(6) { width: 60px; }
 </style>""", unsafe_allow_html=True)
 
-# Paths
-DATA_DIR = Path(__file__).parent / "data" / "transport"
+# Background GTFS refresh; VG_GTFS_REFRESH=0 serves the snapshot in DATA_DIR as is (offline, benchmarks)
+AUTO_REFRESH = os.environ.get("VG_GTFS_REFRESH", "1") != "0"
+
+# Parking history appended every 5 minutes by scraper_dolomites.py
+PARKING_FILE = Path(__file__).parent / "data" / "parking_data_dolomites.csv"
+PARKING_VILLAGES = {"St. Ulrich": "Ortisei", "St. Christina": "S. Cristina", "Wolkenstein": "Selva"}
+
+# Memory budget for the snapshot data shared by all sessions (tables, derived
+# frames and indexes of every cached version); the least recently used
+# versions are dropped once it is exceeded. Date-specific views (trip masks,
+# origin-destination results, isochrones, highlighted schematics) have their
+# own LRU budgets and are dropped with their version.
+CACHE_BUDGET_MB = 1024
+CACHED_VERSIONS = 3
+SCHEMATIC_CACHE_MB = 4
+# Snapshot tables everything but the service calendar is built from; when a
+# refresh leaves them unchanged (diff.json), those objects are shared with the
+# previous version instead of being rebuilt
+TIMETABLE_TABLES = ['stops', 'routes', 'trips', 'stop_times']
+
+# Per-stage timings of each rerun are appended to this JSONL file when set
+TIMING_LOG = os.environ.get("VG_TIMING_LOG")
 
 # Village color mapping
 VILLAGE_COLORS = {
@@ -106,40 +139,50 @@ def compute_trip_destinations(stop_times_df, stops_df, trips_df):
     3. Geo fallback: for circular routes, the geographically furthest stop from
        the origin; for linear routes, the last stop.
     """
-    st_with_names = stop_times_df.merge(
-        stops_df[['stop_id', 'stop_name', 'stop_lat', 'stop_lon']],
-        on='stop_id', how='left'
-    )
+    stop_info = stops_df.drop_duplicates('stop_id')
+    stop_info = stop_info.set_index(stop_info['stop_id'].astype(str))
 
-    # Geo fallback: furthest stop for circular, last stop for linear
-    def _geo_fallback(group):
-        ordered = group.sort_values('stop_sequence')
-        first = ordered.iloc[0]
-        last = ordered.iloc[-1]
-        if first['stop_name'] == last['stop_name'] and len(ordered) > 2:
-            # Circular: find the stop geographically furthest from origin
-            dlat = ordered['stop_lat'] - first['stop_lat']
-            dlon = ordered['stop_lon'] - first['stop_lon']
-            dist_sq = dlat ** 2 + dlon ** 2
-            return ordered.loc[dist_sq.idxmax(), 'stop_name']
-        return last['stop_name']
-
-    geo = st_with_names.groupby('trip_id').apply(
-        _geo_fallback, include_groups=False
-    ).reset_index(name='geo_dest')
+    # Stop rows sorted once by trip, then sequence: each trip is a contiguous run
+    ordered = stop_times_df[['trip_id', 'stop_sequence', 'stop_id']].sort_values(
+        ['trip_id', 'stop_sequence'], kind='stable'
+    )
+    stop_keys = ordered['stop_id'].astype(str)
+    names = stop_keys.map(stop_info['stop_name']).to_numpy(dtype=object)
+    lat = stop_keys.map(stop_info['stop_lat']).to_numpy(dtype=float)
+    lon = stop_keys.map(stop_info['stop_lon']).to_numpy(dtype=float)
+
+    trip_codes = ordered['trip_id'].cat.codes.to_numpy()
+    starts = np.flatnonzero(np.diff(trip_codes, prepend=-1))
+    sizes = np.diff(np.append(starts, len(ordered)))
+    ends = starts + sizes - 1
+
+    # Geo fallback: furthest stop from the origin for circular trips, last stop for linear
+    circular = (names[starts] == names[ends]) & (sizes > 2)
+    dist_sq = (lat - np.repeat(lat[starts], sizes)) ** 2 + (lon - np.repeat(lon[starts], sizes)) ** 2
+    dist_sq = np.nan_to_num(dist_sq, nan=-np.inf)
+    # Grouped argmax: largest distance first within each trip, earliest stop on ties
+    furthest = np.lexsort((np.arange(len(ordered)), -dist_sq, trip_codes))[starts]
+    geo = pd.DataFrame({
+        'trip_id': ordered['trip_id'].iloc[starts].reset_index(drop=True),
+        'geo_dest': np.where(circular, names[furthest], names[ends]),
+    })
 
     # Build trip-level table with route_id and headsign
     trip_dest = trips_df[['trip_id', 'route_id', 'trip_headsign']].merge(
         geo, on='trip_id', how='left'
     )
 
-    # Sibling headsign: for each route, find the most common non-empty headsign
+    # Sibling headsign: for each route, the most common non-empty headsign
+    # (ties go to the headsign seen first, like value_counts)
     has_hs = trip_dest[
         trip_dest['trip_headsign'].notna() & (trip_dest['trip_headsign'].str.strip() != '')
     ]
-    route_headsign = has_hs.groupby('route_id')['trip_headsign'].agg(
-        lambda x: x.value_counts().index[0]
-    ).reset_index(name='sibling_dest')
+    headsign_counts = has_hs.assign(_pos=np.arange(len(has_hs))).groupby(
+        ['route_id', 'trip_headsign'], observed=True, sort=False
+    )['_pos'].agg(['size', 'min']).reset_index()
+    route_headsign = headsign_counts.sort_values(
+        ['size', 'min'], ascending=[False, True], kind='stable'
+    ).drop_duplicates('route_id')[['route_id', 'trip_headsign']].rename(columns={'trip_headsign': 'sibling_dest'})
 
     trip_dest = trip_dest.merge(route_headsign, on='route_id', how='left')
 
@@ -156,50 +199,205 @@ def compute_trip_destinations(stop_times_df, stops_df, trips_df):
     return trip_dest[['trip_id', 'destination']]
 
 
-def get_active_service_ids(calendar_df, calendar_dates_df, target_date):
-    """Return set of service_ids active on target_date using GTFS calendar rules."""
-    day_name = target_date.strftime('%A').lower()  # 'monday', 'tuesday', etc.
-    date_int = int(target_date.strftime('%Y%m%d'))  # e.g. 20260209
+@st.cache_resource
+def _refresh_state():
+    """Background refresh bookkeeping shared by all sessions of this server."""
+    return {"lock": threading.Lock(), "thread": None, "started": 0.0}
+
 
-    # Base: services running on this day of week within the valid date range
-    active = set(calendar_df[
-        (calendar_df[day_name] == 1) &
-        (calendar_df['start_date'] <= date_int) &
-        (calendar_df['end_date'] >= date_int)
-    ]['service_id'])
+def _refresh_worker():
+    """Run the GTFS download pipeline and warm the caches for the new snapshot.
 
-    # Exceptions from calendar_dates
-    exceptions = calendar_dates_df[calendar_dates_df['date'] == date_int]
-    added = set(exceptions[exceptions['exception_type'] == 1]['service_id'])
-    removed = set(exceptions[exceptions['exception_type'] == 2]['service_id'])
+    Runs outside any session: the new snapshot only becomes visible once
+    refresh_gtfs_data publishes it, so sessions keep serving the old one.
+    """
+    from download_transport import refresh_gtfs_data
+    try:
+        refresh_gtfs_data(in_use=cached_versions)
+        version = snapshot_version()
+        touch_cache(version)
+        load_data(version)
+        load_schematic_layers(version)
+        render_route_network_svg(version)
+    except Exception as e:
+        print(f"Background GTFS refresh failed: {e}")
 
-    return (active | added) - removed
 
+def _ensure_fresh_gtfs(max_age_hours=24, retry_minutes=30):
+    """Start a background GTFS refresh if the snapshot is stale or missing.
 
-def _ensure_fresh_gtfs(max_age_hours=24):
-    """Re-download GTFS data if CSVs are stale or missing."""
-    sentinel = DATA_DIR / "transport_stop_times.csv"
-    if sentinel.exists():
+    Only waits for the refresh when there is no data to serve at all; a failed
+    refresh is retried after `retry_minutes`. Does nothing if AUTO_REFRESH is off.
+    """
+    if not AUTO_REFRESH:
+        return
+    sentinel = manifest_path()
+    if sentinel is not None:
         age_hours = (_time.time() - sentinel.stat().st_mtime) / 3600
         if age_hours < max_age_hours:
             return  # data is fresh
-    # Import and call the download pipeline
-    from download_transport import refresh_gtfs_data
-    with st.spinner("Downloading fresh bus schedule data..."):
-        refresh_gtfs_data()
-    # Invalidate cached data so new CSVs are loaded
-    load_data.clear()
-
-
-@st.cache_data
-def load_data():
-    """Load all transport data, filter to Val Gardena, consolidate stops."""
-    stops_df = pd.read_csv(DATA_DIR / "transport_stops.csv", encoding='utf-8')
-    routes_df = pd.read_csv(DATA_DIR / "transport_routes.csv", encoding='utf-8')
-    trips_df = pd.read_csv(DATA_DIR / "transport_trips.csv", encoding='utf-8')
-    stop_times_df = pd.read_csv(DATA_DIR / "transport_stop_times.csv", encoding='utf-8')
-    calendar_df = pd.read_csv(DATA_DIR / "transport_calendar.csv", encoding='utf-8')
-    calendar_dates_df = pd.read_csv(DATA_DIR / "transport_calendar_dates.csv", encoding='utf-8')
+
+    state = _refresh_state()
+    with state["lock"]:
+        thread = state["thread"]
+        running = thread is not None and thread.is_alive()
+        if not running and _time.time() - state["started"] >= retry_minutes * 60:
+            thread = threading.Thread(target=_refresh_worker, name="gtfs-refresh", daemon=True)
+            state["thread"], state["started"] = thread, _time.time()
+            thread.start()
+
+    if sentinel is None and not (DATA_DIR / CSV_FILES["stops"]).exists() and thread is not None:
+        with st.spinner("Downloading fresh bus schedule data..."):
+            thread.join()
+
+
+@st.cache_resource
+def stage_timings():
+    """Rolling per-stage latencies of main(), shared by all sessions."""
+    return StageTimings(log_path=TIMING_LOG)
+
+
+@st.cache_resource
+def load_parking_index():
+    """Latest parking readings, shared by all sessions; call poll() to pick up new rows."""
+    return ParkingIndex(PARKING_FILE)
+
+
+@st.cache_resource
+def _cache_usage():
+    """Objects held per cached snapshot version, least recently used first.
+
+    Each version maps the ids of the objects it reaches to their own bytes;
+    versions share objects, so totals are taken over the union.
+    """
+    return {"lock": threading.Lock(), "versions": OrderedDict()}
+
+
+def _version_loaders():
+    """Cached functions keyed by snapshot version alone, cleared together on eviction.
+
+    They have no max_entries: touch_cache is the only eviction path, so the
+    cache stays in step with _cache_usage. Per-query results are memoized in
+    ViewCaches held by these objects instead of cached functions.
+    """
+    return [load_transport_dataset, load_data, load_departure_index, load_od_index, load_service_calendar,
+            load_journey_planner, load_connection_scan, load_route_network, load_schematic_layers,
+            load_schematic_svgs, render_route_network_svg]
+
+
+def _track_cache(version, obj):
+    """Account for `obj` cached under snapshot `version`; returns `obj`."""
+    usage = _cache_usage()
+    views = [obj] if isinstance(obj, ViewCache) else [
+        v for v in getattr(obj, '__dict__', {}).values() if isinstance(v, ViewCache)
+    ]
+    with usage["lock"]:
+        entry = usage["versions"].setdefault(version, {"objects": {}, "views": []})
+        nbytes(obj, entry["objects"])
+        entry["views"] += views
+    return obj
+
+
+def cached_versions():
+    """Snapshot versions cached or being loaded by this server; a refresh does not prune them."""
+    usage = _cache_usage()
+    with usage["lock"]:
+        return list(usage["versions"])
+
+
+def touch_cache(version):
+    """Mark `version` as used and evict least recently used versions over the budget.
+
+    Call it before loading `version`, so it counts as in use while it loads.
+    """
+    usage = _cache_usage()
+    evicted = []
+    with usage["lock"]:
+        versions = usage["versions"]
+        versions.setdefault(version, {"objects": {}, "views": []})
+        versions.move_to_end(version)
+        while len(versions) > 1 and (
+            len(versions) > CACHED_VERSIONS or cache_nbytes(versions) > CACHE_BUDGET_MB * 1024 * 1024
+        ):
+            evicted.append(versions.popitem(last=False)[0])
+    for old in evicted:
+        for loader in _version_loaders():
+            loader.clear(old)
+        print(f"Evicted snapshot {old} from the cache")
+
+
+def _unchanged_base(version, tables):
+    """Cached version that the refresh publishing `version` left `tables` unchanged from, or None.
+
+    Read from the version's diff.json. Objects built only from those tables
+    are then shared with the base version instead of being rebuilt.
+    """
+    diff = read_diff(version=version) if version != "csv" else None
+    if diff is None or diff.get("base_version") not in cached_versions():
+        return None
+    if any(diff["tables"].get(name, True) for name in tables):
+        return None
+    return diff["base_version"]
+
+
+def cache_nbytes(versions=None):
+    """Bytes held by the cached snapshot versions, including their date-specific views.
+
+    Objects shared between versions (unchanged tables and indexes) count once.
+    """
+    if versions is None:
+        usage = _cache_usage()
+        with usage["lock"]:
+            return cache_nbytes(usage["versions"])
+    objects, views = {}, {}
+    for entry in versions.values():
+        objects.update(entry["objects"])
+        views.update((id(v), v) for v in entry["views"])
+    return sum(objects.values()) + sum(v.nbytes for v in views.values())
+
+
+@st.cache_resource
+def load_transport_dataset(version):
+    """Snapshot tables of `version`, read once per process and shared by all sessions.
+
+    load_data, load_route_network and the schedule indexes derive their views
+    from these frames; treat them as read-only. Tables the refresh left
+    unchanged are shared with the previous version when it is cached.
+    """
+    if version == "csv":
+        return _track_cache(version, load_snapshot())
+    base = _unchanged_base(version, [])
+    unchanged = [name for name in SCHEMA if base is not None and _unchanged_base(version, [name]) == base]
+    tables = {name: load_transport_dataset(base)[name] for name in unchanged}
+    if len(tables) < len(SCHEMA):
+        tables.update(load_snapshot([name for name in SCHEMA if name not in tables], version=version))
+    if unchanged:
+        print(f"Snapshot {version}: sharing unchanged tables with {base} ({', '.join(unchanged)})")
+    return _track_cache(version, {name: tables[name] for name in SCHEMA})
+
+
+@st.cache_resource
+def load_data(version):
+    """Load all transport data, filter to Val Gardena, consolidate stops.
+
+    `version` is the snapshot version to load; it is also the cache key, so a
+    newly published snapshot is picked up without clearing the cache. The
+    frames are shared by all sessions and must not be modified. Up to
+    CACHED_VERSIONS versions stay cached within CACHE_BUDGET_MB (see
+    touch_cache): the current one, plus older ones loaded for dates outside
+    the current feed. When only the calendars changed, the Val Gardena frames
+    are shared with the previous version.
+    """
+    tables = load_transport_dataset(version)
+    base = _unchanged_base(version, TIMETABLE_TABLES)
+    if base is not None:
+        return _track_cache(version, load_data(base)[:5] + (tables['calendar'], tables['calendar_dates']))
+    stops_df = tables['stops']
+    routes_df = tables['routes']
+    trips_df = tables['trips']
+    stop_times_df = tables['stop_times']
+    calendar_df = tables['calendar']
+    calendar_dates_df = tables['calendar_dates']
 
     # Compute trip destinations on full data (before VG filtering)
     trip_destinations = compute_trip_destinations(stop_times_df, stops_df, trips_df)
@@ -209,7 +407,7 @@ def load_data():
     vg_core_stops = stops_df[
         (stops_df['region'] == 'Val Gardena') |
         (stops_df['location'].isin(vg_locations))
-    ].copy()
+    ]
     vg_core_stops = vg_core_stops.drop_duplicates(subset=['stop_id'])
 
     vg_core_stop_ids = set(vg_core_stops['stop_id'])
@@ -218,7 +416,7 @@ def load_data():
 
     # Step 2: Include external hub stops, but only for trips already serving VG
     ext_locations = list(EXTERNAL_LOCATIONS)
-    ext_stops = stops_df[stops_df['location'].isin(ext_locations)].copy()
+    ext_stops = stops_df[stops_df['location'].isin(ext_locations)]
 
     all_stops = pd.concat([vg_core_stops, ext_stops]).drop_duplicates(subset=['stop_id'])
     all_stops = all_stops[
@@ -230,25 +428,127 @@ def load_data():
     vg_stop_times = stop_times_df[
         (stop_times_df['stop_id'].isin(all_stops['stop_id'])) &
         (stop_times_df['trip_id'].isin(vg_trip_ids))
-    ].copy()
+    ]
 
-    vg_trips = trips_df[trips_df['trip_id'].isin(vg_trip_ids)].copy()
+    vg_trips = trips_df[trips_df['trip_id'].isin(vg_trip_ids)]
     vg_route_ids = vg_trips['route_id'].unique()
-    vg_routes = routes_df[routes_df['route_id'].isin(vg_route_ids)].copy()
+    vg_routes = routes_df[routes_df['route_id'].isin(vg_route_ids)]
 
     # Filter trip destinations
-    vg_trip_destinations = trip_destinations[trip_destinations['trip_id'].isin(vg_trip_ids)].copy()
+    vg_trip_destinations = trip_destinations[trip_destinations['trip_id'].isin(vg_trip_ids)]
 
     # Consolidate stops into stations
     stations = consolidate_stops(all_stops, vg_stop_times)
 
-    return stations, vg_routes, vg_trips, vg_stop_times, vg_trip_destinations, calendar_df, calendar_dates_df
+    return _track_cache(version, (
+        stations, vg_routes, vg_trips, vg_stop_times, vg_trip_destinations, calendar_df, calendar_dates_df
+    ))
+
+
+@st.cache_resource
+def load_departure_index(version):
+    """Departure index for the Schedules tab, built once per snapshot version and shared by all sessions."""
+    base = _unchanged_base(version, TIMETABLE_TABLES)
+    if base is not None:
+        return _track_cache(version, load_departure_index(base))
+    stations, vg_routes, vg_trips, vg_stop_times, vg_trip_destinations, _, _ = load_data(version)
+    return _track_cache(version, DepartureIndex(stations, vg_stop_times, vg_trips, vg_routes, vg_trip_destinations))
+
+
+@st.cache_resource
+def load_od_index(version):
+    """Origin-destination index for the Schedules tab, shared by all sessions."""
+    _, _, _, vg_stop_times, _, _, _ = load_data(version)
+    return _track_cache(version, ODIndex(load_departure_index(version), vg_stop_times, load_service_calendar(version)))
+
+
+@st.cache_resource
+def load_journey_planner(version):
+    """Multi-leg journey planner ("Plan a trip") over the OD index of `version`, shared by all sessions."""
+    stations = load_data(version)[0]
+    walks = dict(zip(stations['stop_name'], stations['walks']))
+    return _track_cache(version, JourneyPlanner(load_od_index(version), walks))
+
+
+@st.cache_resource
+def load_connection_scan(version):
+    """Connection scan for isochrones over the OD index of `version`, shared by all sessions."""
+    stations = load_data(version)[0]
+    walks = dict(zip(stations['stop_name'], stations['walks']))
+    return _track_cache(version, ConnectionScan(load_od_index(version), walks))
+
+
+def main_station_isochrones(version, target_date, depart_secs, minutes):
+    """Stations reachable within `minutes` from every main station (one batch scan, memoized by the scan)."""
+    stations = load_data(version)[0]
+    main_names = stations[stations['is_main']]['stop_name'].tolist()
+    return load_connection_scan(version).isochrones(main_names, target_date, depart_secs, minutes)
+
+
+@st.cache_resource
+def load_service_calendar(version):
+    """Service x day bitmap over the trips of `load_data(version)`, shared by all sessions.
+
+    Never shared with a base version: its rows follow the Val Gardena trip
+    list, which depends on every snapshot table.
+    """
+    _, _, vg_trips, _, _, calendar_df, calendar_dates_df = load_data(version)
+    return _track_cache(version, ServiceCalendar(calendar_df, calendar_dates_df, vg_trips))
+
+
+@st.cache_resource
+def load_schematic_layers(version):
+    """Schematic static layers for snapshot `version`, rendered once and shared by all sessions."""
+    base = _unchanged_base(version, TIMETABLE_TABLES)
+    if base is not None:
+        return _track_cache(version, load_schematic_layers(base))
+    stations = load_data(version)[0]
+    return _track_cache(version, schematic_layers(stations))
+
+
+@st.cache_resource
+def load_schematic_svgs(version):
+    """Rendered schematic SVGs of snapshot `version` per highlighted stop (LRU within SCHEMATIC_CACHE_MB)."""
+    base = _unchanged_base(version, TIMETABLE_TABLES)
+    if base is not None:
+        return _track_cache(version, load_schematic_svgs(base))
+    return _track_cache(version, ViewCache(SCHEMATIC_CACHE_MB * 1024 * 1024))
+
+
+def render_schematic_svg(version, selected_stop=None):
+    """Schematic SVG of snapshot `version` with `selected_stop` highlighted, memoized per stop."""
+    svgs = load_schematic_svgs(version)
+    svg = svgs.get(selected_stop)
+    if svg is None:
+        svg = render_schematic(load_schematic_layers(version), selected_stop)
+        svgs.put(selected_stop, svg)
+    return svg
+
+
+@st.cache_resource
+def render_route_network_svg(version):
+    """Route network SVG of snapshot `version`; it only changes with the feed."""
+    base = _unchanged_base(version, TIMETABLE_TABLES)
+    if base is not None:
+        return _track_cache(version, render_route_network_svg(base))
+    return _track_cache(version, create_route_network_svg(load_route_network(version)))
+
+
+@st.cache_resource
+def render_geographic_network_svg():
+    """Geographic stop map SVG; drawn from fixed coordinates, so rendered once per process."""
+    return create_geographic_network_svg()
 
 
 def consolidate_stops(stops_df, stop_times_df):
-    """Group raw stops by name into consolidated stations."""
+    """Group raw stops by name into consolidated stations.
+
+    Stations a short walk apart stay separate (the schematic and the widgets
+    key on the name) but are linked: `walks` maps each nearby station to the
+    walking time in seconds, from the footpath graph over the raw stops.
+    """
     # Count departures per stop
-    dep_counts = stop_times_df.groupby('stop_id').size().reset_index(name='dep_count')
+    dep_counts = stop_times_df.groupby('stop_id', observed=True).size().reset_index(name='dep_count')
 
     stops_with_deps = stops_df.merge(dep_counts, on='stop_id', how='left')
     stops_with_deps['dep_count'] = stops_with_deps['dep_count'].fillna(0).astype(int)
@@ -266,16 +566,25 @@ def consolidate_stops(stops_df, stop_times_df):
     # Mark main stations using hardcoded list
     stations['is_main'] = stations['stop_name'].isin(MAIN_STOP_NAMES)
 
+    # Walking links to nearby stations
+    walks = FootpathGraph(stops_df).station_walks(dict(zip(stops_df['stop_id'], stops_df['stop_name'])))
+    stations['walks'] = [walks.get(name, {}) for name in stations['stop_name']]
+
     return stations
 
 
-def create_schematic_svg(stations, selected_stop=None):
-    """Create an inline SVG schematic transit diagram with external connections."""
+def schematic_layers(stations):
+    """Pre-render the schematic transit diagram as static layers.
+
+    Returns (parts, highlights): `parts` are the SVG fragments with no stop
+    selected, `highlights` maps ('stop', name) / ('village', name) to the index
+    of the fragment drawing that stop and its highlighted replacement.
+    """
     # Only use VG main stops for the schematic line
     vg_main_names = [n for n in MAIN_STOP_NAMES if STOP_VILLAGE.get(n) not in EXTERNAL_LOCATIONS]
     main = stations[stations['stop_name'].isin(vg_main_names)].copy()
     if main.empty:
-        return "<p>No main stations found</p>"
+        return ["<p>No main stations found</p>"], {}
 
     # Sort by longitude (west to east)
     main = main.sort_values('stop_lon')
@@ -335,26 +644,21 @@ def create_schematic_svg(stations, selected_stop=None):
         f'stroke="#BDBDBD" stroke-width="2" stroke-dasharray="6,4"/>'
     )
 
-    # Map selected stop to its external village for highlighting
-    selected_village = STOP_VILLAGE.get(selected_stop) if selected_stop else None
     ext_color = "#757575"
+    highlights = {}
 
-    # External stop circles and labels
-    for ex_x, ex_y, ex_label, ex_village in [
-        (bolzano_x, bolzano_y, "Bolzano", "Bolzano"),
-        (ponte_x, line_y, "Ponte Gardena", "Ponte Gardena"),
-        (bressanone_x, bressanone_y, "Bressanone", "Bressanone"),
-    ]:
-        is_selected = (selected_village == ex_village)
+    # External stop circles and labels (highlighted when a stop of that village is selected)
+    def external_stop(ex_x, ex_y, ex_label, is_selected):
+        parts = []
         r = 9 if is_selected else 5
 
         if is_selected:
-            svg_parts.append(
+            parts.append(
                 f'<circle cx="{ex_x}" cy="{ex_y}" r="14" '
                 f'fill="none" stroke="{ext_color}" stroke-width="3" opacity="0.4"/>'
             )
 
-        svg_parts.append(
+        parts.append(
             f'<circle cx="{ex_x}" cy="{ex_y}" r="{r}" '
             f'fill="{ext_color}" stroke="white" stroke-width="1.5"/>'
         )
@@ -362,15 +666,26 @@ def create_schematic_svg(stations, selected_stop=None):
         font_weight = "bold"
         font_size = "12" if is_selected else "11"
         if ex_label == "Ponte Gardena":
-            svg_parts.append(
+            parts.append(
                 f'<text x="{ex_x}" y="{ex_y + 20}" text-anchor="middle" '
                 f'fill="{ext_color}" font-size="10" font-weight="{font_weight}">{ex_label}</text>'
             )
         else:
-            svg_parts.append(
+            parts.append(
                 f'<text x="{ex_x + 14}" y="{ex_y + 4}" text-anchor="start" '
                 f'fill="{ext_color}" font-size="{font_size}" font-weight="{font_weight}">{ex_label}</text>'
             )
+        return '\n'.join(parts)
+
+    for ex_x, ex_y, ex_label, ex_village in [
+        (bolzano_x, bolzano_y, "Bolzano", "Bolzano"),
+        (ponte_x, line_y, "Ponte Gardena", "Ponte Gardena"),
+        (bressanone_x, bressanone_y, "Bressanone", "Bressanone"),
+    ]:
+        highlights[('village', ex_village)] = (
+            len(svg_parts), external_stop(ex_x, ex_y, ex_label, True)
+        )
+        svg_parts.append(external_stop(ex_x, ex_y, ex_label, False))
 
     # --- Val Gardena stops ---
     village_groups = {}
@@ -403,17 +718,17 @@ def create_schematic_svg(stations, selected_stop=None):
             )
 
     # Draw stop circles and labels
-    for idx, p in enumerate(positions):
-        is_selected = (selected_stop and p['name'] == selected_stop)
+    def station_stop(idx, p, is_selected):
+        parts = []
         r = 10 if is_selected else 7
 
         if is_selected:
-            svg_parts.append(
+            parts.append(
                 f'<circle cx="{p["x"]}" cy="{line_y}" r="16" '
                 f'fill="none" stroke="{p["color"]}" stroke-width="3" opacity="0.4"/>'
             )
 
-        svg_parts.append(
+        parts.append(
             f'<circle cx="{p["x"]}" cy="{line_y}" r="{r}" '
             f'fill="{p["color"]}" stroke="white" stroke-width="2"/>'
         )
@@ -421,14 +736,19 @@ def create_schematic_svg(stations, selected_stop=None):
         label_y = line_y + 35 if idx % 2 == 0 else line_y + 50
         font_weight = "bold" if is_selected else "normal"
         font_size = "12" if is_selected else "11"
-        svg_parts.append(
+        parts.append(
             f'<line x1="{p["x"]}" y1="{line_y + r + 2}" x2="{p["x"]}" y2="{label_y - 10}" '
             f'stroke="#CCC" stroke-width="1"/>'
         )
-        svg_parts.append(
+        parts.append(
             f'<text x="{p["x"]}" y="{label_y}" text-anchor="middle" '
             f'fill="#333" font-size="{font_size}" font-weight="{font_weight}">{p["short"]}</text>'
         )
+        return '\n'.join(parts)
+
+    for idx, p in enumerate(positions):
+        highlights[('stop', p['name'])] = (len(svg_parts), station_stop(idx, p, True))
+        svg_parts.append(station_stop(idx, p, False))
 
     # Draw village names above the line
     for village, xs in village_groups.items():
@@ -440,58 +760,53 @@ def create_schematic_svg(stations, selected_stop=None):
         )
 
     svg_parts.append('</svg>')
-    return '\n'.join(svg_parts)
+    return svg_parts, highlights
 
 
-def get_station_schedule(station_row, stop_times_df, trips_df, routes_df, trip_destinations, after_time=None):
-    """Get deduplicated schedule for a station (all its stop_ids)."""
-    stop_ids = station_row['stop_ids']
+def render_schematic(layers, selected_stop=None):
+    """Join pre-rendered schematic layers, swapping in the highlight for `selected_stop`."""
+    parts, highlights = layers
+    if selected_stop:
+        parts = list(parts)
+        for key in (('village', STOP_VILLAGE.get(selected_stop)), ('stop', selected_stop)):
+            if key in highlights:
+                idx, fragment = highlights[key]
+                parts[idx] = fragment
+    return '\n'.join(parts)
 
-    schedule = stop_times_df[stop_times_df['stop_id'].isin(stop_ids)].copy()
 
-    if after_time:
-        schedule = schedule[schedule['departure_time'] >= after_time]
+def create_schematic_svg(stations, selected_stop=None):
+    """Create an inline SVG schematic transit diagram with external connections."""
+    return render_schematic(schematic_layers(stations), selected_stop)
 
-    # Join trips and routes
-    schedule = schedule.merge(
-        trips_df[['trip_id', 'route_id']],
-        on='trip_id'
-    )
-    schedule = schedule.merge(
-        routes_df[['route_id', 'route_short_name']],
-        on='route_id'
-    )
 
-    # Join pre-computed destinations
-    schedule = schedule.merge(
-        trip_destinations[['trip_id', 'destination']],
-        on='trip_id',
-        how='left'
-    )
+def get_station_schedule(departure_index, station_names, trip_mask, after_secs=None):
+    """Get deduplicated schedule for stations (all their stop_ids).
 
-    # Fallback if destination is still blank
-    schedule['destination'] = schedule['destination'].fillna(
-        'Route ' + schedule['route_short_name']
-    )
+    Departures come from the precomputed DepartureIndex, restricted to trips
+    in `trip_mask` (see ServiceCalendar.trip_mask). Times are integer seconds
+    since midnight (`departure_secs`); format them with format_time only when
+    rendering.
+    """
+    schedule = departure_index.departures(station_names, trip_mask, after_secs=after_secs)
 
     # Deduplicate: same route within ~2 min at the same station = same bus
     # (a station can have multiple stop_ids, so the same bus shows up with
     #  slightly different times, e.g. 16:09 arriving and 16:10 departing)
 
     # For each route, find its most common destination (the "main" one)
-    route_main_dest = schedule.groupby('route_short_name')['destination'].agg(
-        lambda x: x.value_counts().index[0]
-    )
-    schedule['_is_main'] = schedule.apply(
-        lambda r: r['destination'] == route_main_dest.get(r['route_short_name'], ''), axis=1
-    )
-
-    # Convert to minutes for proximity comparison
-    def _time_to_minutes(t):
-        parts = t.split(':')
-        return int(parts[0]) * 60 + int(parts[1])
-
-    schedule['_minutes'] = schedule['departure_time'].apply(_time_to_minutes)
+    # (ties go to the destination seen first, like value_counts)
+    dest_counts = schedule.assign(_pos=np.arange(len(schedule))).groupby(
+        ['route_short_name', 'destination'], observed=True, sort=False
+    )['_pos'].agg(['size', 'min']).reset_index()
+    route_main_dest = dest_counts.sort_values(
+        ['size', 'min'], ascending=[False, True], kind='stable'
+    ).drop_duplicates('route_short_name').set_index('route_short_name')['destination']
+    main_dest = schedule['route_short_name'].map(route_main_dest).fillna('')
+    schedule['_is_main'] = schedule['destination'].to_numpy() == main_dest.to_numpy()
+
+    # Whole minutes for proximity comparison
+    schedule['_minutes'] = schedule['departure_secs'] // 60
 
     # Sort by route, then time, then prefer main destination first
     schedule = schedule.sort_values(
@@ -500,31 +815,20 @@ def get_station_schedule(station_row, stop_times_df, trips_df, routes_df, trip_d
     )
 
     # Proximity dedup: same route within 2 min = same bus, keep first (main dest preferred)
-    keep = []
-    prev_route = None
-    prev_min = -999
-    for idx in schedule.index:
-        route = schedule.loc[idx, 'route_short_name']
-        mins = schedule.loc[idx, '_minutes']
-        if route != prev_route or (mins - prev_min) >= 2:
-            keep.append(idx)
-            prev_route = route
-            prev_min = mins
-    schedule = schedule.loc[keep]
+    schedule = schedule[proximity_dedup(schedule['route_short_name'], schedule['_minutes'])]
 
     schedule = schedule.drop(columns=['_is_main', '_minutes'])
-    schedule = schedule.sort_values('departure_time')
+    schedule = schedule.sort_values('departure_secs', kind='stable')
 
-    return schedule[['departure_time', 'route_short_name', 'destination', 'trip_id']]
+    return schedule[['departure_secs', 'route_short_name', 'destination', 'trip_id']]
 
 
-def format_time(time_str):
-    """Format HH:MM:SS to HH:MM."""
-    try:
-        h, m, _s = time_str.split(':')
-        return f"{h}:{m}"
-    except Exception:
-        return time_str
+def format_time(secs):
+    """Format seconds since midnight as HH:MM (times past 24:00 wrap to the next day)."""
+    if secs is None or pd.isna(secs) or secs < 0:
+        return ""
+    secs = int(secs)
+    return f"{secs // 3600 % 24:02d}:{secs % 3600 // 60:02d}"
 
 
 # Route colors for the network map
@@ -540,13 +844,17 @@ ROUTE_COLORS = {
 }
 
 
-@st.cache_data
-def load_route_network():
-    """Load full route network for buses serving Ortisei."""
-    stops_df = pd.read_csv(DATA_DIR / "transport_stops.csv", encoding='utf-8')
-    stop_times_df = pd.read_csv(DATA_DIR / "transport_stop_times.csv", encoding='utf-8')
-    trips_df = pd.read_csv(DATA_DIR / "transport_trips.csv", encoding='utf-8')
-    routes_df = pd.read_csv(DATA_DIR / "transport_routes.csv", encoding='utf-8')
+@st.cache_resource
+def load_route_network(version):
+    """Load full route network for buses serving Ortisei from snapshot `version`."""
+    base = _unchanged_base(version, TIMETABLE_TABLES)
+    if base is not None:
+        return _track_cache(version, load_route_network(base))
+    tables = load_transport_dataset(version)
+    stops_df = tables['stops']
+    stop_times_df = tables['stop_times']
+    trips_df = tables['trips']
+    routes_df = tables['routes']
 
     # Find Ortisei stop_ids and trips
     ortisei_ids = set(stops_df[stops_df['location'] == 'St. Ulrich']['stop_id'])
@@ -561,32 +869,29 @@ def load_route_network():
     # For each route, pick one representative trip (the one with most stops)
     trip_stop_counts = stop_times_df[
         stop_times_df['trip_id'].isin(ortisei_trip_ids)
-    ].groupby('trip_id').size().reset_index(name='n_stops')
+    ].groupby('trip_id', observed=True).size().reset_index(name='n_stops')
 
     trip_route = trip_route.merge(trip_stop_counts, on='trip_id')
     best_trips = trip_route.sort_values('n_stops', ascending=False).drop_duplicates('route_short_name')
 
-    # Build route paths: list of (lat, lon) for each route
-    route_paths = {}
-    for _, row in best_trips.iterrows():
-        rname = row['route_short_name']
-        tid = row['trip_id']
-        trip_st = stop_times_df[stop_times_df['trip_id'] == tid].sort_values('stop_sequence')
-        trip_st = trip_st.merge(
-            stops_df[['stop_id', 'stop_name', 'stop_lat', 'stop_lon', 'location']],
-            on='stop_id', how='left'
-        )
-        coords = []
-        for _, s in trip_st.iterrows():
-            coords.append({
-                'name': s['stop_name'],
-                'lat': s['stop_lat'],
-                'lon': s['stop_lon'],
-                'location': s.get('location', ''),
-            })
-        route_paths[rname] = coords
+    # Build route paths in one pass: stops of all representative trips, in sequence order
+    path_st = stop_times_df[stop_times_df['trip_id'].isin(best_trips['trip_id'])]
+    path_st = path_st.sort_values(['trip_id', 'stop_sequence'], kind='stable').merge(
+        stops_df[['stop_id', 'stop_name', 'stop_lat', 'stop_lon', 'location']],
+        on='stop_id', how='left'
+    ).rename(columns={'stop_name': 'name', 'stop_lat': 'lat', 'stop_lon': 'lon'})
+    stops_by_trip = {
+        trip_id: group[['name', 'lat', 'lon', 'location']].to_dict('records')
+        for trip_id, group in path_st.groupby('trip_id', observed=True)
+    }
+
+    # List of stops ({name, lat, lon, location}) per route, longest routes first
+    route_paths = {
+        rname: stops_by_trip.get(tid, [])
+        for rname, tid in zip(best_trips['route_short_name'], best_trips['trip_id'])
+    }
 
-    return route_paths
+    return _track_cache(version, route_paths)
 
 
 def _classify_stop(name, location):
@@ -1248,8 +1553,12 @@ def create_geographic_network_svg():
     return '\n'.join(svg)
 
 
-def create_interactive_map():
-    """Create a Folium map with markers for all subway-map locations."""
+def create_interactive_map(reachability=None):
+    """Create a Folium map with markers for all subway-map locations.
+
+    `reachability` (optional) is a frame with stop_lat, stop_lon, weight
+    (0-1) and label per reachable station, drawn as a heatmap layer.
+    """
     VG_CENTER = [46.5650, 11.7100]
 
     # Geographic coordinates for all stops on the subway map (verified)
@@ -1320,14 +1629,59 @@ def create_interactive_map():
             tooltip=name,
         ).add_to(m)
 
+    # Reachability heatmap
+    if reachability is not None and not reachability.empty:
+        layer = folium.FeatureGroup(name="Reachability")
+        HeatMap(
+            reachability[['stop_lat', 'stop_lon', 'weight']].values.tolist(),
+            min_opacity=0.3, radius=30, blur=20,
+        ).add_to(layer)
+        for row in reachability.itertuples():
+            folium.CircleMarker(
+                location=[row.stop_lat, row.stop_lon],
+                radius=3,
+                color='#333',
+                fill=True,
+                tooltip=row.label,
+            ).add_to(layer)
+        layer.add_to(m)
+        folium.LayerControl(collapsed=True).add_to(m)
+
     return m
 
 
+def reachability_layer(stations, isochrones, origin, minutes):
+    """Heatmap points for `create_interactive_map` from main_station_isochrones.
+
+    For one origin the weight falls with travel time; for all main stations
+    (`origin` None) it is the share of main stations reaching the station.
+    """
+    if origin is not None:
+        iso = isochrones[isochrones['origin'] == origin]
+        points = iso.assign(weight=(1 - iso['minutes'] / (minutes + 1)).clip(lower=0.1))
+        points['label'] = points['station'] + ': ' + points['minutes'].astype(str) + ' min'
+    else:
+        n_origins = max(1, isochrones['origin'].nunique())
+        points = isochrones.groupby('station')['origin'].nunique().reset_index(name='reached_from')
+        points['weight'] = points['reached_from'] / n_origins
+        points['label'] = (points['station'] + ': from ' + points['reached_from'].astype(str)
+                           + f' of {n_origins} main stations')
+    coords = stations[['stop_name', 'stop_lat', 'stop_lon']].rename(columns={'stop_name': 'station'})
+    return points.merge(coords, on='station')[['station', 'stop_lat', 'stop_lon', 'weight', 'label']]
+
+
 # -- Main --------------------------------------------------------------------
 def main():
-    # Auto-refresh GTFS data if stale (>24h) or missing; then load (cached)
+    # Time each stage of the rerun (lap() charges the time since the previous lap)
+    lap = stage_timings().start_run()
+
+    # Refresh GTFS data in the background if stale (>24h); load the current snapshot (cached)
     _ensure_fresh_gtfs()
-    stations, vg_routes, vg_trips, vg_stop_times, vg_trip_destinations, calendar_df, calendar_dates_df = load_data()
+    lap("refresh check")
+    version = snapshot_version()
+    touch_cache(version)
+    stations, vg_routes, vg_trips, _, vg_trip_destinations, _, _ = load_data(version)
+    lap("load data")
 
     st.title("\U0001f68d Val Gardena Bus Schedules")
     st.markdown("*Bus stops and schedules for Val Gardena, Bolzano, Ponte Gardena & Bressanone*")
@@ -1350,28 +1704,53 @@ def main():
         )
 
     # Tabs
-    tab1, tab2, tab3 = st.tabs(["\U0001f5fa\ufe0f Valley Map", "\U0001f4c5 Schedules", "\U0001f68c Routes"])
+    tab1, tab2, tab3, tab4 = st.tabs(
+        ["\U0001f5fa\ufe0f Valley Map", "\U0001f4c5 Schedules", "\U0001f68c Routes", "\U0001f17f\ufe0f Parking now"]
+    )
+
+    lap("layout")
 
     # -- TAB 1: Schematic Map ------------------------------------------------
     with tab1:
-        svg = create_schematic_svg(stations)
+        svg = render_schematic_svg(version)
         components.html(svg, height=220)
+        lap("schematic svg")
 
         # 2D geographic route network map
         st.markdown("### Bus Route Network from Ortisei")
-        route_paths = load_route_network()
-        network_svg = create_route_network_svg(route_paths)
+        network_svg = render_route_network_svg(version)
         components.html(network_svg, height=530)
+        lap("route network svg")
 
         # Geographic stop locations map
         st.markdown("### Geographic Stop Locations")
-        geo_svg = create_geographic_network_svg()
+        geo_svg = render_geographic_network_svg()
         components.html(geo_svg, height=630)
+        lap("geographic svg")
 
-        # Interactive geographic map
+        # Interactive geographic map, optionally with where the buses get you from the main stations
         st.markdown("### Interactive Map")
-        geo_map = create_interactive_map()
+        col_from, col_within, col_at = st.columns([2, 1, 1])
+        with col_from:
+            reach_from = st.selectbox(
+                "Reachable from", ["Off", "All main stations"] + main_stations['stop_name'].tolist(),
+                key="reach_from",
+            )
+        with col_within:
+            reach_minutes = st.select_slider("Within (min)", options=[15, 30, 45, 60, 90, 120], value=30)
+        with col_at:
+            reach_at = st.time_input("Leaving at", value=time(8, 0), key="reach_at")
+        reachability = None
+        if reach_from != "Off":
+            isochrones = main_station_isochrones(
+                version, date.today(), reach_at.hour * 3600 + reach_at.minute * 60, reach_minutes
+            )
+            origin = None if reach_from == "All main stations" else reach_from
+            reachability = reachability_layer(stations, isochrones, origin, reach_minutes)
+            lap("isochrones")
+        geo_map = create_interactive_map(reachability)
         st_folium(geo_map, width=960, height=400, returned_objects=[])
+        lap("interactive map")
 
         # Village bus network PDF maps
         st.markdown("### Village Bus Network Maps")
@@ -1388,6 +1767,17 @@ def main():
     with tab2:
         st.header("Departure Board")
 
+        # Timetable of the snapshot covering the selected date (usually the current one).
+        # The stations to pick from come from the same snapshot, so the date is read
+        # from the date picker's state before the pickers are drawn.
+        target_date = st.session_state.get("sched_date", date.today())
+        schedule_version = version_for_date(target_date)
+        touch_cache(schedule_version)
+        sched_stations = load_data(schedule_version)[0]
+        sched_main_stations = sched_stations[sched_stations['is_main']]
+        if schedule_version != version:
+            st.caption(f"Using timetable snapshot {schedule_version} for {target_date.strftime('%d.%m.%Y')}")
+
         # Row 1: Village selector + Station picker
         col1, col2 = st.columns([1, 3])
 
@@ -1413,9 +1803,9 @@ def main():
 
             is_external = village in EXTERNAL_LOCATIONS
             if show_all_sched and not is_external:
-                village_stations = stations[stations['location'] == village]
+                village_stations = sched_stations[sched_stations['location'] == village]
             else:
-                village_stations = main_stations[main_stations['location'] == village]
+                village_stations = sched_main_stations[sched_main_stations['location'] == village]
 
             main_order = {name: i for i, name in enumerate(MAIN_STOP_NAMES)}
             village_stations = village_stations.copy()
@@ -1433,107 +1823,108 @@ def main():
                 )
 
             # Destination filter (by stop)
-            origin_village = stations[stations['stop_name'] == station_name].iloc[0]['location'] if station_name else None
+            origin_village = (
+                sched_stations[sched_stations['stop_name'] == station_name].iloc[0]['location'] if station_name else None
+            )
             dest_stop_options = ["All destinations"]
-            dest_stop_ids_map = {}  # stop_name -> list of stop_ids
             for loc in ["St. Ulrich", "St. Christina", "Wolkenstein", "Bolzano", "Ponte Gardena", "Bressanone"]:
                 if loc == origin_village:
                     continue
                 loc_is_ext = loc in EXTERNAL_LOCATIONS
                 if show_all_sched and not loc_is_ext:
-                    loc_stations = stations[stations['location'] == loc]
+                    loc_stations = sched_stations[sched_stations['location'] == loc]
                 else:
-                    loc_stations = main_stations[main_stations['location'] == loc]
-                for _, row in loc_stations.sort_values('departures', ascending=False).iterrows():
-                    dest_stop_options.append(row['stop_name'])
-                    dest_stop_ids_map[row['stop_name']] = row['stop_ids']
+                    loc_stations = sched_main_stations[sched_main_stations['location'] == loc]
+                dest_stop_options += loc_stations.sort_values('departures', ascending=False)['stop_name'].tolist()
             dest_stop_name = st.selectbox("To", options=dest_stop_options)
             dest_selected = dest_stop_name != "All destinations"
+            plan_trip = st.toggle(
+                "Plan a trip (with changes)", value=False, key="plan_trip", disabled=not dest_selected,
+            )
 
         # Row 2: Date and time pickers
         col3, col4 = st.columns(2)
 
         with col3:
-            target_date = st.date_input("Date", value=date.today())
+            target_date = st.date_input("Date", value=date.today(), key="sched_date")
 
         with col4:
             time_filter = st.time_input("Departures after", value=time(8, 0))
 
-        time_str = time_filter.strftime("%H:%M:00")
+        after_secs = time_filter.hour * 3600 + time_filter.minute * 60
+        lap("schedule widgets")
 
-        # Filter to services active on the selected date
-        active_services = get_active_service_ids(calendar_df, calendar_dates_df, target_date)
-        active_trip_ids = set(vg_trips[vg_trips['service_id'].isin(active_services)]['trip_id'])
-        active_stop_times = vg_stop_times[vg_stop_times['trip_id'].isin(active_trip_ids)]
+        # Trips running on the selected date (one column of the service-day bitmap)
+        trip_mask = load_service_calendar(schedule_version).trip_mask(target_date)
+        lap("service calendar")
 
         # Show schematic with selected stop highlighted
         if station_name:
-            sched_svg = create_schematic_svg(stations, selected_stop=station_name)
+            sched_svg = render_schematic_svg(schedule_version, selected_stop=station_name)
             components.html(sched_svg, height=220)
+            lap("schematic svg")
 
         # Build schedule
-        if station_name is not None and dest_selected:
-            # --- Destination-filtered schedule (origin stop -> destination stop) ---
-            # Origin: use selected station's stop_ids (expanded for external)
-            origin_stop_ids = stations[stations['stop_name'] == station_name].iloc[0]['stop_ids']
+        if station_name is not None and dest_selected and plan_trip:
+            # --- Journey planner: earliest arrivals, changing buses where needed ---
+            origin_names = [station_name]
             if origin_village in EXTERNAL_LOCATIONS:
-                origin_stop_ids = sum(
-                    stations[stations['location'] == origin_village]['stop_ids'].tolist(), []
-                )
-
-            # Destination: use selected destination stop's stop_ids
-            dest_stop_ids = dest_stop_ids_map.get(dest_stop_name, [])
+                origin_names = sched_stations[sched_stations['location'] == origin_village]['stop_name'].tolist()
+            journeys = load_journey_planner(schedule_version).plan(
+                origin_names, [dest_stop_name], target_date, after_secs
+            )
+            lap("journey planner")
+
+            if journeys:
+                st.success(f"**{len(journeys)}** journeys from **{station_name}** to **{dest_stop_name}**")
+                for journey in journeys:
+                    legs = journey['legs']
+                    minutes = (journey['arrival_secs'] - legs['departure_secs'].iloc[0]) // 60
+                    changes = journey['transfers']
+                    st.markdown(
+                        f"**{format_time(legs['departure_secs'].iloc[0])} \u2192 "
+                        f"{format_time(journey['arrival_secs'])}** \u00b7 {minutes} min \u00b7 "
+                        f"{'direct' if changes == 0 else f'{changes} change' + ('s' if changes > 1 else '')}"
+                    )
+                    tbl = pd.DataFrame({
+                        'Route': legs['route_short_name'],
+                        'Destination': legs['destination'],
+                        'From': legs['from'],
+                        'Departs': legs['departure_secs'].apply(format_time),
+                        'To': legs['to'],
+                        'Arrives': legs['arrival_secs'].apply(format_time),
+                    })
+                    tbl.index = range(1, len(tbl) + 1)
+                    st.table(tbl)
+                lap("table render")
+            else:
+                st.warning(f"No journey found from {station_name} to {dest_stop_name} after the selected time")
 
-            # Get origin and dest stop_times
-            origin_st = active_stop_times[active_stop_times['stop_id'].isin(origin_stop_ids)][
-                ['trip_id', 'stop_id', 'stop_sequence', 'departure_time']
-            ]
-            dest_st = active_stop_times[active_stop_times['stop_id'].isin(dest_stop_ids)][
-                ['trip_id', 'stop_sequence', 'arrival_time']
-            ]
+        elif station_name is not None and dest_selected:
+            # --- Destination-filtered schedule (origin stop -> destination stop) ---
+            # Origin: selected station (all stations of the village for external locations)
+            origin_names = [station_name]
+            if origin_village in EXTERNAL_LOCATIONS:
+                origin_names = sched_stations[sched_stations['location'] == origin_village]['stop_name'].tolist()
 
-            # Find valid trips: origin before destination
-            merged = origin_st.merge(dest_st, on='trip_id', suffixes=('_orig', '_dest'))
-            valid = merged[merged['stop_sequence_dest'] > merged['stop_sequence_orig']]
+            # Trips from origin to destination on the selected date, first origin/dest visit per trip
+            valid = load_od_index(schedule_version).connections(origin_names, [dest_stop_name], target_date)
+            lap("od connections")
 
             if not valid.empty:
-                # For each trip: take the first origin stop and first dest stop in sequence
-                valid = valid.sort_values(['trip_id', 'stop_sequence_orig', 'stop_sequence_dest'])
-                per_trip = valid.drop_duplicates('trip_id', keep='first')
-
-                # Apply time filter
-                if time_str:
-                    per_trip = per_trip[per_trip['departure_time'] >= time_str]
-
-                # Add route info
-                per_trip = per_trip.merge(
-                    vg_trips[['trip_id', 'route_id']], on='trip_id'
-                ).merge(
-                    vg_routes[['route_id', 'route_short_name']], on='route_id'
-                ).merge(
-                    vg_trip_destinations[['trip_id', 'destination']], on='trip_id', how='left'
-                )
-
-                per_trip = per_trip.sort_values('departure_time')
+                # Apply time filter (rows are sorted by departure time)
+                per_trip = valid[valid['departure_secs'] >= after_secs]
 
                 # Deduplicate: same route within 2 min = same bus
-                keep = []
-                prev_route, prev_min = None, -999
-                for idx in per_trip.index:
-                    route = per_trip.loc[idx, 'route_short_name']
-                    parts = per_trip.loc[idx, 'departure_time'].split(':')
-                    mins = int(parts[0]) * 60 + int(parts[1])
-                    if route != prev_route or (mins - prev_min) >= 2:
-                        keep.append(idx)
-                        prev_route, prev_min = route, mins
-                per_trip = per_trip.loc[keep]
+                per_trip = per_trip[proximity_dedup(per_trip['route_short_name'], per_trip['departure_secs'] // 60)]
 
                 schedule = per_trip
+                lap("od dedup")
 
                 if not schedule.empty:
                     st.success(f"**{len(schedule)}** departures from **{station_name}** to **{dest_stop_name}**")
 
-                    display = schedule[['departure_time', 'route_short_name', 'destination', 'arrival_time']].copy()
+                    display = schedule[['departure_secs', 'route_short_name', 'destination', 'arrival_secs']].copy()
                     display.columns = ['Time', 'Route', 'Destination', 'Arrival']
                     display.insert(0, 'Station', station_name)
                     display['Time'] = display['Time'].apply(format_time)
@@ -1542,6 +1933,7 @@ def main():
                     tbl = display.head(50)
                     tbl.index = range(1, len(tbl) + 1)
                     st.table(tbl)
+                    lap("table render")
 
                     if len(schedule) > 50:
                         st.info(f"Showing first 50 of {len(schedule)} departures")
@@ -1552,24 +1944,22 @@ def main():
 
         elif station_name is not None:
             # --- No destination filter: show all departures from selected stop ---
-            station_row = stations[stations['stop_name'] == station_name].iloc[0]
-            # For external locations, expand to all stops in that village
+            station_row = sched_stations[sched_stations['stop_name'] == station_name].iloc[0]
+            # For external locations, expand to all stations in that village
             origin_loc = station_row['location']
+            station_names = [station_name]
             if origin_loc in EXTERNAL_LOCATIONS:
-                all_village_ids = sum(
-                    stations[stations['location'] == origin_loc]['stop_ids'].tolist(), []
-                )
-                station_row = station_row.copy()
-                station_row['stop_ids'] = all_village_ids
+                station_names = sched_stations[sched_stations['location'] == origin_loc]['stop_name'].tolist()
+            departure_index = load_departure_index(schedule_version)
             schedule = get_station_schedule(
-                station_row, active_stop_times, vg_trips, vg_routes,
-                vg_trip_destinations, after_time=time_str
+                departure_index, station_names, trip_mask,
+                after_secs=after_secs
             )
 
             # Filter out buses whose destination is in the same village as origin
             if not schedule.empty:
                 origin_stop_names = set(
-                    stations[stations['location'] == origin_loc]['stop_name']
+                    sched_stations[sched_stations['location'] == origin_loc]['stop_name']
                 )
                 schedule = schedule[~schedule['destination'].isin(origin_stop_names)]
                 # Also catch headsign variants (e.g. "Bolzano Autostazione")
@@ -1577,11 +1967,16 @@ def main():
                     ~schedule['destination'].str.startswith(origin_loc + ' ', na=False)
                     | (origin_loc == '')
                 ]
+            lap("station schedule")
 
             if not schedule.empty:
                 st.success(f"**{len(schedule)}** departures from **{station_name}**")
+                if station_row['walks']:
+                    st.caption("Within walking distance: " + ", ".join(
+                        f"{name} ({max(1, round(secs / 60))} min)" for name, secs in station_row['walks'].items()
+                    ))
 
-                display = schedule[['departure_time', 'route_short_name', 'destination']].copy()
+                display = schedule[['departure_secs', 'route_short_name', 'destination']].copy()
                 display.columns = ['Time', 'Route', 'Destination']
                 display.insert(0, 'Station', station_name)
                 display['Time'] = display['Time'].apply(format_time)
@@ -1589,6 +1984,7 @@ def main():
                 tbl = display.head(50)
                 tbl.index = range(1, len(tbl) + 1)
                 st.table(tbl)
+                lap("table render")
 
                 if len(schedule) > 50:
                     st.info(f"Showing first 50 of {len(schedule)} departures")
@@ -1623,9 +2019,60 @@ def main():
         route_summary.columns = ['Route', 'Destinations', 'Daily Trips']
         route_summary = route_summary.sort_values('Route')
         route_summary.index = range(1, len(route_summary) + 1)
+        lap("routes summary")
 
         st.markdown(f"**{len(route_summary)}** unique routes serve the Val Gardena area")
         st.table(route_summary)
+        lap("table render")
+
+    # -- TAB 4: Parking now --------------------------------------------------
+    with tab4:
+        st.header("Parking Now")
+
+        # Only rows appended since the last poll are read
+        parking_index = load_parking_index()
+        parking_index.poll()
+        parking = parking_index.snapshot(PARKING_VILLAGES)
+
+        if parking.empty:
+            st.info("No parking data yet. Run `python scraper_dolomites.py` to collect it.")
+        else:
+            cols = st.columns(len(PARKING_VILLAGES))
+            for col, (location, label) in zip(cols, PARKING_VILLAGES.items()):
+                village_parking = parking[parking['location'] == location]
+                free = village_parking['available'].dropna()
+                trend = village_parking['trend'].dropna()
+                col.metric(
+                    label, f"{int(free.sum())} free" if not free.empty else "n/a",
+                    delta=f"{int(trend.sum()):+d} in 1h" if not trend.empty else None,
+                )
+
+            for location, label in PARKING_VILLAGES.items():
+                village_parking = parking[parking['location'] == location].sort_values('name')
+                if village_parking.empty:
+                    continue
+                st.markdown(f"### {label}")
+                st.dataframe(
+                    pd.DataFrame({
+                        'Station': village_parking['name'],
+                        'Free': village_parking['available'],
+                        'Capacity': village_parking['capacity'],
+                        'Trend (1h)': village_parking['trend'],
+                        'Last 3h': village_parking['history'],
+                        'Updated': village_parking['timestamp'].dt.strftime('%d.%m. %H:%M'),
+                    }),
+                    hide_index=True,
+                    column_config={
+                        'Free': st.column_config.NumberColumn(format="%d"),
+                        'Capacity': st.column_config.NumberColumn(format="%d"),
+                        'Trend (1h)': st.column_config.NumberColumn(format="%+d"),
+                        'Last 3h': st.column_config.LineChartColumn(y_min=0),
+                    },
+                )
+
+            latest = parking['timestamp'].max()
+            st.caption(f"Latest reading: {latest.strftime('%d.%m.%Y %H:%M')} (collected every 5 minutes)")
+        lap("parking")
 
     # Footer
     st.sidebar.markdown("---")
@@ -1634,20 +2081,37 @@ def main():
         "Data: Open Data Hub GTFS - STA"
     )
 
-    stops_file = DATA_DIR / "transport_stop_times.csv"
-    if stops_file.exists():
-        age_hours = (_time.time() - stops_file.stat().st_mtime) / 3600
+    manifest_file = manifest_path()
+    if manifest_file is not None:
+        age_hours = (_time.time() - manifest_file.stat().st_mtime) / 3600
         if age_hours < 1:
             age_text = "just refreshed"
         elif age_hours < 24:
             age_text = f"updated {int(age_hours)}h ago"
         else:
             age_text = f"updated {int(age_hours / 24)}d ago"
-        file_time = datetime.fromtimestamp(os.path.getmtime(stops_file))
+        file_time = datetime.fromtimestamp(os.path.getmtime(manifest_file))
         st.sidebar.caption(
             f"Schedule data: {age_text}\n\n"
             f"({file_time.strftime('%Y-%m-%d %H:%M')})"
         )
+        diff = read_diff()
+        if diff is not None and diff.get("base_version"):
+            st.sidebar.caption(f"Last refresh: {diff_summary(diff)}")
+
+    usage = _cache_usage()["versions"]
+    st.sidebar.caption(
+        f"Cache: {cache_nbytes() / 1024 / 1024:.0f} of {CACHE_BUDGET_MB} MB, "
+        f"{len(usage)} snapshot(s), {sum(len(v) for e in list(usage.values()) for v in e['views'])} date views"
+    )
+    lap("sidebar")
+    lap.finish(version=version)
+
+    # Debug panel: open the app with ?debug=1
+    if st.query_params.get("debug") == "1":
+        st.sidebar.markdown("---")
+        st.sidebar.markdown(f"**Stage timings** (last {stage_timings().window} reruns)")
+        st.sidebar.dataframe(stage_timings().summary(), hide_index=True)
 
 
 if __name__ == "__main__":